@@ -1,55 +1,71 @@
-
 import os
-import json
+import uuid
 import streamlit as st
 
 from langchain_core.messages import HumanMessage, AIMessage
-from src.agent.graph import create_agent_executor
-from src.document.loader import DocumentLoader
-from src.document.processor import DocumentProcessor
-from src.embedding.vectordb import VectorDatabase
+from src.agent.graph import load_thread_messages
+from src.agent.memory import is_summary
+from src.agent.resources import get_resources
+from src.api.telemetry import metrics
+from src.document.jobs import ACTIVE_STATUSES
+from src.document.manifest import hash_bytes
+
+from config import QDRANT_COLLECTION_NAME, init, logger
 
-from config import logger, PROCESSED_FILE_PATH
+# Status shown once a graph node has finished, until the first token arrives
+NODE_STATUS = {
+    "classify_query": "Looking that up...",
+    "get_weather": "Writing the answer...",
+    "query_document": "Writing the answer..."
+}
 
-def load_processed_files():
+
+@st.fragment(run_every=2)
+def show_ingestion_jobs():
     """
-    Load the list of processed files and ensure they still exist in the data/ folder.
-    Clean up any entries for missing files.
+    Poll the ingestion queue and render progress for this session's jobs
     """
-    processed = []
-    if os.path.exists(PROCESSED_FILE_PATH):
-        with open(PROCESSED_FILE_PATH, "r") as f:
-            try:
-                processed = json.load(f)
-            except json.JSONDecodeError:
-                logger.warning("Processed file tracking JSON was empty or malformed. Resetting.")
-                processed = []
-
-    logger.debug("Filter to include only files that still exist in the `data/` directory")
-    processed = [file for file in processed if os.path.exists(os.path.join("data", file))]
-
-    logger.debug("Rewrite the JSON to reflect accurate file existence")
-    with open(PROCESSED_FILE_PATH, "w") as f:
-        json.dump(processed, f)
-
-    return processed
-
-def save_processed_file(filename):
-    processed = load_processed_files()
-    if filename not in processed:
-        processed.append(filename)
-        with open(PROCESSED_FILE_PATH, "w") as f:
-            json.dump(processed, f)
+    job_ids = st.session_state.get("ingestion_jobs", [])
+    if not job_ids:
+        return
+
+    ingestion_jobs = get_resources().ingestion_jobs
+    finished = []
+    for job_id in job_ids:
+        job = ingestion_jobs.get(job_id)
+        if job is None:
+            finished.append(job_id)
+            continue
+
+        if job["status"] in ACTIVE_STATUSES:
+            progress = job["pages_parsed"] / job["total_pages"] if job["total_pages"] else 0.0
+            st.progress(
+                progress,
+                text=f"{job['filename']}: {job['pages_parsed']}/{job['total_pages']} pages, "
+                     f"{job['points_upserted']} chunks stored"
+            )
+        else:
+            finished.append(job_id)
+            if job["status"] == "failed":
+                st.toast(f"Processing {job['filename']} failed: {job['error']}")
+            elif job["status"] == "skipped":
+                st.toast(f"Skipped {job['filename']}: {job['error']}")
+            else:
+                st.toast(f"File {job['filename']} uploaded and processed successfully!")
+
+    if finished:
+        st.session_state.ingestion_jobs = [job_id for job_id in job_ids if job_id not in finished]
+        logger.debug("Rerunning the app to refresh the list")
+        st.rerun()
 
-def initialize_app():
-    logger.debug("Initialize document loader")
-    doc_loader = DocumentLoader()
 
+def initialize_app():
     if not os.path.exists("data"):
         os.makedirs("data")
     
     logger.debug("Loading processed files")
-    processed_files = load_processed_files()
+    manifest = get_resources().file_manifest
+    processed_files = manifest.list_files(QDRANT_COLLECTION_NAME)
     logger.debug("Loaded processed files")
 
     logger.debug("Listing available documents")
@@ -69,53 +85,99 @@ def initialize_app():
         file_path = os.path.join("data", uploaded_file.name)
         logger.debug("Built file path")
 
-        if uploaded_file.name in processed_files:
+        ingestion_jobs = get_resources().ingestion_jobs
+        active_files = [job["filename"] for job in ingestion_jobs.list_jobs(statuses=ACTIVE_STATUSES)]
+
+        logger.debug("Hashing uploaded file")
+        file_hash = hash_bytes(uploaded_file.getbuffer())
+        duplicate = manifest.find_by_hash(file_hash, QDRANT_COLLECTION_NAME)
 
-            logger.debug(f"{uploaded_file.name} already processed")
+        # The uploader keeps the file across reruns, so only submit it once per
+        # content; a failed job is resubmitted only when retried explicitly
+        job_id = st.session_state.get("submitted_uploads", {}).get(file_hash)
+        job = ingestion_jobs.get(job_id) if job_id else None
+
+        if duplicate == uploaded_file.name:
+
+            logger.debug("{} already processed", uploaded_file.name)
             st.sidebar.info(f"File {uploaded_file.name} already processed.")
 
+        elif duplicate is not None:
+
+            logger.debug("{} has the same content as {}", uploaded_file.name, duplicate)
+            st.sidebar.info(f"File {uploaded_file.name} has the same content as {duplicate}, which is already processed.")
+
+        elif job is not None and job["status"] == "failed":
+
+            logger.debug("{} failed to process", uploaded_file.name)
+            st.sidebar.error(f"Processing {uploaded_file.name} failed: {job['error']}")
+            if st.sidebar.button("Retry", key=f"retry-{file_hash}"):
+                submit_upload(uploaded_file, file_path, file_hash)
+
+        elif job is not None or uploaded_file.name in active_files:
+
+            logger.debug("{} already submitted", uploaded_file.name)
+
         else:
-            
-            logger.debug("Sving uploaded file")
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            logger.debug(f"Saved file: {uploaded_file.name}")
-
-            logger.debug("Loading uploading pdf file")
-            documents = doc_loader.load_pdf(uploaded_file.name)
-            logger.debug("Loaded uploading pdf file")
-
-            logger.debug("Processing uploaded pdf file")
-            processor = DocumentProcessor()
-            chunks = processor.split_documents(documents)
-            logger.debug("Processed uploaded pdf file")
-
-            logger.debug(f"Storing {len(chunks)} chunks in vector DB")
-            vector_db = VectorDatabase()
-            vector_db.store_documents(chunks)
-            logger.debug("Stored chunks in vecot DB")
-
-            logger.debug("Saving processed file metadata")
-            save_processed_file(uploaded_file.name)
-            logger.debug("Saved processed file metadata")
-
-            st.sidebar.success(f"File {uploaded_file.name} uploaded and processed successfully!")
-            logger.debug("Rerunning the app to refresh the list")
-            st.rerun()
+
+            submit_upload(uploaded_file, file_path, file_hash)
+
+    with st.sidebar:
+        show_ingestion_jobs()
+        show_latency()
+
+
+def submit_upload(uploaded_file, file_path, file_hash):
+    """
+    Save an uploaded file and queue it for ingestion, remembering the job
+    for its content in this session
+    """
+    logger.debug("Saving uploaded file")
+    with open(file_path, "wb") as f:
+        f.write(uploaded_file.getbuffer())
+    logger.debug("Saved file: {}", uploaded_file.name)
+
+    logger.debug("Submitting ingestion job")
+    job_id = get_resources().ingestion_jobs.submit(file_path, uploaded_file.name, QDRANT_COLLECTION_NAME)
+    st.session_state.setdefault("submitted_uploads", {})[file_hash] = job_id
+    st.session_state.setdefault("ingestion_jobs", []).append(job_id)
+    logger.debug("Submitted ingestion job {}", job_id)
+
+
+def show_latency():
+    """
+    Render p50/p95/p99 latency per request, graph node and upstream call
+    """
+    histograms = metrics.snapshot()["histograms"]
+    rows = [
+        {"stage": name.removesuffix(".seconds"), "count": summary["count"], "p50": summary["p50"], "p95": summary["p95"], "p99": summary["p99"]}
+        for name, summary in histograms.items() if name.endswith(".seconds")
+    ]
+    if not rows:
+        return
+
+    with st.expander("Latency (seconds)"):
+        st.dataframe(rows, hide_index=True)
+
 
 def main():
     """
     Main function to run the Streamlit app
     """
+    init()
     st.title("Weather & Document Q&A Agent")
     
     logger.debug("Initializing the app")
     initialize_app()
     
     logger.debug("Initializing session state")
+    if "thread_id" not in st.session_state:
+        # Kept in the URL so a reload, or another worker, picks the conversation up from its checkpoints
+        st.session_state.thread_id = st.query_params.get("thread") or uuid.uuid4().hex
+        st.query_params["thread"] = st.session_state.thread_id
     if "messages" not in st.session_state:
-        st.session_state.messages = [
-            AIMessage(content="Hello! I'm your Weather & Document assistant. You can ask me about weather in a specific city or ask questions about documents you've uploaded.")
+        st.session_state.messages = load_thread_messages(st.session_state.thread_id) or [
+            AIMessage(content="Hello! I'm your Weather & Document assistant. You can ask me about the weather in one or more cities or ask questions about documents you've uploaded.")
         ]
     logger.debug("Initialised session state")
     
@@ -123,6 +185,9 @@ def main():
     for message in st.session_state.messages:
         if isinstance(message, HumanMessage):
             st.chat_message("user").write(message.content)
+        elif is_summary(message):
+            with st.expander("Earlier conversation (summarized)"):
+                st.caption(message.content)
         else:
             st.chat_message("assistant").write(message.content)
     logger.debug("Displayed chat messages")
@@ -139,20 +204,34 @@ def main():
         st.chat_message("user").write(message.content)
         logger.debug("Added user message to state")
         
-        logger.debug("Creating agent executor")
-        agent_executor = create_agent_executor()
-        logger.debug("Created agent executor")
-        
-        logger.debug("Executing agent")
-        with st.spinner("Thinking..."):
-            result = agent_executor(st.session_state.messages)
-        logger.debug("Executed agent")
-        
-        logger.debug("Displaying assistant response")
-        ai_message: AIMessage = result["messages"][-1]
-        st.session_state.messages.append(ai_message)
-        st.chat_message("assistant").write(ai_message.content)
-        logger.debug("Displayed assistant response")
+        logger.debug("Getting shared streaming agent executor")
+        streaming_agent_executor = get_resources().streaming_agent_executor
+        logger.debug("Got shared streaming agent executor")
+
+        logger.debug("Streaming agent response")
+        with st.chat_message("assistant"):
+            status = st.empty()
+            status.caption("Thinking...")
+            final = {}
+
+            def tokens():
+                for event in streaming_agent_executor(st.session_state.messages, thread_id=st.session_state.thread_id):
+                    if event["type"] == "node":
+                        status.caption(NODE_STATUS.get(event["node"], "Thinking..."))
+                    elif event["type"] == "token":
+                        status.empty()
+                        yield event["content"]
+                    elif event["type"] == "final":
+                        final["state"] = event["state"]
+
+            st.write_stream(tokens())
+            status.empty()
+        logger.debug("Streamed agent response")
+
+        logger.debug("Replacing session history with the compacted history")
+        st.session_state.messages = list(final["state"]["messages"])
+        logger.debug("Replaced session history with the compacted history")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+Throughput, latency and memory of the agent graph against offline stand-ins.
+
+    python -m benchmarks.agent_throughput --queries 500 --concurrency 8 --chat-latency 0.05
+    python -m benchmarks.agent_throughput --save-baseline benchmarks/baselines/agent_throughput.json
+    python -m benchmarks.agent_throughput --baseline benchmarks/baselines/agent_throughput.json
+
+The compiled graph from create_agent_graph runs through the registry's
+executors over a replayable query corpus. OpenAI chat and embeddings and
+OpenWeatherMap are replaced by deterministic stand-ins with a fixed latency;
+retrieval runs against the in-process vector backend. Per-node and
+per-upstream timings come from the telemetry spans. With --baseline, every
+reported figure is compared against a stored run, and the exit status is 1
+if any got worse by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.stand_ins import (
+    FakeAsyncWeatherClient,
+    FakeChatModel,
+    FakeEmbeddings,
+    FakeWeatherSession,
+    build_corpus,
+    build_documents
+)
+from config import QDRANT_COLLECTION_NAME, TELEMETRY_ENABLED, init
+from src.agent.resources import ResourceRegistry
+from src.api.telemetry import metrics
+from src.api.weather import WeatherAPI
+from src.document.store import create_local_engine
+from src.embedding.lexical import LexicalIndex
+from src.embedding.local_index import LocalVectorBackend
+from src.embedding.vectordb import VectorDatabase
+from src.llm.chain import LLMChain
+
+
+# Figures where a higher value is better; for everything else lower is better
+HIGHER_IS_BETTER = {"qps"}
+
+
+def build_registry(directory, corpus, args):
+    """
+    A resource registry whose upstreams are all stand-ins, with every file
+    kept under ``directory``
+    """
+    resources = ResourceRegistry()
+    chat = FakeChatModel(classifications={entry["query"]: entry for entry in corpus}, latency=args.chat_latency)
+    embeddings = FakeEmbeddings(latency=args.embedding_latency)
+
+    session = FakeWeatherSession(latency=args.weather_latency)
+    weather_api = WeatherAPI()
+    weather_api.api_key = "benchmark"
+    weather_api.session = session
+    async_client = FakeAsyncWeatherClient(session)
+    weather_api._get_async_client = lambda: async_client
+
+    backend = LocalVectorBackend(directory=os.path.join(directory, "vectors"))
+    vector_db = VectorDatabase(
+        backend=backend,
+        embeddings=embeddings,
+        lexical_index=LexicalIndex(directory=os.path.join(directory, "lexical"))
+    )
+
+    resources.set("local_db", create_local_engine(f"sqlite:///{os.path.join(directory, 'benchmark.db')}"))
+    resources.set("classifier_llm", chat)
+    resources.set("embeddings", embeddings)
+    resources.set("vector_backend", backend)
+    resources.set("vector_db", vector_db)
+    resources.set("weather_api", weather_api)
+    resources.set("llm_chain", LLMChain(llm=chat))
+
+    documents = build_documents(seed=args.seed)
+    texts = [text for text, _ in documents]
+    vector_db.create_collection_if_not_exists(QDRANT_COLLECTION_NAME)
+    vector_db.upsert_embeddings(texts, [metadata for _, metadata in documents], embeddings.embed_documents(texts))
+    return resources
+
+def run_sync(resources, corpus, concurrency, checkpoint):
+    executor = resources.agent_executor
+
+    def answer(entry):
+        started = time.perf_counter()
+        executor([HumanMessage(content=entry["query"])], thread_id=uuid.uuid4().hex if checkpoint else None)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(answer, corpus))
+
+def run_async(resources, corpus, concurrency, checkpoint):
+    executor = resources.async_agent_executor
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(entry):
+            async with semaphore:
+                started = time.perf_counter()
+                await executor([HumanMessage(content=entry["query"])], thread_id=uuid.uuid4().hex if checkpoint else None)
+                return time.perf_counter() - started
+
+        return await asyncio.gather(*(answer(entry) for entry in corpus))
+
+    return asyncio.run(run())
+
+def measure(resources, corpus, args):
+    """
+    Run the corpus once and return the figures to report, in milliseconds
+    and megabytes
+    """
+    run = run_async if args.mode == "async" else run_sync
+    run(resources, corpus[:args.warmup], args.concurrency, args.checkpoint)
+    metrics.reset()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    latencies = run(resources, corpus[args.warmup:], args.concurrency, args.checkpoint)
+    elapsed = time.perf_counter() - started
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    results = {
+        "qps": len(latencies) / elapsed,
+        "latency.p50_ms": p50,
+        "latency.p95_ms": p95,
+        "latency.p99_ms": p99,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        "memory.max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+    }
+    if traced_peak is not None:
+        results["memory.traced_peak_mb"] = traced_peak / 1024 ** 2
+
+    snapshot = metrics.snapshot()
+    for name, summary in snapshot["histograms"].items():
+        if name.startswith(("node.", "upstream.", "memory.")) and name.endswith(".seconds"):
+            stage = name.removesuffix(".seconds")
+            results[f"{stage}.p50_ms"] = summary["p50"] * 1000
+            results[f"{stage}.p95_ms"] = summary["p95"] * 1000
+    for name, value in snapshot["counters"].items():
+        results[f"count.{name}"] = value
+    return results
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """
+    Print every figure next to the baseline, returning the names of those
+    that regressed by more than ``tolerance``. Timings that moved by less
+    than ``min_delta_ms`` are treated as noise.
+    """
+    regressions = []
+    for name, value in results.items():
+        if name.startswith("count."):
+            continue
+        if name not in baseline:
+            print(f"{name:42s} {'':10s}    {value:10.2f}  (new)")
+            continue
+        previous = baseline[name]
+        change = (value - previous) / previous if previous else 0.0
+        worse = -change if name in HIGHER_IS_BETTER else change
+        if name.endswith("_ms") and abs(value - previous) < min_delta_ms:
+            worse = 0.0
+        flag = "REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:42s} {previous:10.2f} -> {value:10.2f}  {change:+7.1%}  {flag}")
+    return regressions
+
+def report(results):
+    for name, value in results.items():
+        print(f"{name:42s} {value:10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="seconds per chat completion")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="seconds per embedding request")
+    parser.add_argument("--weather-latency", type=float, default=0.03, help="seconds per OpenWeatherMap request")
+    parser.add_argument("--checkpoint", action="store_true", help="run every query on its own checkpointed thread")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (slows the run)")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="smallest timing change counted as a regression")
+    parser.add_argument("--save-baseline", help="write this run to a JSON file")
+    args = parser.parse_args()
+    init()
+
+    if not TELEMETRY_ENABLED:
+        print("TELEMETRY_ENABLED is false: per-node and per-upstream timings are not available")
+
+    corpus = build_corpus(args.queries + args.warmup, seed=args.seed)
+    parameters = {
+        name: getattr(args, name)
+        for name in ("queries", "warmup", "concurrency", "mode", "seed", "chat_latency", "embedding_latency", "weather_latency", "checkpoint")
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        resources = build_registry(directory, corpus, args)
+        try:
+            results = measure(resources, corpus, args)
+        finally:
+            resources.shutdown()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline["parameters"] != parameters:
+            print(f"Baseline was recorded with different parameters: {baseline['parameters']}")
+        regressions = compare(results, baseline["results"], args.tolerance, args.min_delta_ms)
+    else:
+        report(results)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or ".", exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump({"parameters": parameters, "python": platform.python_version(), "results": results}, f, indent=2)
+
+    if regressions:
+        print(f"{len(regressions)} figures regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
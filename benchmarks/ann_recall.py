@@ -0,0 +1,83 @@
+"""
+Recall and latency of the IVF index against exact search.
+
+    python -m benchmarks.ann_recall --rows 200000 --dim 384 --nprobe 1,4,8,16
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from config import init
+from src.embedding.ann import IVFIndex
+from src.embedding.local_index import FlatIndex
+
+
+def clustered_vectors(rows, dim, clusters, rng):
+    """
+    Synthetic embeddings: points scattered around random cluster centres,
+    closer to real text embeddings than uniform noise
+    """
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return centres[labels] + 0.5 * rng.normal(size=(rows, dim)).astype(np.float32)
+
+def build(index, vectors, batch_size=10000):
+    ids = [str(i) for i in range(len(vectors))]
+    for start in range(0, len(vectors), batch_size):
+        stop = start + batch_size
+        index.upsert(ids[start:stop], vectors[start:stop], [{}] * (stop - start))
+    return index
+
+def measure(index, queries, k):
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        results.append([hit.id for hit in index.search(query, k)])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, np.percentile(latencies, [50, 95, 99])
+
+def recall(results, expected):
+    return np.mean([len(set(found) & set(truth)) / len(truth) for found, truth in zip(results, expected)])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="0 picks 4 * sqrt(rows)")
+    parser.add_argument("--nprobe", default="1,4,8,16,32")
+    parser.add_argument("--quantization", choices=("none", "int8"), default="none")
+    args = parser.parse_args()
+    init()
+
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(args.rows, args.dim, max(1, args.rows // 500), rng)
+    queries = vectors[rng.choice(args.rows, args.queries, replace=False)] + 0.1 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as flat_dir, tempfile.TemporaryDirectory() as ivf_dir:
+        started = time.perf_counter()
+        flat = build(FlatIndex(flat_dir, quantization=args.quantization), vectors)
+        print(f"flat  build {time.perf_counter() - started:7.2f}s")
+
+        started = time.perf_counter()
+        ivf = build(IVFIndex(ivf_dir, quantization=args.quantization, nlist=args.nlist, min_train_size=1), vectors)
+        print(f"ivf   build {time.perf_counter() - started:7.2f}s  ({len(ivf._centroids)} lists)")
+
+        expected, percentiles = measure(flat, queries, args.k)
+        print(f"flat  recall@{args.k} 1.000  p50 {percentiles[0]:6.2f}ms  p95 {percentiles[1]:6.2f}ms  p99 {percentiles[2]:6.2f}ms")
+
+        for nprobe in (int(value) for value in args.nprobe.split(",")):
+            ivf.nprobe = nprobe
+            results, percentiles = measure(ivf, queries, args.k)
+            print(
+                f"ivf   recall@{args.k} {recall(results, expected):.3f}  p50 {percentiles[0]:6.2f}ms  "
+                f"p95 {percentiles[1]:6.2f}ms  p99 {percentiles[2]:6.2f}ms  nprobe={nprobe}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Cold import time of the application's entry modules.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --modules src.agent.graph app --repeat 10 --top 15
+
+Each module is imported in a fresh interpreter with ``-X importtime``,
+``--repeat`` times, and the median of the total is reported together with
+the slowest of the module's direct imports in the median run (cumulative,
+i.e. including everything they import in turn).
+"""
+import argparse
+import subprocess
+import sys
+
+
+DEFAULT_MODULES = ["config", "src.api.weather", "src.agent.nodes", "src.agent.graph", "app"]
+
+
+def import_times(module):
+    """
+    Import ``module`` in a fresh interpreter and return its cumulative import
+    time and that of each of its direct imports, in seconds, keyed by name
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    # A module's line follows those of its imports, nested two spaces deeper
+    # per level; interpreter start-up (site) comes first at the top level
+    children = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        seconds = int(cumulative) / 1e6
+        if depth == 1:
+            children[name.strip()] = seconds
+        elif depth == 0:
+            if name.strip() == module:
+                return {**children, module: seconds}
+            children = {}
+    raise RuntimeError(f"No import time recorded for {module}")
+
+def measure(module, repeat):
+    """
+    The median run's total and its per-module times
+    """
+    runs = sorted((import_times(module) for _ in range(repeat)), key=lambda times: times[module])
+    return runs[len(runs) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list per module")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        times = measure(module, args.repeat)
+        total = times.pop(module)
+        print(f"{module:42s} {total * 1000:10.1f} ms  (median of {args.repeat})")
+        for name in sorted(times, key=times.get, reverse=True)[:args.top]:
+            print(f"    {name:38s} {times[name] * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
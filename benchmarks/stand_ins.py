@@ -0,0 +1,242 @@
+"""
+Deterministic, offline stand-ins for the agent's upstreams (OpenAI chat and
+embeddings, OpenWeatherMap) and a replayable query corpus, so benchmarks
+measure our own code plus a fixed, configurable upstream latency.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+import zlib
+
+from typing import Any, Dict, List
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.agent.classifier import load_gazetteer
+from src.api.telemetry import increment, span
+
+
+TOPICS = [
+    "flood risk", "solar capacity", "water usage", "heat waves", "crop yields", "air quality",
+    "coastal erosion", "wind farms", "drought planning", "urban trees", "storm drains", "energy prices"
+]
+
+WEATHER_TEMPLATES = [
+    "What's the weather like in {city} today?",
+    "Is it raining in {city}?",
+    "Is it warmer in {city} or {other}?",
+    "Should I pack a jacket for my trip to {city}?"
+]
+DOCUMENT_TEMPLATES = [
+    "What does the report say about {topic}?",
+    "Summarize the key findings on {topic}",
+    "How much is planned for {topic} next year?"
+]
+UNKNOWN_QUERIES = [
+    "Tell me something interesting",
+    "Hello there",
+    "Who won the match yesterday?"
+]
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def build_corpus(size, seed=0, mix=(0.5, 0.4, 0.1)):
+    """
+    A replayable mix of weather, document and unknown queries, each with the
+    classification an LLM would give it. The same seed gives the same corpus.
+    """
+    rng = random.Random(seed)
+    cities = sorted(load_gazetteer().values())
+    corpus = []
+    for _ in range(size):
+        kind = rng.choices(("weather", "document", "unknown"), weights=mix)[0]
+        if kind == "weather":
+            city, other = rng.sample(cities, 2)
+            template = rng.choice(WEATHER_TEMPLATES)
+            corpus.append({
+                "query": template.format(city=city, other=other),
+                "type": "weather",
+                "cities": [city, other] if "{other}" in template else [city]
+            })
+        elif kind == "document":
+            query = rng.choice(DOCUMENT_TEMPLATES).format(topic=rng.choice(TOPICS))
+            corpus.append({"query": query, "type": "document", "cities": []})
+        else:
+            corpus.append({"query": rng.choice(UNKNOWN_QUERIES), "type": "unknown", "cities": []})
+    return corpus
+
+def build_documents(seed=0, passages_per_topic=8):
+    """
+    Synthetic report passages, several per topic, as (text, metadata) pairs
+    """
+    rng = random.Random(seed)
+    filler = "the council expects costs to change as demand grows across every district".split()
+    documents = []
+    for topic in TOPICS:
+        for number in range(passages_per_topic):
+            words = " ".join(rng.choice(filler) for _ in range(60))
+            text = f"Section {number + 1} of the report on {topic}. The findings on {topic} show that {words}."
+            documents.append((text, {"source": f"{topic.replace(' ', '_')}.pdf", "page": number}))
+    return documents
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Bag-of-words hashing embeddings: texts sharing words get similar vectors.
+    Each call waits ``latency`` seconds, like one request to the API, and is
+    timed under the same span name as the real client.
+    """
+
+    def __init__(self, dim=256, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in WORD_PATTERN.findall(text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("upstream.openai_embeddings", texts=len(texts)):
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("upstream.openai_embeddings", texts=len(texts)):
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering the agent's prompts from the corpus: classifier
+    prompts get the corpus classification, summary prompts a short summary,
+    everything else a canned answer. Each call waits ``latency`` seconds and
+    is recorded like a real OpenAI call, with estimated token counts.
+    """
+
+    classifications: Dict[str, Any] = {}
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "benchmark-fake"
+
+    def _classify(self, query):
+        entry = self.classifications.get(query.strip(), {"type": "unknown", "cities": []})
+        return {"type": entry["type"], "cities": entry["cities"]}
+
+    def _respond(self, prompt):
+        if "each of the following queries" in prompt:
+            queries = re.findall(r"^\s*\d+\. (.*)$", prompt, re.MULTILINE)
+            return json.dumps([self._classify(query) for query in queries])
+        if "Query:" in prompt and "weather or information from a document" in prompt:
+            return json.dumps(self._classify(re.search(r"Query: (.*)", prompt).group(1)))
+        if "summarize the following conversation" in prompt:
+            return "The user asked about the weather and the reports."
+        return f"Here is the answer, based on {len(prompt)} characters of context."
+
+    def _result(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        content = self._respond(prompt)
+        usage = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4
+        }
+        increment("openai.input_tokens", usage["input_tokens"])
+        increment("openai.output_tokens", usage["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with span("upstream.openai"):
+            time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        with span("upstream.openai"):
+            await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+
+def fake_weather(city_name):
+    """
+    A stable OpenWeatherMap-shaped payload for a city
+    """
+    seed = zlib.crc32(city_name.casefold().encode("utf-8"))
+    return {
+        "id": seed % 10_000_000,
+        "name": city_name.title(),
+        "sys": {"country": "XX"},
+        "main": {"temp": seed % 35, "feels_like": seed % 33, "humidity": seed % 100},
+        "wind": {"speed": (seed % 120) / 10},
+        "weather": [{"description": ("clear sky", "light rain", "overcast clouds")[seed % 3]}]
+    }
+
+
+class FakeResponse:
+
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return self._data
+
+
+class FakeWeatherSession:
+    """
+    Stands in for the requests session and the httpx client of WeatherAPI,
+    serving single-city and group lookups after ``latency`` seconds
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._names = {}
+        self.calls = 0
+
+    def _payload(self, params):
+        self.calls += 1
+        if "id" in params:
+            return {"list": [fake_weather(self._names[int(city_id)]) for city_id in params["id"].split(",")]}
+        data = fake_weather(params["q"])
+        self._names[data["id"]] = params["q"]
+        return data
+
+    def get(self, url, params=None, timeout=None):
+        time.sleep(self.latency)
+        return FakeResponse(self._payload(params))
+
+    def close(self):
+        return None
+
+
+class FakeAsyncWeatherClient:
+
+    def __init__(self, session):
+        self.session = session
+
+    async def get(self, url, params=None, timeout=None):
+        await asyncio.sleep(self.session.latency)
+        return FakeResponse(self.session._payload(params))
+
+    async def aclose(self):
+        return None
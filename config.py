@@ -1,35 +1,184 @@
+import json
 import os
+import random
 import sys
+import traceback
+import zlib
 
 from dotenv import load_dotenv
 from loguru import logger
 
-logger.add(sys.stderr, colorize=True, format="<green>{time:MMMM-D-YYYY}</green> | <black>{time:HH:mm:ss}</black> | <level>{level}</level> | <cyan>{message}</cyan> | <magenta>{name}:{function}:{line}</magenta> | <yellow>{extra}</yellow>")
-
-logger.info("Loading Environment Variables")
+# Loading .env is cheap and the OpenAI and LangSmith clients read some of
+# these variables from os.environ themselves, so it stays at import time
 load_dotenv()
 
-logger.info("Loading API Configuration")
+# API Configuration
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 LANGCHAIN_API_KEY = os.getenv("LANGCHAIN_API_KEY")
-logger.info("Loaded API Configuration")
 
-logger.info("Loading LLM Configuration")
+# LLM Configuration
 LLM_MODEL = os.getenv("LLM_MODEL")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
-logger.info("Loaded LLM Configuration")
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50000))
+FAST_CLASSIFIER_ENABLED = os.getenv("FAST_CLASSIFIER_ENABLED", "true").lower() == "true"
+FAST_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("FAST_CLASSIFIER_MIN_CONFIDENCE", 0.9))
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1200))
+CONTEXT_RANK_WEIGHT = float(os.getenv("CONTEXT_RANK_WEIGHT", 0.5))
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", 20))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "true").lower() == "true"
+MEMORY_WINDOW_TURNS = int(os.getenv("MEMORY_WINDOW_TURNS", 6))
+MEMORY_SUMMARIZE_AFTER = int(os.getenv("MEMORY_SUMMARIZE_AFTER", 4))
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", 2000))
+MEMORY_SUMMARY_CACHE_SIZE = int(os.getenv("MEMORY_SUMMARY_CACHE_SIZE", 256))
+
+# Weather API Configuration
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", 300))
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", 1024))
+WEATHER_HTTP_POOL_SIZE = int(os.getenv("WEATHER_HTTP_POOL_SIZE", 20))
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", 5))
+WEATHER_STALE_TTL = int(os.getenv("WEATHER_STALE_TTL", 3600))
+WEATHER_MAX_CITIES = int(os.getenv("WEATHER_MAX_CITIES", 5))
 
-logger.info("Loading Vector Database Configuration")
+# Vector Database Configuration
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "document_embeddings")
-logger.info("Loaded Vector Database Configuration")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant").lower()
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", ".cache/vectors")
+LOCAL_VECTOR_QUANTIZATION = os.getenv("LOCAL_VECTOR_QUANTIZATION", "none").lower()
+LOCAL_VECTOR_BLOCK_ROWS = int(os.getenv("LOCAL_VECTOR_BLOCK_ROWS", 65536))
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "flat").lower()
+IVF_NLIST = int(os.getenv("IVF_NLIST", 0))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 8))
+IVF_MIN_TRAIN_SIZE = int(os.getenv("IVF_MIN_TRAIN_SIZE", 10000))
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", 2.0))
+IVF_COMPACT_RATIO = float(os.getenv("IVF_COMPACT_RATIO", 0.2))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 512))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", 3600))
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", 5))
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", 20))
+HYBRID_RETRIEVAL_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", ".cache/lexical")
+RRF_K = int(os.getenv("RRF_K", 60))
+LEXICAL_CONFIDENCE_RATIO = float(os.getenv("LEXICAL_CONFIDENCE_RATIO", 2.0))
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", 1.0))
+
+# Upstream Resilience Configuration
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 30))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 20))
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", 5))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", 2))
+UPSTREAM_BACKOFF_INITIAL = float(os.getenv("UPSTREAM_BACKOFF_INITIAL", 0.2))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", 2.0))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", 30))
+
+# Telemetry Configuration
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true"
+TELEMETRY_EXPORT_PATH = os.getenv("TELEMETRY_EXPORT_PATH", "")
+TELEMETRY_SAMPLE_SIZE = int(os.getenv("TELEMETRY_SAMPLE_SIZE", 2048))
+
+# Logging Configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_ENQUEUE = os.getenv("LOG_ENQUEUE", "true").lower() == "true"
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0))
 
-logger.info("Loading Application Configuration")
+# Server Configuration
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8080))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 1))
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", 32))
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", 64))
+SERVER_QUEUE_TIMEOUT = float(os.getenv("SERVER_QUEUE_TIMEOUT", 10))
+SERVER_SHUTDOWN_TIMEOUT = float(os.getenv("SERVER_SHUTDOWN_TIMEOUT", 30))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 100 * 1024 ** 2))
+UPLOAD_DIRECTORY = os.getenv("UPLOAD_DIRECTORY", "data")
+
+# Application Configuration
 PDF_DIRECTORY = os.getenv("PDF_DIRECTORY")
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 PROCESSED_FILE_PATH = "processed_files.json"
-logger.info("Loaded Application Configuration")
+LOCAL_DB_URL = os.getenv("LOCAL_DB_URL", "sqlite:///weatheragent.db")
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", 2))
+INGEST_JOB_POLL_INTERVAL = float(os.getenv("INGEST_JOB_POLL_INTERVAL", 1.0))
+INGEST_JOB_STALE_AFTER = float(os.getenv("INGEST_JOB_STALE_AFTER", 300))
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", 25))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", 4))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+INGEST_MAX_PENDING_BATCHES = int(os.getenv("INGEST_MAX_PENDING_BATCHES", 8))
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT_ENABLED", "true").lower() == "true"
+CHECKPOINT_KEEP_PER_THREAD = int(os.getenv("CHECKPOINT_KEEP_PER_THREAD", 10))
+CHECKPOINT_MAX_AGE = float(os.getenv("CHECKPOINT_MAX_AGE", 7 * 24 * 3600))
+
+
+_initialized = False
+
+DEBUG_LEVEL_NO = logger.level("DEBUG").no
+TEXT_LOG_FORMAT = "<green>{time:MMMM-D-YYYY}</green> | <black>{time:HH:mm:ss}</black> | <level>{level}</level> | <cyan>{message}</cyan> | <magenta>{name}:{function}:{line}</magenta> | <yellow>{extra}</yellow>"
+
+
+def _json_log_format(record):
+    """
+    One JSON object per line, with the bound extras (e.g. request_id) as
+    top-level fields
+    """
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "source": f"{record['name']}:{record['function']}:{record['line']}",
+        **record["extra"]
+    }
+    if record["exception"] is not None:
+        entry["exception"] = "".join(traceback.format_exception(*record["exception"]))
+    record["extra"]["json"] = json.dumps(entry, default=str)
+    return "{extra[json]}\n"
+
+
+def _sample_debug(record):
+    """
+    Keep every record above DEBUG and LOG_DEBUG_SAMPLE_RATE of the debug
+    ones. Sampling is by request, so a sampled request keeps its whole trail.
+    """
+    if record["level"].no > DEBUG_LEVEL_NO:
+        return True
+    request_id = record["extra"].get("request_id")
+    if request_id is None:
+        return random.random() < LOG_DEBUG_SAMPLE_RATE
+    return zlib.crc32(request_id.encode("utf-8")) % 10000 < LOG_DEBUG_SAMPLE_RATE * 10000
+
+
+def init():
+    """
+    Process start-up side effects, kept out of import so that importing a
+    module does not configure logging: replace loguru's default sink with
+    one at LOG_LEVEL, as text or JSON lines, written from a background thread
+    when LOG_ENQUEUE is set. Entry points call this once; later calls do
+    nothing.
+    """
+    global _initialized
+
+    if _initialized:
+        return
+    _initialized = True
+
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        level=LOG_LEVEL,
+        format=_json_log_format if LOG_FORMAT == "json" else TEXT_LOG_FORMAT,
+        colorize=LOG_FORMAT != "json",
+        enqueue=LOG_ENQUEUE,
+        filter=_sample_debug if LOG_DEBUG_SAMPLE_RATE < 1 else None
+    )
 
-logger.info("Loaded Environment Variables")
\ No newline at end of file
+    logger.info("Loaded Configuration")
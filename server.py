@@ -0,0 +1,364 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.agent.graph import load_thread_messages
+from src.agent.resources import ResourceRegistry, get_resources
+from src.api.telemetry import increment, metrics, observe
+from src.document.jobs import ACTIVE_STATUSES
+from src.document.manifest import hash_file
+
+from config import (
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKERS,
+    SERVER_MAX_CONCURRENCY,
+    SERVER_QUEUE_SIZE,
+    SERVER_QUEUE_TIMEOUT,
+    SERVER_SHUTDOWN_TIMEOUT,
+    MAX_UPLOAD_BYTES,
+    UPLOAD_DIRECTORY,
+    VECTOR_BACKEND,
+    HYBRID_RETRIEVAL_ENABLED,
+    SEMANTIC_CACHE_ENABLED,
+    QDRANT_COLLECTION_NAME,
+    init,
+    logger
+)
+
+# Resources created before the first request is admitted
+WARM_RESOURCES = ("fast_classifier", "classifier_llm", "llm_chain", "weather_api", "vector_db", "async_agent_executor", "async_streaming_agent_executor")
+
+ROLES = {"user": HumanMessage, "assistant": AIMessage}
+
+
+def json_error(error_class, message, **kwargs):
+    return error_class(text=json.dumps({"error": message}), content_type="application/json", **kwargs)
+
+
+class AdmissionControl:
+    """
+    Bounds the agent runs in flight at ``max_concurrency``, with up to
+    ``queue_size`` more requests waiting up to ``queue_timeout`` seconds for
+    a slot. Anything beyond that is turned away with 429 straight away, so
+    an overloaded worker sheds load instead of building an unbounded backlog.
+    Once ``draining`` (on shutdown) every new request gets 503.
+    """
+
+    def __init__(self, max_concurrency=SERVER_MAX_CONCURRENCY, queue_size=SERVER_QUEUE_SIZE, queue_timeout=SERVER_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.draining = False
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    def _reject(self, reason):
+        increment("server.rejected")
+        logger.warning("Rejected a request: {}", reason)
+        return json_error(web.HTTPTooManyRequests, reason, headers={"Retry-After": "1"})
+
+    def check_accepting(self):
+        if self.draining:
+            raise json_error(web.HTTPServiceUnavailable, "server is shutting down")
+
+    @asynccontextmanager
+    async def admit(self):
+        if self.in_flight >= self.max_concurrency and self.waiting >= self.queue_size:
+            raise self._reject("server is at capacity")
+
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject("timed out waiting for capacity")
+        finally:
+            self.waiting -= 1
+        observe("server.queue.seconds", time.perf_counter() - started)
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+
+RESOURCES = web.AppKey("resources", ResourceRegistry)
+ADMISSION = web.AppKey("admission", AdmissionControl)
+
+
+async def _read_conversation(request):
+    """
+    Validate a chat request body and return the conversation to run and its
+    thread ID. On a thread, the history is loaded from its checkpoints unless
+    the client sends it.
+    """
+    try:
+        body = await request.json()
+        message = body["message"]
+        thread_id = body.get("thread_id")
+        history = [ROLES[entry["role"]](content=entry["content"]) for entry in body.get("history", [])]
+    except (ValueError, KeyError, TypeError) as err:
+        raise json_error(web.HTTPBadRequest, f"expected a JSON body with a message and optionally a thread_id and history: {err!r}")
+    if not isinstance(message, str) or not message.strip():
+        raise json_error(web.HTTPBadRequest, "message must be a non-empty string")
+
+    if thread_id and not history:
+        history = await asyncio.to_thread(load_thread_messages, thread_id, request.app[RESOURCES])
+    return history + [HumanMessage(content=message)], thread_id
+
+def _answer(state, thread_id):
+    return {
+        "response": state["response"],
+        "query_type": state["query_type"],
+        "cities": state.get("cities", []),
+        "thread_id": thread_id
+    }
+
+async def chat(request):
+    """
+    Answer one message: {"message", "thread_id"?, "history"?} -> {"response", "query_type", "cities", "thread_id"}
+    """
+    request.app[ADMISSION].check_accepting()
+    messages, thread_id = await _read_conversation(request)
+
+    async with request.app[ADMISSION].admit():
+        executor = request.app[RESOURCES].async_agent_executor
+        state = await executor(messages, thread_id=thread_id)
+
+    return web.json_response(_answer(state, thread_id))
+
+async def chat_stream(request):
+    """
+    Answer one message as newline-delimited JSON events: node and token events
+    as they happen, then a final event with the same fields as /chat
+    """
+    request.app[ADMISSION].check_accepting()
+    messages, thread_id = await _read_conversation(request)
+
+    async with request.app[ADMISSION].admit():
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+
+        events = request.app[RESOURCES].async_streaming_agent_executor(messages, thread_id=thread_id)
+        try:
+            async for event in events:
+                if event["type"] == "final":
+                    event = {"type": "final", **_answer(event["state"], thread_id)}
+                await response.write(json.dumps(event).encode("utf-8") + b"\n")
+        except Exception as err:
+            # The status line is already sent, so the failure goes in the stream
+            logger.error(f"{err.__class__} Exception occured while streaming an answer. {err}")
+            try:
+                await response.write(json.dumps({"type": "error", "error": err.__class__.__name__}).encode("utf-8") + b"\n")
+            except ConnectionResetError:
+                # The client is gone (aiohttp's ClientConnectionResetError is a
+                # ConnectionResetError), so there is nobody left to tell
+                return response
+        finally:
+            await events.aclose()
+
+        await response.write_eof()
+    return response
+
+async def _receive_upload(request):
+    """
+    Stream the PDF in the multipart field "file" to a temporary file in the
+    upload directory, chunk by chunk, returning its name and path
+    """
+    reader = await request.multipart()
+    while True:
+        field = await reader.next()
+        if field is None or field.name == "file":
+            break
+    if field is None or not field.filename or not field.filename.lower().endswith(".pdf"):
+        raise json_error(web.HTTPBadRequest, "expected a PDF in the multipart field 'file'")
+
+    await asyncio.to_thread(os.makedirs, UPLOAD_DIRECTORY, exist_ok=True)
+    temp_path = os.path.join(UPLOAD_DIRECTORY, f".{uuid.uuid4().hex}.upload")
+    f = await asyncio.to_thread(open, temp_path, "wb")
+    size = 0
+    try:
+        while chunk := await field.read_chunk():
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise json_error(web.HTTPRequestEntityTooLarge, f"uploads are limited to {MAX_UPLOAD_BYTES} bytes", max_size=MAX_UPLOAD_BYTES, actual_size=size)
+            await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.remove, temp_path)
+        raise
+    await asyncio.to_thread(f.close)
+    return os.path.basename(field.filename), temp_path
+
+async def ingest(request):
+    """
+    Queue an uploaded PDF (multipart field "file") for ingestion, returning
+    202 with the job ID, or 200 if the same content is already indexed
+    """
+    request.app[ADMISSION].check_accepting()
+    resources = request.app[RESOURCES]
+
+    filename, temp_path = await _receive_upload(request)
+    ingestion_jobs = resources.ingestion_jobs
+
+    def submit():
+        duplicate = resources.file_manifest.find_by_hash(hash_file(temp_path), QDRANT_COLLECTION_NAME)
+        if duplicate is not None:
+            os.remove(temp_path)
+            logger.debug("{} has the same content as {}", filename, duplicate)
+            return {"status": "duplicate", "filename": filename, "duplicate_of": duplicate}, 200
+
+        for job in ingestion_jobs.list_jobs(statuses=ACTIVE_STATUSES):
+            if job["filename"] == filename:
+                os.remove(temp_path)
+                return {"status": job["status"], "job_id": job["id"]}, 202
+
+        file_path = os.path.join(UPLOAD_DIRECTORY, filename)
+        os.replace(temp_path, file_path)
+        job_id = ingestion_jobs.submit(file_path, filename, QDRANT_COLLECTION_NAME)
+        logger.debug("Submitted ingestion job {}", job_id)
+        return {"status": "queued", "job_id": job_id}, 202
+
+    body, status = await asyncio.to_thread(submit)
+    return web.json_response(body, status=status)
+
+async def ingest_status(request):
+    job = await asyncio.to_thread(request.app[RESOURCES].ingestion_jobs.get, request.match_info["job_id"])
+    if job is None:
+        raise json_error(web.HTTPNotFound, "unknown job")
+    return web.json_response(job)
+
+async def health(request):
+    """
+    200 while accepting requests, 503 once draining, so a load balancer
+    stops routing to a worker that is shutting down
+    """
+    admission = request.app[ADMISSION]
+    body = {
+        "status": "draining" if admission.draining else "ok",
+        "in_flight": admission.in_flight,
+        "waiting": admission.waiting
+    }
+    return web.json_response(body, status=503 if admission.draining else 200)
+
+async def prometheus_metrics(request):
+    return web.Response(text=metrics.prometheus_text(), content_type="text/plain")
+
+async def _warm_up(app):
+    try:
+        await asyncio.to_thread(app[RESOURCES].startup, WARM_RESOURCES)
+    except Exception as err:
+        # Resources are still created on first use; a request then reports the failure
+        logger.error(f"{err.__class__} Exception occured while warming up resources. {err}")
+
+async def _drain(app):
+    logger.info("Draining: {} requests in flight", app[ADMISSION].in_flight)
+    app[ADMISSION].draining = True
+
+async def _release_resources(app):
+    await app[RESOURCES].ashutdown()
+
+def create_app(resources=None, admission=None, warm_up=True):
+    """
+    Create the HTTP application around the registry's async executors.
+
+    On shutdown new requests get 503 and /health reports draining while
+    in-flight requests finish (up to SERVER_SHUTDOWN_TIMEOUT when run with
+    ``serve``); the shared resources are released last.
+    """
+    # Uploads are streamed to disk and capped at MAX_UPLOAD_BYTES as they
+    # arrive; this bounds any body read into memory whole
+    app = web.Application(client_max_size=MAX_UPLOAD_BYTES)
+    app[RESOURCES] = resources or get_resources()
+    app[ADMISSION] = admission or AdmissionControl()
+
+    app.add_routes([
+        web.post("/chat", chat),
+        web.post("/chat/stream", chat_stream),
+        web.post("/ingest", ingest),
+        web.get("/ingest/{job_id}", ingest_status),
+        web.get("/health", health),
+        web.get("/metrics", prometheus_metrics)
+    ])
+
+    if warm_up:
+        app.on_startup.append(_warm_up)
+    app.on_shutdown.append(_drain)
+    app.on_cleanup.append(_release_resources)
+    return app
+
+def serve(reuse_port=False):
+    """
+    Run one worker process until SIGINT or SIGTERM
+    """
+    logger.info("Serving on {}:{} (pid {})", SERVER_HOST, SERVER_PORT, os.getpid())
+    web.run_app(
+        create_app(),
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        reuse_port=reuse_port,
+        shutdown_timeout=SERVER_SHUTDOWN_TIMEOUT,
+        print=None
+    )
+
+def process_local_state():
+    """
+    Settings under which a worker keeps retrieval state in its own memory
+    that ingestion in another worker would not update
+    """
+    reasons = []
+    if VECTOR_BACKEND == "local":
+        reasons.append("VECTOR_BACKEND=local (in-process vector index)")
+    if HYBRID_RETRIEVAL_ENABLED:
+        reasons.append("HYBRID_RETRIEVAL_ENABLED (in-process BM25 index)")
+    if SEMANTIC_CACHE_ENABLED:
+        reasons.append("SEMANTIC_CACHE_ENABLED (cleared only in the process that ingests)")
+    return reasons
+
+def main():
+    """
+    Serve the agent over HTTP with SERVER_WORKERS processes sharing the port
+    """
+    init()
+    if SERVER_WORKERS <= 1:
+        serve()
+        return
+
+    reasons = process_local_state()
+    if reasons:
+        # Each worker would keep its own copy, saved over the others' files
+        raise SystemExit(f"SERVER_WORKERS={SERVER_WORKERS} needs retrieval state shared across processes; run one worker or turn off: {', '.join(reasons)}")
+
+    # Each worker has its own event loop and resources; the kernel spreads
+    # connections across them (SO_REUSEPORT)
+    workers = [multiprocessing.Process(target=serve, kwargs={"reuse_port": True}) for _ in range(SERVER_WORKERS)]
+    for worker in workers:
+        worker.start()
+
+    def stop(signum, frame):
+        logger.info("Stopping {} workers", len(workers))
+        for worker in workers:
+            worker.terminate()
+
+    # Ctrl+C already reaches every worker through the process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stop)
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
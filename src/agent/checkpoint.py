@@ -0,0 +1,335 @@
+import asyncio
+import time
+
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata
+)
+from langgraph.checkpoint.serde.types import TASKS
+from sqlalchemy import Column, Float, Integer, LargeBinary, String, Table, delete, func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert
+
+from src.document.store import create_local_engine, metadata
+
+from config import CHECKPOINT_KEEP_PER_THREAD, CHECKPOINT_MAX_AGE, logger
+
+
+graph_checkpoints = Table(
+    "graph_checkpoints",
+    metadata,
+    Column("thread_id", String, primary_key=True),
+    Column("checkpoint_ns", String, primary_key=True),
+    Column("checkpoint_id", String, primary_key=True),
+    Column("parent_checkpoint_id", String),
+    Column("type", String, nullable=False),
+    Column("checkpoint", LargeBinary, nullable=False),
+    Column("metadata_type", String, nullable=False),
+    Column("metadata", LargeBinary, nullable=False),
+    Column("created_at", Float, nullable=False, index=True)
+)
+
+graph_writes = Table(
+    "graph_writes",
+    metadata,
+    Column("thread_id", String, primary_key=True),
+    Column("checkpoint_ns", String, primary_key=True),
+    Column("checkpoint_id", String, primary_key=True),
+    Column("task_id", String, primary_key=True),
+    Column("idx", Integer, primary_key=True),
+    Column("channel", String, nullable=False),
+    Column("type", String, nullable=False),
+    Column("value", LargeBinary, nullable=False),
+    Column("task_path", String, nullable=False, default="")
+)
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[int]):
+    """
+    LangGraph checkpointer persisting graph runs to the local SQLite store.
+
+    A checkpoint is written after every superstep and the writes of each
+    finished node as soon as it returns, so a run interrupted by a crash can
+    be resumed from the last completed node on any process sharing the
+    database. Each thread keeps its ``keep_per_thread`` newest checkpoints;
+    ``prune`` drops threads idle for longer than ``max_age`` seconds.
+    """
+
+    def __init__(self, engine=None, keep_per_thread=CHECKPOINT_KEEP_PER_THREAD, max_age=CHECKPOINT_MAX_AGE, serde=None):
+        super().__init__(serde=serde)
+        self.engine = engine or create_local_engine()
+        self.keep_per_thread = max(keep_per_thread, 2)
+        self.max_age = max_age
+        metadata.create_all(self.engine, tables=[graph_checkpoints, graph_writes])
+
+    @staticmethod
+    def _config(thread_id, checkpoint_ns, checkpoint_id):
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id
+            }
+        }
+
+    def _load_writes(self, connection, thread_id, checkpoint_ns, checkpoint_id, channel=None):
+        query = select(graph_writes).where(
+            graph_writes.c.thread_id == thread_id,
+            graph_writes.c.checkpoint_ns == checkpoint_ns,
+            graph_writes.c.checkpoint_id == checkpoint_id
+        ).order_by(graph_writes.c.task_path, graph_writes.c.task_id, graph_writes.c.idx)
+        if channel is not None:
+            query = query.where(graph_writes.c.channel == channel)
+        return connection.execute(query).mappings().all()
+
+    def _tuple(self, connection, row, metadata_=None):
+        checkpoint = self.serde.loads_typed((row["type"], row["checkpoint"]))
+        thread_id, checkpoint_ns = row["thread_id"], row["checkpoint_ns"]
+
+        sends = []
+        if row["parent_checkpoint_id"]:
+            sends = [
+                self.serde.loads_typed((write["type"], write["value"]))
+                for write in self._load_writes(connection, thread_id, checkpoint_ns, row["parent_checkpoint_id"], TASKS)
+            ]
+        writes = self._load_writes(connection, thread_id, checkpoint_ns, row["checkpoint_id"])
+
+        return CheckpointTuple(
+            config=self._config(thread_id, checkpoint_ns, row["checkpoint_id"]),
+            checkpoint={**checkpoint, "pending_sends": sends},
+            metadata=metadata_ if metadata_ is not None else self.serde.loads_typed((row["metadata_type"], row["metadata"])),
+            parent_config=(
+                self._config(thread_id, checkpoint_ns, row["parent_checkpoint_id"])
+                if row["parent_checkpoint_id"] else None
+            ),
+            pending_writes=[
+                (write["task_id"], write["channel"], self.serde.loads_typed((write["type"], write["value"])))
+                for write in writes
+            ]
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """
+        Return the requested checkpoint, or the thread's latest if none is named
+        """
+        configurable = config["configurable"]
+        query = select(graph_checkpoints).where(
+            graph_checkpoints.c.thread_id == configurable["thread_id"],
+            graph_checkpoints.c.checkpoint_ns == configurable.get("checkpoint_ns", "")
+        )
+        if checkpoint_id := get_checkpoint_id(config):
+            query = query.where(graph_checkpoints.c.checkpoint_id == checkpoint_id)
+        else:
+            query = query.order_by(graph_checkpoints.c.checkpoint_id.desc()).limit(1)
+
+        with self.engine.connect() as connection:
+            row = connection.execute(query).mappings().first()
+            return self._tuple(connection, row) if row is not None else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[CheckpointTuple]:
+        """
+        Yield matching checkpoints, newest first
+        """
+        query = select(graph_checkpoints).order_by(graph_checkpoints.c.checkpoint_id.desc())
+        if config:
+            configurable = config["configurable"]
+            query = query.where(graph_checkpoints.c.thread_id == configurable["thread_id"])
+            if configurable.get("checkpoint_ns") is not None:
+                query = query.where(graph_checkpoints.c.checkpoint_ns == configurable["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.where(graph_checkpoints.c.checkpoint_id == checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query = query.where(graph_checkpoints.c.checkpoint_id < before_id)
+
+        with self.engine.connect() as connection:
+            rows = connection.execute(query).mappings().all()
+            for row in rows:
+                if limit is not None and limit <= 0:
+                    break
+                metadata_ = self.serde.loads_typed((row["metadata_type"], row["metadata"]))
+                if filter and not all(metadata_.get(key) == value for key, value in filter.items()):
+                    continue
+                if limit is not None:
+                    limit -= 1
+                yield self._tuple(connection, row, metadata_)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        """
+        Store a checkpoint and prune the thread down to its newest checkpoints
+        """
+        configurable = config["configurable"]
+        thread_id, checkpoint_ns = configurable["thread_id"], configurable.get("checkpoint_ns", "")
+        checkpoint = {key: value for key, value in checkpoint.items() if key != "pending_sends"}
+        checkpoint_type, checkpoint_data = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self.engine.begin() as connection:
+            connection.execute(
+                insert(graph_checkpoints).values(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint["id"],
+                    parent_checkpoint_id=configurable.get("checkpoint_id"),
+                    type=checkpoint_type,
+                    checkpoint=checkpoint_data,
+                    metadata_type=metadata_type,
+                    metadata=metadata_data,
+                    created_at=time.time()
+                ).on_conflict_do_nothing()
+            )
+            self._prune_thread(connection, thread_id, checkpoint_ns)
+
+        return self._config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = ""
+    ) -> None:
+        """
+        Store the writes of a finished node against the checkpoint it ran from
+        """
+        configurable = config["configurable"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_data = self.serde.dumps_typed(value)
+            rows.append({
+                "thread_id": configurable["thread_id"],
+                "checkpoint_ns": configurable.get("checkpoint_ns", ""),
+                "checkpoint_id": configurable["checkpoint_id"],
+                "task_id": task_id,
+                "idx": WRITES_IDX_MAP.get(channel, idx),
+                "channel": channel,
+                "type": value_type,
+                "value": value_data,
+                "task_path": task_path
+            })
+        if not rows:
+            return
+
+        # Regular writes are kept once per task; special writes (errors, interrupts) are replaced
+        statement = insert(graph_writes)
+        with self.engine.begin() as connection:
+            regular = [row for row in rows if row["idx"] >= 0]
+            special = [row for row in rows if row["idx"] < 0]
+            if regular:
+                connection.execute(statement.on_conflict_do_nothing(), regular)
+            if special:
+                connection.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=[column.name for column in graph_writes.primary_key],
+                        set_={
+                            "channel": statement.excluded.channel,
+                            "type": statement.excluded.type,
+                            "value": statement.excluded.value,
+                            "task_path": statement.excluded.task_path
+                        }
+                    ),
+                    special
+                )
+
+    def _delete(self, connection, keys):
+        if not keys:
+            return
+        for table in (graph_writes, graph_checkpoints):
+            connection.execute(delete(table).where(
+                tuple_(table.c.thread_id, table.c.checkpoint_ns, table.c.checkpoint_id).in_(keys)
+            ))
+
+    def _prune_thread(self, connection, thread_id, checkpoint_ns):
+        stale = connection.execute(
+            select(graph_checkpoints.c.thread_id, graph_checkpoints.c.checkpoint_ns, graph_checkpoints.c.checkpoint_id)
+            .where(graph_checkpoints.c.thread_id == thread_id, graph_checkpoints.c.checkpoint_ns == checkpoint_ns)
+            .order_by(graph_checkpoints.c.checkpoint_id.desc())
+            .offset(self.keep_per_thread)
+        ).all()
+        self._delete(connection, [tuple(key) for key in stale])
+
+    def delete_thread(self, thread_id: str) -> None:
+        """
+        Delete every checkpoint and write of a thread
+        """
+        with self.engine.begin() as connection:
+            for table in (graph_writes, graph_checkpoints):
+                connection.execute(delete(table).where(table.c.thread_id == thread_id))
+
+    def prune(self, max_age=None):
+        """
+        Delete threads whose latest checkpoint is older than ``max_age`` seconds
+        and return how many were removed
+        """
+        cutoff = time.time() - (self.max_age if max_age is None else max_age)
+        with self.engine.begin() as connection:
+            idle = connection.execute(
+                select(graph_checkpoints.c.thread_id)
+                .group_by(graph_checkpoints.c.thread_id)
+                .having(func.max(graph_checkpoints.c.created_at) < cutoff)
+            ).scalars().all()
+            for table in (graph_writes, graph_checkpoints):
+                connection.execute(delete(table).where(table.c.thread_id.in_(idle)))
+
+        if idle:
+            logger.debug("Pruned checkpoints of {} idle threads", len(idle))
+        return len(idle)
+
+    # SQLite calls can wait on the database lock, so keep them off the event loop
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[CheckpointTuple]:
+        checkpoints = await asyncio.to_thread(
+            lambda: [*self.list(config, filter=filter, before=before, limit=limit)]
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = ""
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
@@ -0,0 +1,135 @@
+import os
+import re
+import threading
+
+from config import FAST_CLASSIFIER_MIN_CONFIDENCE, logger
+
+from src.api.telemetry import increment
+
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "cities.txt")
+
+WEATHER_PATTERN = re.compile(
+    r"\b(weather|temperature|temp|forecast|rain(?:ing|y)?|snow(?:ing|y)?|sunny|cloudy|"
+    r"humid(?:ity)?|wind(?:y)?|storm(?:y)?|degrees?|celsius|fahrenheit|umbrella|hot|cold|warm)\b",
+    re.IGNORECASE
+)
+DOCUMENT_PATTERN = re.compile(
+    r"\b(documents?|pdfs?|files?|reports?|manuals?|papers?|summari[sz]e|summary|uploaded|"
+    r"sections?|chapters?|pages?|according to|mention(?:s|ed)?|says?)\b",
+    re.IGNORECASE
+)
+LOCATION_PATTERN = re.compile(r"\b(?:in|at|for|of)\s+([A-Z][\w'.-]*(?:\s+[A-Z][\w'.-]*){0,3})")
+WORD_PATTERN = re.compile(r"[\w'.-]+")
+
+
+def load_gazetteer(path=GAZETTEER_PATH):
+    """
+    Load city names into a mapping of normalized name -> display name
+    """
+    gazetteer = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            name = line.strip()
+            if name and not name.startswith("#"):
+                gazetteer[name.casefold()] = name
+    return gazetteer
+
+
+class RuleBasedClassifier:
+    """
+    Deterministic keyword/gazetteer classifier that answers obvious queries
+    locally and defers everything else to the LLM classifier.
+    """
+
+    def __init__(self, gazetteer=None, min_confidence=FAST_CLASSIFIER_MIN_CONFIDENCE):
+        self.gazetteer = gazetteer if gazetteer is not None else load_gazetteer()
+        self.max_city_words = max((len(name.split()) for name in self.gazetteer), default=1)
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fallbacks = 0
+
+    def find_cities(self, query):
+        """
+        Return every gazetteer city mentioned in the query, in order of
+        mention, preferring the longest name at each position
+        """
+        words = [word.strip(".'-").casefold() for word in WORD_PATTERN.findall(query)]
+        cities = []
+        start = 0
+        while start < len(words):
+            for size in range(min(self.max_city_words, len(words) - start), 0, -1):
+                candidate = " ".join(words[start:start + size])
+                if candidate in self.gazetteer:
+                    cities.append(self.gazetteer[candidate])
+                    start += size
+                    break
+            else:
+                start += 1
+        return list(dict.fromkeys(cities))
+
+    @staticmethod
+    def _result(query_type, cities, confidence):
+        return {
+            "type": query_type,
+            "city": cities[0] if cities else "",
+            "cities": cities,
+            "confidence": confidence
+        }
+
+    def score(self, query):
+        """
+        Classify the query and return a dict with type, city, cities and confidence
+        """
+        has_weather = WEATHER_PATTERN.search(query) is not None
+        has_document = DOCUMENT_PATTERN.search(query) is not None
+
+        if has_weather and not has_document:
+            cities = self.find_cities(query)
+            if cities:
+                return self._result("weather", cities, 0.95)
+
+            match = LOCATION_PATTERN.search(query)
+            if match:
+                return self._result("weather", [match.group(1)], 0.7)
+
+            return self._result("weather", [], 0.3)
+
+        if has_document and not has_weather:
+            return self._result("document", [], 0.9)
+
+        return self._result("unknown", [], 0.0)
+
+    def classify(self, query):
+        """
+        Return a confident classification, or None to fall back to the LLM
+        """
+        classification = self.score(query)
+        confident = classification["confidence"] >= self.min_confidence
+
+        with self._lock:
+            if confident:
+                self.hits += 1
+            else:
+                self.fallbacks += 1
+        increment("fast_classifier.hit" if confident else "fast_classifier.fallback")
+
+        if not confident:
+            logger.debug("Fast-path classifier not confident, deferring to LLM")
+            return None
+
+        logger.debug("Fast-path classified query as {}", classification["type"])
+        return classification
+
+    def stats(self):
+        """
+        Return fast-path hit/fallback counters and the hit rate
+        """
+        with self._lock:
+            total = self.hits + self.fallbacks
+            return {
+                "hits": self.hits,
+                "fallbacks": self.fallbacks,
+                "hit_rate": self.hits / total if total else 0.0
+            }
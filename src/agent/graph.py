@@ -1,25 +1,57 @@
+from functools import partial
 from langgraph.graph import StateGraph, END
-from typing import List
-from langchain_core.messages import BaseMessage
+from typing import AsyncIterator, Iterator, List, Optional
+from langchain_core.messages import AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
 
-from src.agent.nodes import AgentState, classify_query, get_weather, query_document, generate_response
+from src.agent.nodes import (
+    AgentState,
+    classify_query,
+    aclassify_query,
+    get_weather,
+    aget_weather,
+    query_document,
+    aquery_document,
+    generate_response,
+    agenerate_response,
+    classify_queries,
+    get_weather_batch,
+    query_documents
+)
+from src.agent.resources import ResourceRegistry, get_resources
+from src.api.resilience import deadline_scope
+from src.api.telemetry import span, trace_request, traced
 
-from config import logger
+from config import BATCH_MAX_CONCURRENCY, MEMORY_ENABLED, CHECKPOINT_ENABLED, logger
 
 
-def create_agent_graph():
+def _bind_node(name, func, afunc, resources):
     """
-    Create a LangGraph for the agent
+    Wrap a node's sync and async variants, bound to the shared resources, so
+    the compiled graph serves both ``invoke`` and ``ainvoke``. Every call is
+    timed as a ``node.<name>`` span.
     """
+    return RunnableLambda(
+        traced(f"node.{name}", func if resources is None else partial(func, resources=resources)),
+        afunc=traced(f"node.{name}", afunc if resources is None else partial(afunc, resources=resources)),
+        name=name
+    )
+
+def create_agent_graph(resources: Optional[ResourceRegistry] = None):
+    """
+    Create a LangGraph for the agent, with the nodes bound to shared resources
+    and runs checkpointed to the local store when checkpointing is enabled
+    """
+    resources = resources or get_resources()
 
     logger.debug("Creating workflow")
     workflow = StateGraph(AgentState)
     
     logger.debug("Adding nodes")
-    workflow.add_node("classify_query", classify_query)
-    workflow.add_node("get_weather", get_weather)
-    workflow.add_node("query_document", query_document)
-    workflow.add_node("generate_response", generate_response)
+    workflow.add_node("classify_query", _bind_node("classify_query", classify_query, aclassify_query, resources))
+    workflow.add_node("get_weather", _bind_node("get_weather", get_weather, aget_weather, resources))
+    workflow.add_node("query_document", _bind_node("query_document", query_document, aquery_document, resources))
+    workflow.add_node("generate_response", _bind_node("generate_response", generate_response, agenerate_response, None))
     
     logger.debug("Add edges")
     workflow.add_conditional_edges(
@@ -39,34 +71,257 @@ def create_agent_graph():
     workflow.set_entry_point("classify_query")
     
     logger.debug("Compiling the graph")
-    agent_graph = workflow.compile()
+    agent_graph = workflow.compile(checkpointer=resources.checkpointer if CHECKPOINT_ENABLED else None)
     
     return agent_graph
 
-def create_agent_executor():
+def create_agent_executor(resources: Optional[ResourceRegistry] = None):
     """
-    Create an agent executor for the graph
+    Create an agent executor for the graph, reusing the registry's compiled graph
     """
-    agent_graph = create_agent_graph()
+    resources = resources or get_resources()
+    agent_graph = resources.agent_graph
+    one_off_graph = agent_graph.copy(update={"checkpointer": None})
     
-    def agent_executor(messages: List[BaseMessage]) -> AgentState:
+    def agent_executor(messages: List[BaseMessage], thread_id: Optional[str] = None) -> AgentState:
         """
-        Execute the agent with the given messages
+        Execute the agent with the given messages. With the conversation's
+        ``thread_id``, an unfinished run of the same question is resumed.
         """
-        logger.debug("Initializing state")
-        state = AgentState(
-            messages=messages,
-            query_type="unknown",
-            response="",
-            city="",
-            documents=[]
-        )
-        logger.debug("Initialized state")
-        
-        logger.debug("Executing the graph")
-        result = agent_graph.invoke(state)
-        logger.debug("Executed the graph")
+        with trace_request("agent"):
+            logger.debug("Initializing state")
+            graph, state, config = _graph_input(agent_graph, one_off_graph, thread_id, messages, resources)
+            logger.debug("Initialized state")
+            
+            logger.debug("Executing the graph")
+            with deadline_scope():
+                result = graph.invoke(state, config)
+            logger.debug("Executed the graph")
         
         return result
     
-    return agent_executor
\ No newline at end of file
+    return agent_executor
+
+def create_async_agent_executor(resources: Optional[ResourceRegistry] = None):
+    """
+    Create an async agent executor for the graph, reusing the registry's compiled graph
+    """
+    resources = resources or get_resources()
+    agent_graph = resources.agent_graph
+    one_off_graph = agent_graph.copy(update={"checkpointer": None})
+
+    async def async_agent_executor(messages: List[BaseMessage], thread_id: Optional[str] = None) -> AgentState:
+        """
+        Execute the agent with the given messages without blocking the event loop
+        """
+        with trace_request("agent"):
+            graph, state, config = await _agraph_input(agent_graph, one_off_graph, thread_id, messages, resources)
+
+            logger.debug("Executing the graph asynchronously")
+            with deadline_scope():
+                result = await graph.ainvoke(state, config)
+            logger.debug("Executed the graph asynchronously")
+
+        return result
+
+    return async_agent_executor
+
+def create_streaming_agent_executor(resources: Optional[ResourceRegistry] = None):
+    """
+    Create a streaming agent executor for the graph, reusing the registry's compiled graph
+    """
+    resources = resources or get_resources()
+    agent_graph = resources.agent_graph
+    one_off_graph = agent_graph.copy(update={"checkpointer": None})
+
+    def streaming_agent_executor(messages: List[BaseMessage], thread_id: Optional[str] = None) -> Iterator[dict]:
+        """
+        Execute the agent with the given messages, resuming an unfinished run
+        of the same question on the thread, yielding events as they happen:
+
+        - ``{"type": "node", "node": name}`` when a node finishes
+        - ``{"type": "token", "content": text}`` for each answer token
+        - ``{"type": "final", "state": state}`` with the final state, last
+        """
+        with trace_request("agent.stream"):
+            graph, state, config = _graph_input(agent_graph, one_off_graph, thread_id, messages, resources)
+
+            logger.debug("Streaming the graph")
+            stream = graph.stream(state, config, stream_mode=STREAM_MODES)
+            state, streamed = None, False
+            with deadline_scope():
+                for mode, chunk in stream:
+                    if mode == "values":
+                        state = chunk
+                        continue
+                    for event in _stream_events(mode, chunk):
+                        streamed = streamed or event["type"] == "token"
+                        yield event
+
+        for event in _final_events(state, streamed):
+            yield event
+        logger.debug("Streamed the graph")
+
+    return streaming_agent_executor
+
+def create_async_streaming_agent_executor(resources: Optional[ResourceRegistry] = None):
+    """
+    Create an async streaming agent executor for the graph, reusing the registry's compiled graph
+    """
+    resources = resources or get_resources()
+    agent_graph = resources.agent_graph
+    one_off_graph = agent_graph.copy(update={"checkpointer": None})
+
+    async def async_streaming_agent_executor(messages: List[BaseMessage], thread_id: Optional[str] = None) -> AsyncIterator[dict]:
+        """
+        Execute the agent without blocking the event loop, yielding the same
+        events as the streaming executor
+        """
+        with trace_request("agent.stream"):
+            graph, state, config = await _agraph_input(agent_graph, one_off_graph, thread_id, messages, resources)
+
+            logger.debug("Streaming the graph asynchronously")
+            stream = graph.astream(state, config, stream_mode=STREAM_MODES)
+            state, streamed = None, False
+            with deadline_scope():
+                async for mode, chunk in stream:
+                    if mode == "values":
+                        state = chunk
+                        continue
+                    for event in _stream_events(mode, chunk):
+                        streamed = streamed or event["type"] == "token"
+                        yield event
+
+        for event in _final_events(state, streamed):
+            yield event
+        logger.debug("Streamed the graph asynchronously")
+
+    return async_streaming_agent_executor
+
+def create_batch_agent_executor(resources: Optional[ResourceRegistry] = None):
+    """
+    Create a batch agent executor that runs each stage of the graph once for
+    a whole batch of conversations instead of once per conversation
+    """
+    resources = resources or get_resources()
+
+    def batch_agent_executor(
+        conversations: List[List[BaseMessage]],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY
+    ) -> List[AgentState]:
+        """
+        Execute the agent for every conversation, returning the final states in order
+        """
+        logger.debug("Executing the graph for {} conversations", len(conversations))
+        with trace_request("agent.batch"):
+            states = [_initial_state(_compact(messages, resources)) for messages in conversations]
+
+            with span("node.classify_query", batch=len(states)):
+                classify_queries(states, resources=resources)
+            with span("node.get_weather", batch=len(states)):
+                get_weather_batch(states, resources=resources, max_concurrency=max_concurrency)
+            with span("node.query_document", batch=len(states)):
+                query_documents(states, resources=resources, max_concurrency=max_concurrency)
+            states = [generate_response(state) for state in states]
+        logger.debug("Executed the graph for {} conversations", len(conversations))
+
+        return states
+
+    return batch_agent_executor
+
+def load_thread_messages(thread_id: str, resources: Optional[ResourceRegistry] = None) -> List[BaseMessage]:
+    """
+    Return the messages checkpointed for a conversation's thread, if any
+    """
+    agent_graph = (resources or get_resources()).agent_graph
+    if not agent_graph.checkpointer:
+        return []
+    return list(agent_graph.get_state({"configurable": {"thread_id": thread_id}}).values.get("messages", []))
+
+STREAM_MODES = ["messages", "updates", "values"]
+
+ANSWER_NODES = ("get_weather", "query_document")
+
+def _stream_events(mode, chunk):
+    """
+    Translate one LangGraph stream item into executor events; only answer
+    tokens from the weather and document nodes are forwarded
+    """
+    if mode == "messages":
+        message, metadata = chunk
+        if isinstance(message, AIMessageChunk) and message.content and metadata.get("langgraph_node") in ANSWER_NODES:
+            yield {"type": "token", "content": message.content}
+
+    elif mode == "updates":
+        for node in chunk:
+            yield {"type": "node", "node": node}
+
+def _final_events(state, streamed):
+    """
+    Close the stream with the final state. If no tokens were streamed (cache
+    hits, canned replies) the response is sent as a single token first, so
+    the tokens always add up to the response.
+    """
+    if not streamed and state["response"]:
+        yield {"type": "token", "content": state["response"]}
+    yield {"type": "final", "state": state}
+
+def _is_pending(snapshot, messages):
+    """
+    Whether the thread has an unfinished run (e.g. one cut short by a crash)
+    for the same question
+    """
+    if not snapshot.next or not snapshot.values.get("messages"):
+        return False
+    question = snapshot.values["messages"][-1]
+    return isinstance(question, HumanMessage) and question.content == messages[-1].content
+
+def _graph_input(agent_graph, one_off_graph, thread_id, messages, resources):
+    """
+    Graph, input and config for a run. On a conversation's thread, an
+    unfinished run of the same question is resumed from its last completed
+    node (input None). One-off runs skip checkpointing altogether.
+    """
+    if not thread_id:
+        return one_off_graph, _initial_state(_compact(messages, resources)), None
+
+    config = {"configurable": {"thread_id": thread_id}}
+    if agent_graph.checkpointer and _is_pending(agent_graph.get_state(config), messages):
+        logger.debug("Resuming thread {}", thread_id)
+        return agent_graph, None, config
+    return agent_graph, _initial_state(_compact(messages, resources)), config
+
+async def _agraph_input(agent_graph, one_off_graph, thread_id, messages, resources):
+    if not thread_id:
+        return one_off_graph, _initial_state(await _acompact(messages, resources)), None
+
+    config = {"configurable": {"thread_id": thread_id}}
+    if agent_graph.checkpointer and _is_pending(await agent_graph.aget_state(config), messages):
+        logger.debug("Resuming thread {}", thread_id)
+        return agent_graph, None, config
+    return agent_graph, _initial_state(await _acompact(messages, resources)), config
+
+def _compact(messages, resources):
+    """
+    Bound the history passed into the graph; always a fresh list, so the
+    caller's messages are never mutated by the nodes
+    """
+    if not MEMORY_ENABLED:
+        return list(messages)
+    with span("memory.compact"):
+        return resources.conversation_memory.compact(messages)
+
+async def _acompact(messages, resources):
+    if not MEMORY_ENABLED:
+        return list(messages)
+    with span("memory.compact"):
+        return await resources.conversation_memory.acompact(messages)
+
+def _initial_state(messages: List[BaseMessage]) -> AgentState:
+    return AgentState(
+        messages=messages,
+        query_type="unknown",
+        response="",
+        cities=[],
+        documents=[]
+    )
\ No newline at end of file
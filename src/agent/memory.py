@@ -0,0 +1,188 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from typing import List
+
+from config import MEMORY_WINDOW_TURNS, MEMORY_SUMMARIZE_AFTER, MEMORY_MAX_TOKENS, MEMORY_SUMMARY_CACHE_SIZE, logger
+
+from src.llm.context import create_token_counter
+
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+
+def is_summary(message: BaseMessage) -> bool:
+    """
+    Whether a message is the compacted summary of older turns
+    """
+    return isinstance(message, SystemMessage) and message.additional_kwargs.get("summary", False)
+
+def _transcript(turns):
+    return "\n".join(
+        f"{'User' if isinstance(message, HumanMessage) else 'Assistant'}: {message.content}"
+        for turn in turns for message in turn
+    )
+
+def _build_summary_prompt(summary, turns):
+    transcript = _transcript(turns)
+    previous = f"Summary so far:\n{summary}\n\n" if summary else ""
+    return f"""
+    Please summarize the following conversation between a user and a weather and document assistant.
+
+    {previous}New messages:
+    {transcript}
+
+    Keep the cities, documents, facts and open questions a follow-up question could refer to.
+    Respond with the summary only, in at most a few short sentences.
+    """
+
+
+class ConversationMemory:
+    """
+    Keeps a conversation's messages bounded however long the session runs.
+
+    The last ``window_turns`` turns (a user message and the replies to it)
+    are kept verbatim. Once ``summarize_after`` more turns have piled up
+    behind the window, they are folded into a single summary message, so
+    summarization runs every few turns rather than every turn. The summary
+    is written by a background worker, never on the request path: until it
+    is ready (or when it fails) the older turns are kept as they are, and
+    the next request carrying them folds them in. Finally the oldest turns
+    are dropped while the history is over ``max_tokens``; the latest turn
+    is always kept.
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        window_turns=MEMORY_WINDOW_TURNS,
+        summarize_after=MEMORY_SUMMARIZE_AFTER,
+        max_tokens=MEMORY_MAX_TOKENS,
+        count_tokens=None,
+        cache_size=MEMORY_SUMMARY_CACHE_SIZE
+    ):
+        self.llm = llm
+        self.window_turns = max(window_turns, 1)
+        self.summarize_after = max(summarize_after, 1)
+        self.max_tokens = max_tokens
+        self.cache_size = cache_size
+        self._count_tokens = count_tokens
+        self._lock = threading.Lock()
+        # Summary message per (previous summary, summarized turns) digest
+        self._summaries = OrderedDict()
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summarizer")
+
+    def count_tokens(self, messages):
+        if self._count_tokens is None:
+            self._count_tokens = create_token_counter()
+        return sum(self._count_tokens(message.content) for message in messages)
+
+    def _split(self, messages):
+        """
+        Separate the summary, if any, from the rest of the messages grouped into turns
+        """
+        summary, turns = None, []
+        for message in messages:
+            if is_summary(message):
+                summary = message
+            elif isinstance(message, HumanMessage) or not turns:
+                turns.append([message])
+            else:
+                turns[-1].append(message)
+        return summary, turns
+
+    def _needs_summary(self, turns):
+        return self.llm is not None and len(turns) >= self.window_turns + self.summarize_after
+
+    @staticmethod
+    def _summary_text(summary):
+        return summary.content.removeprefix(SUMMARY_PREFIX).strip() if summary is not None else ""
+
+    def _prefix_keys(self, summary, older):
+        """
+        Digest of the previous summary plus each prefix of the older turns
+        """
+        digest = hashlib.sha256(self._summary_text(summary).encode("utf-8"))
+        keys = []
+        for turn in older:
+            digest.update(b"\0" + _transcript([turn]).encode("utf-8"))
+            keys.append(digest.hexdigest())
+        return keys
+
+    def _fold(self, summary, turns):
+        """
+        Replace the longest run of older turns that already has a summary
+        with it, or schedule one for the older turns and return None
+        """
+        older = turns[:-self.window_turns]
+        keys = self._prefix_keys(summary, older)
+        with self._lock:
+            for size in range(len(keys), 0, -1):
+                folded = self._summaries.get(keys[size - 1])
+                if folded is not None:
+                    self._summaries.move_to_end(keys[size - 1])
+                    logger.debug("Folded {} turns into the conversation summary", size)
+                    return folded, turns[size:]
+
+            if keys[-1] not in self._pending:
+                self._pending.add(keys[-1])
+                self._executor.submit(self._summarize, keys[-1], summary, older)
+        return None
+
+    def _summarize(self, key, summary, older):
+        try:
+            content = self.llm.invoke(_build_summary_prompt(self._summary_text(summary), older))
+            text = getattr(content, "content", content).strip()
+            if text:
+                logger.debug("Summarized {} turns into {} characters", len(older), len(text))
+                with self._lock:
+                    self._summaries[key] = SystemMessage(content=f"{SUMMARY_PREFIX}\n{text}", additional_kwargs={"summary": True})
+                    while len(self._summaries) > self.cache_size:
+                        self._summaries.popitem(last=False)
+        except Exception as err:
+            logger.error(f"{err.__class__} Exception occured while summarizing the conversation. {err}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _cap(self, summary, turns):
+        """
+        Drop the oldest turns, then the summary, until the history fits the token cap
+        """
+        head = [summary] if summary is not None else []
+        tokens = self.count_tokens(head) + sum(self.count_tokens(turn) for turn in turns)
+        while tokens > self.max_tokens and len(turns) > 1:
+            tokens -= self.count_tokens(turns.pop(0))
+        if tokens > self.max_tokens and head:
+            head = []
+
+        return head + [message for turn in turns for message in turn]
+
+    def compact(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Return a bounded copy of the messages, folding in older turns whose
+        summary is ready; never waits on the LLM
+        """
+        summary, turns = self._split(messages)
+        while self._needs_summary(turns):
+            folded = self._fold(summary, turns)
+            if folded is None:
+                break
+            summary, turns = folded
+        return self._cap(summary, turns)
+
+    async def acompact(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Async variant of ``compact``; it does not block, so it runs inline
+        """
+        return self.compact(messages)
+
+    def close(self):
+        """
+        Stop the background summarizer, dropping summaries not started yet
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
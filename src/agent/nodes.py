@@ -1,15 +1,20 @@
 import json
 
 from langchain_core.messages import BaseMessage, AIMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from typing import Annotated, List, TypedDict, Literal
+from typing import Annotated, List, Optional, TypedDict, Literal
 
-from config import OPENAI_API_KEY, LLM_MODEL, logger
+from config import (
+    FAST_CLASSIFIER_ENABLED,
+    SEMANTIC_CACHE_ENABLED,
+    CONTEXT_PACKING_ENABLED,
+    CLASSIFY_BATCH_SIZE,
+    BATCH_MAX_CONCURRENCY,
+    WEATHER_MAX_CITIES,
+    logger
+)
 
-from src.api.weather import WeatherAPI
-from src.embedding.vectordb import VectorDatabase
-from src.llm.chain import LLMChain
+from src.agent.resources import ResourceRegistry, get_resources
+from src.api.telemetry import observe
 
 
 class AgentState(TypedDict):
@@ -17,85 +22,141 @@ class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], "accumulate"]
     query_type: Literal["weather", "document", "unknown"]
     response: str
-    city: str
+    cities: List[str]
     documents: List[str]
 
 
-def classify_query(state: AgentState) -> AgentState:
-    """
-    Classify whether the query is about weather or documents
-    """
-
-    logger.debug("Extracting the latest message")
-    last_message = state["messages"][-1].content
-    
-    logger.debug("Defining classifier prompt")
-    prompt = f"""
+def _build_classifier_prompt(last_message):
+    return f"""
     Please determine if the following query is asking about weather or information from a document:
     
     Query: {last_message}
     
-    If the query is asking about weather in a specific city, respond with "weather".
+    If the query is asking about weather in one or more specific cities, respond with "weather".
     If the query is asking for information from a document, respond with "document".
     If you're not sure, respond with "unknown".
     
-    Also, if it's a weather query, extract the city name from the query.
+    Also, if it's a weather query, extract every city name mentioned in the query.
     
     Format your response as a JSON object with two fields:
     - type: Either "weather", "document", or "unknown"
-    - city: The city name (only if type is "weather")
+    - cities: A list of the city names, in the order mentioned (only if type is "weather")
     """
+
+def _build_batch_classifier_prompt(queries):
+    numbered = "\n".join(f"{number}. {query}" for number, query in enumerate(queries, start=1))
+    return f"""
+    Please determine if each of the following queries is asking about weather or information from a document:
     
-    logger.debug("Using OpenAI to classify")
-    llm = ChatOpenAI(
-        model=LLM_MODEL,
-        openai_api_key=OPENAI_API_KEY,
-        temperature=0
-    )
+    {numbered}
     
-    response = llm.invoke(prompt)
+    For each query: if it is asking about weather in one or more specific cities, its type is "weather".
+    If it is asking for information from a document, its type is "document".
+    If you're not sure, its type is "unknown".
     
-    logger.debug("Parse the response to extract type and city")
+    Also, for weather queries, extract every city name mentioned in the query.
+    
+    Format your response as a JSON array with exactly one object per query, in the same order, each with two fields:
+    - type: Either "weather", "document", or "unknown"
+    - cities: A list of the city names, in the order mentioned (only if type is "weather")
+    """
 
+def _apply_classification(state, content):
     try:
-        classification = json.loads(response.content)
-        state["query_type"] = classification.get("type", "unknown")
-        state["city"] = classification.get("city", "") if state["query_type"] == "weather" else ""
+        _set_classification(state, json.loads(content))
 
     except Exception as err:
 
         logger.error(f"{err.__class__} Exception occured. {err}")
         state["query_type"] = "unknown"
-        state["city"] = ""
-    
+        state["cities"] = []
+
     return state
 
-def get_weather(state: AgentState) -> AgentState:
+def _set_cities(state, cities):
+    names = [city.strip() for city in cities if isinstance(city, str) and city.strip()]
+    state["cities"] = list(dict.fromkeys(names))[:WEATHER_MAX_CITIES] if state["query_type"] == "weather" else []
+
+def _set_classification(state, classification):
+    state["query_type"] = classification.get("type", "unknown")
+    # Older prompts and cached classifications carry a single "city"
+    cities = classification.get("cities")
+    if cities is None:
+        cities = [classification.get("city", "")]
+    _set_cities(state, cities if isinstance(cities, list) else [cities])
+
+def _apply_fast_classification(state, last_message, resources):
+    if not FAST_CLASSIFIER_ENABLED:
+        return False
+
+    classification = resources.fast_classifier.classify(last_message)
+    if classification is None:
+        return False
+
+    state["query_type"] = classification["type"]
+    _set_cities(state, classification["cities"])
+    return True
+
+def classify_query(state: AgentState, resources: Optional[ResourceRegistry] = None) -> AgentState:
     """
-    Fetch weather data for the specified city
+    Classify whether the query is about weather or documents
     """
+    resources = resources or get_resources()
+
+    logger.debug("Extracting the latest message")
+    last_message = state["messages"][-1].content
+
+    logger.debug("Trying the rule-based fast path")
+    if _apply_fast_classification(state, last_message, resources):
+        return state
+    
+    logger.debug("Defining classifier prompt")
+    prompt = _build_classifier_prompt(last_message)
+    
+    logger.debug("Using OpenAI to classify")
+    response = resources.classifier_llm.invoke(prompt)
+    
+    logger.debug("Parse the response to extract type and city")
+    return _apply_classification(state, response.content)
+
+async def aclassify_query(state: AgentState, resources: Optional[ResourceRegistry] = None) -> AgentState:
+    """
+    Classify whether the query is about weather or documents, asynchronously
+    """
+    resources = resources or get_resources()
+
+    logger.debug("Extracting the latest message")
+    last_message = state["messages"][-1].content
+
+    logger.debug("Trying the rule-based fast path")
+    if _apply_fast_classification(state, last_message, resources):
+        return state
+
+    logger.debug("Using OpenAI to classify")
+    response = await resources.classifier_llm.ainvoke(_build_classifier_prompt(last_message))
+
+    logger.debug("Parse the response to extract type and city")
+    return _apply_classification(state, response.content)
+
+def get_weather(state: AgentState, resources: Optional[ResourceRegistry] = None) -> AgentState:
+    """
+    Fetch weather data for the specified cities
+    """
+    resources = resources or get_resources()
 
     if state["query_type"] != "weather":
         return state
     
-    logger.debug("Getting the city from the state")
-    city = state["city"]
+    logger.debug("Getting the cities from the state")
+    cities = state["cities"]
     
     logger.debug("Getting weather data")
-    weather_api = WeatherAPI()
-    weather_data = weather_api.get_weather(city)
-    formatted_weather = weather_api.format_weather_data(weather_data)
+    weather_api = resources.weather_api
+    weather_data = weather_api.get_weather_many(cities)
+    formatted_weather = weather_api.format_weather_reports(weather_data)
     
     logger.debug("Processing with LLM")
-    llm_chain = LLMChain()
-    weather_prompt = llm_chain.create_weather_chain()
-    
-    chat_prompt = ChatPromptTemplate.from_messages([
-        ("system", weather_prompt.template),
-        ("human", "{question}")
-    ])
-    
-    chain = chat_prompt | llm_chain.llm
+    chain = resources.weather_chain
     
     logger.debug("Getting the question from the latest message")
     question = state["messages"][-1].content
@@ -110,32 +171,238 @@ def get_weather(state: AgentState) -> AgentState:
     
     return state
 
-def query_document(state: AgentState) -> AgentState:
+async def aget_weather(state: AgentState, resources: Optional[ResourceRegistry] = None) -> AgentState:
+    """
+    Fetch weather data for the specified cities, asynchronously
+    """
+    resources = resources or get_resources()
+
+    if state["query_type"] != "weather":
+        return state
+
+    logger.debug("Getting weather data")
+    weather_api = resources.weather_api
+    weather_data = await weather_api.aget_weather_many(state["cities"])
+    formatted_weather = weather_api.format_weather_reports(weather_data)
+
+    logger.debug("Getting response")
+    result = await resources.weather_chain.ainvoke({
+        "weather_data": formatted_weather,
+        "question": state["messages"][-1].content
+    })
+
+    state["response"] = result.content
+
+    return state
+
+def query_document(state: AgentState, resources: Optional[ResourceRegistry] = None) -> AgentState:
     """
     Query documents based on the input
     """
+    resources = resources or get_resources()
     
     if state["query_type"] != "document":
         return state
     
     logger.debug("Get the question from the latest message")
     question = state["messages"][-1].content
+
+    logger.debug("Looking up the semantic answer cache")
+    cached, vector = None, None
+    if SEMANTIC_CACHE_ENABLED:
+        try:
+            cached, vector = resources.semantic_cache.lookup(question)
+        except Exception as err:
+            logger.error(f"{err.__class__} Exception occured in semantic cache lookup. {err}")
+    if cached is not None:
+        return _apply_document_answer(state, cached["answer"], cached["sources"])
     
-    logger.debug("Getting vector database retriever")
-    vector_db = VectorDatabase()
-    retriever = vector_db.get_retriever()
-    
-    logger.debug("Creating QA chain")
-    llm_chain = LLMChain()
-    qa_chain = llm_chain.create_document_chain(retriever)
+    logger.debug("Getting shared QA chain")
+    qa_chain = resources.document_chain
     
     logger.debug("Getting response")
     result = qa_chain.invoke({"query": question})
+
+    _store_document_answer(resources, question, vector, result)
     
-    state["response"] = result["result"]
-    
+    return _apply_document_answer(state, result["result"], result.get("source_documents", []))
+
+async def aquery_document(state: AgentState, resources: Optional[ResourceRegistry] = None) -> AgentState:
+    """
+    Query documents based on the input, asynchronously
+    """
+    resources = resources or get_resources()
+
+    if state["query_type"] != "document":
+        return state
+
+    question = state["messages"][-1].content
+
+    logger.debug("Looking up the semantic answer cache")
+    cached, vector = None, None
+    if SEMANTIC_CACHE_ENABLED:
+        try:
+            cached, vector = await resources.semantic_cache.alookup(question)
+        except Exception as err:
+            logger.error(f"{err.__class__} Exception occured in semantic cache lookup. {err}")
+    if cached is not None:
+        return _apply_document_answer(state, cached["answer"], cached["sources"])
+
+    logger.debug("Getting response")
+    qa_chain = resources.async_document_chain
+    result = await qa_chain.ainvoke({"query": question})
+
+    _store_document_answer(resources, question, vector, result)
+
+    return _apply_document_answer(state, result["result"], result.get("source_documents", []))
+
+def _apply_document_answer(state, answer, sources):
+    state["response"] = answer
+    state["documents"] = [source.page_content for source in sources]
     return state
 
+def _store_document_answer(resources, question, vector, result):
+    observe("retrieval.documents", len(result.get("source_documents", [])))
+    if vector is None:
+        return
+    resources.semantic_cache.store(question, vector, result["result"], result.get("source_documents", []))
+
+def classify_queries(states: List[AgentState], resources: Optional[ResourceRegistry] = None) -> List[AgentState]:
+    """
+    Classify many queries, asking the LLM about up to CLASSIFY_BATCH_SIZE
+    queries per call for those the rule-based fast path cannot decide
+    """
+    resources = resources or get_resources()
+
+    logger.debug("Trying the rule-based fast path")
+    pending = [
+        state for state in states
+        if not _apply_fast_classification(state, state["messages"][-1].content, resources)
+    ]
+
+    for start in range(0, len(pending), CLASSIFY_BATCH_SIZE):
+        batch = pending[start:start + CLASSIFY_BATCH_SIZE]
+        if len(batch) == 1:
+            classify_query(batch[0], resources=resources)
+            continue
+
+        logger.debug("Using OpenAI to classify {} queries", len(batch))
+        response = resources.classifier_llm.invoke(
+            _build_batch_classifier_prompt([state["messages"][-1].content for state in batch])
+        )
+        try:
+            classifications = json.loads(response.content)
+            if not isinstance(classifications, list) or len(classifications) != len(batch):
+                raise ValueError(f"Expected {len(batch)} classifications, got {response.content!r}")
+            for state, classification in zip(batch, classifications):
+                _set_classification(state, classification)
+
+        except Exception as err:
+
+            logger.error(f"{err.__class__} Exception occured in batch classification, classifying one by one. {err}")
+            responses = resources.classifier_llm.batch(
+                [_build_classifier_prompt(state["messages"][-1].content) for state in batch]
+            )
+            for state, single in zip(batch, responses):
+                _apply_classification(state, single.content)
+
+    return states
+
+def get_weather_batch(
+    states: List[AgentState],
+    resources: Optional[ResourceRegistry] = None,
+    max_concurrency: int = BATCH_MAX_CONCURRENCY
+) -> List[AgentState]:
+    """
+    Answer every weather query, fetching each distinct city once in a
+    single get_weather_many call, then running the weather chain with
+    bounded concurrency
+    """
+    resources = resources or get_resources()
+
+    weather_states = [state for state in states if state["query_type"] == "weather"]
+    if not weather_states:
+        return states
+
+    logger.debug("Getting weather data")
+    weather_api = resources.weather_api
+    cities = list(dict.fromkeys(city for state in weather_states for city in state["cities"]))
+    weather_data = dict(zip(cities, weather_api.get_weather_many(cities)))
+
+    logger.debug("Getting {} responses", len(weather_states))
+    results = resources.weather_chain.batch(
+        [
+            {
+                "weather_data": weather_api.format_weather_reports([weather_data[city] for city in state["cities"]]),
+                "question": state["messages"][-1].content
+            }
+            for state in weather_states
+        ],
+        config={"max_concurrency": max_concurrency}
+    )
+
+    for state, result in zip(weather_states, results):
+        state["response"] = result.content
+
+    return states
+
+def query_documents(
+    states: List[AgentState],
+    resources: Optional[ResourceRegistry] = None,
+    max_concurrency: int = BATCH_MAX_CONCURRENCY
+) -> List[AgentState]:
+    """
+    Answer every document query: one embedding request for all questions,
+    semantic cache lookups, one multi-vector search for the misses and the
+    answers generated with bounded concurrency
+    """
+    resources = resources or get_resources()
+
+    document_states = [state for state in states if state["query_type"] == "document"]
+    if not document_states:
+        return states
+
+    questions = [state["messages"][-1].content for state in document_states]
+    vectors, cached = None, [None] * len(questions)
+    if SEMANTIC_CACHE_ENABLED:
+        try:
+            logger.debug("Embedding {} questions", len(questions))
+            vectors = resources.embeddings.embed_documents(questions)
+            cached = [resources.semantic_cache.match(vector) for vector in vectors]
+        except Exception as err:
+            logger.error(f"{err.__class__} Exception occured in semantic cache lookup. {err}")
+            vectors = None
+
+    pending = []
+    for i, (state, entry) in enumerate(zip(document_states, cached)):
+        if entry is not None:
+            _apply_document_answer(state, entry["answer"], entry["sources"])
+        else:
+            pending.append(i)
+    if not pending:
+        return states
+
+    logger.debug("Retrieving documents for {} questions", len(pending))
+    documents = resources.vector_db.similarity_search_batch(
+        [questions[i] for i in pending],
+        vectors=[vectors[i] for i in pending] if vectors is not None else None
+    )
+    if CONTEXT_PACKING_ENABLED:
+        documents = [resources.context_packer.pack(questions[i], sources) for i, sources in zip(pending, documents)]
+
+    logger.debug("Getting {} responses", len(pending))
+    answers = resources.combine_documents_chain.batch(
+        [{"input_documents": sources, "question": questions[i]} for i, sources in zip(pending, documents)],
+        config={"max_concurrency": max_concurrency}
+    )
+
+    for i, sources, answer in zip(pending, documents, answers):
+        result = {"result": answer["output_text"], "source_documents": sources}
+        _store_document_answer(resources, questions[i], vectors[i] if vectors is not None else None, result)
+        _apply_document_answer(document_states[i], result["result"], sources)
+
+    return states
+
 def generate_response(state: AgentState) -> AgentState:
     """
     Generate a response based on the query type
@@ -151,4 +418,10 @@ Could you please clarify your question?
     logger.debug("Adding the response as an AI message")
     state["messages"].append(AIMessage(content=state["response"]))
     
-    return state
\ No newline at end of file
+    return state
+
+async def agenerate_response(state: AgentState) -> AgentState:
+    """
+    Generate a response based on the query type, asynchronously
+    """
+    return generate_response(state)
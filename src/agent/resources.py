@@ -0,0 +1,319 @@
+import asyncio
+import atexit
+import threading
+
+from config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_ENABLED,
+    QDRANT_URL,
+    QDRANT_TIMEOUT,
+    HYBRID_RETRIEVAL_ENABLED,
+    VECTOR_BACKEND,
+    CONTEXT_PACKING_ENABLED,
+    logger
+)
+
+from src.agent.classifier import RuleBasedClassifier
+
+
+class ResourceRegistry:
+    """
+    Process-wide registry of heavyweight clients shared by the agent nodes.
+
+    Every resource is created lazily on first access, exactly once, under a
+    lock, and reused by every request afterwards. ``startup`` warms resources
+    eagerly and ``shutdown`` releases them in reverse creation order.
+
+    Factories import their client libraries (OpenAI, Qdrant, LangChain
+    chains, SQLAlchemy) when first called, so importing the registry, the
+    nodes or the graph does not pay for clients a process never uses.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._factories = {}
+        self._closers = {}
+        self._async_closers = {}
+        self._instances = {}
+        self._creation_order = []
+
+        self.register("fast_classifier", RuleBasedClassifier)
+        self.register("classifier_llm", self._create_classifier_llm)
+        self.register("embeddings", self._create_embeddings, close=lambda embeddings: getattr(embeddings, "close", lambda: None)())
+        self.register("qdrant_client", self._create_qdrant_client, close=lambda client: client.close())
+        self.register("vector_backend", self._create_vector_backend, aclose=lambda backend: backend.aclose())
+        self.register("vector_db", self._create_vector_db)
+        self.register("ingestion_pipeline", self._create_ingestion_pipeline)
+        self.register("local_db", self._create_local_db, close=lambda engine: engine.dispose())
+        self.register("file_manifest", self._create_file_manifest)
+        self.register("ingestion_jobs", self._create_ingestion_jobs, close=lambda jobs: jobs.stop(timeout=5))
+        self.register("semantic_cache", self._create_semantic_cache)
+        self.register("retriever", lambda: self.vector_db.get_retriever())
+        self.register("async_retriever", lambda: self.vector_db.get_async_retriever())
+        self.register("llm_chain", self._create_llm_chain)
+        self.register("weather_api", self._create_weather_api, close=lambda weather_api: weather_api.close(), aclose=lambda weather_api: weather_api.aclose())
+        self.register("weather_chain", lambda: self.llm_chain.create_weather_chat_chain())
+        self.register("context_packer", self._create_context_packer)
+        self.register("document_chain", lambda: self._create_document_chain(self.retriever))
+        self.register("async_document_chain", lambda: self._create_document_chain(self.async_retriever))
+        self.register("combine_documents_chain", lambda: self.document_chain.combine_documents_chain)
+        self.register("conversation_memory", self._create_conversation_memory, close=lambda memory: memory.close())
+        self.register("checkpointer", self._create_checkpointer)
+        self.register("agent_graph", self._create_agent_graph)
+        self.register("agent_executor", self._create_agent_executor)
+        self.register("async_agent_executor", self._create_async_agent_executor)
+        self.register("streaming_agent_executor", self._create_streaming_agent_executor)
+        self.register("async_streaming_agent_executor", self._create_async_streaming_agent_executor)
+        self.register("batch_agent_executor", self._create_batch_agent_executor)
+
+    def register(self, name, factory, close=None, aclose=None):
+        """
+        Register (or replace) the factory used to build a named resource.
+
+        ``close`` releases the instance from synchronous code; ``aclose`` is
+        awaited instead when shutting down from a running event loop.
+        """
+        with self._lock:
+            self._factories[name] = factory
+            if close is not None:
+                self._closers[name] = close
+            if aclose is not None:
+                self._async_closers[name] = aclose
+
+    def get(self, name):
+        """
+        Return the named resource, creating it on first access
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+
+            if name not in self._factories:
+                raise KeyError(f"Unknown resource: {name}")
+
+            logger.debug("Creating shared resource: {}", name)
+            instance = self._factories[name]()
+            self._instances[name] = instance
+            self._creation_order.append(name)
+            logger.debug("Created shared resource: {}", name)
+
+            return instance
+
+    def set(self, name, instance):
+        """
+        Inject a ready-made instance for a resource, e.g. a mock in tests
+        """
+        with self._lock:
+            if name not in self._instances:
+                self._creation_order.append(name)
+            self._instances[name] = instance
+
+    def invalidate(self, *names):
+        """
+        Drop cached instances so they are rebuilt on next access
+        """
+        with self._lock:
+            for name in names:
+                self._close(name)
+
+    def startup(self, names=None):
+        """
+        Eagerly create resources so the first request does not pay for them
+        """
+        for name in names or ("fast_classifier", "classifier_llm", "llm_chain", "weather_api", "vector_db", "agent_executor"):
+            self.get(name)
+
+    def shutdown(self):
+        """
+        Release every created resource in reverse creation order
+        """
+        with self._lock:
+            for name in reversed(list(self._creation_order)):
+                self._close(name)
+
+    async def ashutdown(self):
+        """
+        Release every created resource from inside a running event loop
+        """
+        with self._lock:
+            names = list(reversed(self._creation_order))
+            instances = [(name, self._instances.get(name)) for name in names]
+
+        for name, instance in instances:
+            if instance is None:
+                continue
+            try:
+                if name in self._async_closers:
+                    logger.debug("Closing shared resource: {}", name)
+                    await self._async_closers[name](instance)
+                elif name in self._closers:
+                    logger.debug("Closing shared resource: {}", name)
+                    self._closers[name](instance)
+            except Exception as err:
+                logger.error(f"{err.__class__} Exception occured while closing {name}. {err}")
+
+        with self._lock:
+            for name in names:
+                self._instances.pop(name, None)
+                if name in self._creation_order:
+                    self._creation_order.remove(name)
+
+    def _close(self, name):
+        instance = self._instances.pop(name, None)
+        if name in self._creation_order:
+            self._creation_order.remove(name)
+        if instance is None:
+            return
+
+        try:
+            if name in self._closers:
+                logger.debug("Closing shared resource: {}", name)
+                self._closers[name](instance)
+            elif name in self._async_closers:
+                logger.debug("Closing shared resource: {}", name)
+                asyncio.run(self._async_closers[name](instance))
+        except Exception as err:
+            logger.error(f"{err.__class__} Exception occured while closing {name}. {err}")
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self._factories:
+            raise AttributeError(f"{self.__class__.__name__} has no resource {name!r}")
+        return self.get(name)
+
+    def _create_classifier_llm(self):
+        from src.llm.client import create_chat_model
+        return create_chat_model(temperature=0)
+
+    def _create_embeddings(self):
+        from src.llm.client import create_embeddings
+        embeddings = create_embeddings()
+        if EMBEDDING_CACHE_ENABLED:
+            from src.embedding.embedding_cache import CachedEmbeddings
+            return CachedEmbeddings(embeddings, EMBEDDING_MODEL)
+        return embeddings
+
+    def _create_qdrant_client(self):
+        from qdrant_client import QdrantClient
+        return QdrantClient(url=QDRANT_URL, timeout=QDRANT_TIMEOUT)
+
+    def _create_vector_db(self):
+        from src.embedding.lexical import LexicalIndex
+        from src.embedding.vectordb import VectorDatabase
+        lexical_index = LexicalIndex() if HYBRID_RETRIEVAL_ENABLED else None
+        return VectorDatabase(backend=self.vector_backend, embeddings=self.embeddings, lexical_index=lexical_index)
+
+    def _create_vector_backend(self):
+        if VECTOR_BACKEND == "local":
+            from src.embedding.local_index import LocalVectorBackend
+            return LocalVectorBackend()
+        from src.embedding.backend import QdrantBackend
+        return QdrantBackend(client=self.qdrant_client)
+
+    def _create_ingestion_pipeline(self):
+        from src.document.pipeline import IngestionPipeline
+        return IngestionPipeline(self.vector_db)
+
+    def _create_local_db(self):
+        from src.document.store import create_local_engine
+        return create_local_engine()
+
+    def _create_file_manifest(self):
+        from src.document.manifest import FileManifest
+        return FileManifest(engine=self.local_db)
+
+    def _create_ingestion_jobs(self):
+        from src.document.jobs import IngestionJobQueue
+        return IngestionJobQueue(self.ingestion_pipeline, manifest=self.file_manifest, engine=self.local_db).start()
+
+    def _create_llm_chain(self):
+        from src.llm.chain import LLMChain
+        return LLMChain()
+
+    def _create_weather_api(self):
+        from src.api.weather import WeatherAPI
+        return WeatherAPI()
+
+    def _create_context_packer(self):
+        from src.llm.context import ContextPacker
+        return ContextPacker()
+
+    def _create_document_chain(self, retriever):
+        context_packer = self.context_packer if CONTEXT_PACKING_ENABLED else None
+        return self.llm_chain.create_document_chain(retriever, context_packer=context_packer)
+
+    def _create_semantic_cache(self):
+        from src.embedding.semantic_cache import SemanticCache
+        semantic_cache = SemanticCache(self.embeddings)
+        self.vector_db.add_ingest_listener(semantic_cache.invalidate)
+        return semantic_cache
+
+    def _create_conversation_memory(self):
+        from src.agent.memory import ConversationMemory
+        return ConversationMemory(llm=self.classifier_llm)
+
+    def _create_checkpointer(self):
+        from src.agent.checkpoint import SQLiteCheckpointSaver
+        checkpointer = SQLiteCheckpointSaver(engine=self.local_db)
+        checkpointer.prune()
+        return checkpointer
+
+    def _create_agent_graph(self):
+        from src.agent.graph import create_agent_graph
+        return create_agent_graph(resources=self)
+
+    def _create_agent_executor(self):
+        from src.agent.graph import create_agent_executor
+        return create_agent_executor(resources=self)
+
+    def _create_async_agent_executor(self):
+        from src.agent.graph import create_async_agent_executor
+        return create_async_agent_executor(resources=self)
+
+    def _create_streaming_agent_executor(self):
+        from src.agent.graph import create_streaming_agent_executor
+        return create_streaming_agent_executor(resources=self)
+
+    def _create_async_streaming_agent_executor(self):
+        from src.agent.graph import create_async_streaming_agent_executor
+        return create_async_streaming_agent_executor(resources=self)
+
+    def _create_batch_agent_executor(self):
+        from src.agent.graph import create_batch_agent_executor
+        return create_batch_agent_executor(resources=self)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_resources():
+    """
+    Return the process-wide resource registry, creating it on first use
+    """
+    global _registry
+
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ResourceRegistry()
+                atexit.register(shutdown_resources)
+
+    return _registry
+
+
+def shutdown_resources():
+    """
+    Release the process-wide resources, if they were ever created
+    """
+    global _registry
+
+    with _registry_lock:
+        if _registry is not None:
+            _registry.shutdown()
+            _registry = None
@@ -0,0 +1,283 @@
+import asyncio
+import contextvars
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter
+)
+
+from config import (
+    REQUEST_DEADLINE,
+    UPSTREAM_RETRIES,
+    UPSTREAM_BACKOFF_INITIAL,
+    UPSTREAM_BACKOFF_MAX,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    logger
+)
+
+from src.api.telemetry import increment, span
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when the request deadline leaves no time for another upstream call
+    """
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open
+    """
+
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds=REQUEST_DEADLINE):
+    """
+    Bound every upstream call made inside the block by an overall deadline.
+    An enclosing, earlier deadline wins.
+    """
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_time():
+    """
+    Seconds left before the current deadline, or None outside a deadline scope
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def call_timeout(cap):
+    """
+    Timeout for one upstream call: ``cap``, shortened to the time left before
+    the deadline. Raises DeadlineExceeded once the deadline has passed.
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return cap
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return remaining if cap is None else min(cap, remaining)
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast with CircuitOpenError for ``reset_timeout`` seconds. Then
+    a single trial call is let through (half-open): success closes the
+    circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._clock() - self._opened_at >= self.reset_timeout else "open"
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError unless a call may go through now
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._clock() - self._opened_at < self.reset_timeout or self._trial_running:
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Circuit for {} closed", self.name)
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_cancelled(self):
+        """
+        Release a trial call that was abandoned before it succeeded or failed
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._opened_at = self._clock()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """
+    Return the process-wide circuit breaker for an upstream, creating it on first use
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+
+# Transient errors of the client libraries, looked up only once a library is
+# loaded (an error of its type cannot exist before), so importing this module
+# does not import them
+LIBRARY_TRANSIENT_ERRORS = {
+    "requests": ("ConnectionError", "Timeout"),
+    "httpx": ("NetworkError", "TimeoutException"),
+    "openai": ("APIConnectionError",)
+}
+
+
+def _transient_errors():
+    errors = list(TRANSIENT_ERRORS)
+    for module_name, names in LIBRARY_TRANSIENT_ERRORS.items():
+        module = sys.modules.get(module_name)
+        if module is not None:
+            errors.extend(getattr(module, name) for name in names)
+    return tuple(errors)
+
+
+def is_transient(err):
+    """
+    Whether an upstream error is worth retrying: timeouts, connection errors,
+    throttling and server errors, also when wrapped by a client library
+    """
+    if isinstance(err, DeadlineExceeded):
+        return False
+    if isinstance(err, _transient_errors()):
+        return True
+    status = getattr(err, "status_code", None) or getattr(getattr(err, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    cause = getattr(err, "source", None) or err.__cause__
+    return isinstance(cause, BaseException) and cause is not err and is_transient(cause)
+
+
+def is_caller_error(err):
+    """
+    Whether the upstream rejected the request itself (a 4xx other than 429),
+    which says nothing about the upstream's health
+    """
+    status = getattr(err, "status_code", None) or getattr(getattr(err, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return 400 <= status < 500 and status != 429
+    cause = getattr(err, "source", None) or err.__cause__
+    return isinstance(cause, BaseException) and cause is not err and is_caller_error(cause)
+
+
+@contextmanager
+def guarded(breaker):
+    """
+    Run the block as one call through the circuit breaker, timed as an
+    ``upstream.<name>`` span
+    """
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        increment(f"upstream.{breaker.name}.rejected")
+        raise
+
+    with span(f"upstream.{breaker.name}"):
+        try:
+            yield
+        except Exception as err:
+            # A 404 means the upstream answered; deadlines and anything else count against it
+            if is_caller_error(err):
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.record_cancelled()
+            raise
+        breaker.record_success()
+
+
+def _before_retry(state):
+    logger.warning(f"Retrying upstream call after {state.outcome.exception()!r} (attempt {state.attempt_number})")
+    increment("upstream.retries")
+
+def _retry_options(retries):
+    return {
+        "stop": stop_after_attempt(retries + 1),
+        "wait": wait_exponential_jitter(initial=UPSTREAM_BACKOFF_INITIAL, max=UPSTREAM_BACKOFF_MAX),
+        "retry": retry_if_exception(is_transient),
+        "before_sleep": _before_retry,
+        "reraise": True
+    }
+
+
+def _within_deadline(wait):
+    # Never sleep past the deadline: give up instead
+    remaining = remaining_time()
+    if remaining is not None and wait >= remaining:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return wait
+
+
+def call_upstream(fn, breaker, timeout=None, retries=UPSTREAM_RETRIES):
+    """
+    Call ``fn(timeout)`` through the breaker, retrying transient failures
+    with jittered exponential backoff. Each attempt's timeout is ``timeout``
+    shortened to the time left before the request deadline.
+    """
+    def attempt():
+        attempt_timeout = call_timeout(timeout)
+        with guarded(breaker):
+            return fn(attempt_timeout)
+
+    retrying = Retrying(sleep=lambda wait: time.sleep(_within_deadline(wait)), **_retry_options(retries))
+    return retrying(attempt)
+
+
+async def acall_upstream(fn, breaker, timeout=None, retries=UPSTREAM_RETRIES):
+    """
+    Async variant of ``call_upstream`` for ``await fn(timeout)``
+    """
+    async def attempt():
+        attempt_timeout = call_timeout(timeout)
+        with guarded(breaker):
+            return await fn(attempt_timeout)
+
+    async def sleep(wait):
+        await asyncio.sleep(_within_deadline(wait))
+
+    retrying = AsyncRetrying(sleep=sleep, **_retry_options(retries))
+    return await retrying(attempt)
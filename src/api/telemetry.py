@@ -0,0 +1,284 @@
+import contextvars
+import inspect
+import json
+import math
+import re
+import threading
+import time
+import uuid
+
+from collections import deque
+from contextlib import contextmanager
+
+from config import TELEMETRY_ENABLED, TELEMETRY_EXPORT_PATH, TELEMETRY_SAMPLE_SIZE, logger
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    Count and sum of every observation, plus a window of the most recent
+    ``sample_size`` observations from which the quantiles are read
+    """
+
+    def __init__(self, sample_size=TELEMETRY_SAMPLE_SIZE):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def summary(self):
+        ordered = sorted(self.samples)
+
+        def quantile(q):
+            # Nearest-rank quantile
+            return ordered[max(math.ceil(q * len(ordered)) - 1, 0)] if ordered else 0.0
+
+        summary = {"count": self.count, "sum": self.sum}
+        summary.update({f"p{round(q * 100)}": quantile(q) for q in QUANTILES})
+        return summary
+
+
+class Metrics:
+    """
+    Process-wide, thread-safe histograms and counters, keyed by dotted names
+    such as ``node.get_weather.seconds`` or ``weather_cache.hit``
+    """
+
+    def __init__(self, sample_size=TELEMETRY_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, value):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(self.sample_size)
+            self._histograms[name].observe(value)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        Return every histogram's count, sum and p50/p95/p99, and every counter
+        """
+        with self._lock:
+            return {
+                "histograms": {name: histogram.summary() for name, histogram in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items()))
+            }
+
+    def prometheus_text(self, prefix="weatheragent"):
+        """
+        Render the metrics in the Prometheus text exposition format, histograms
+        as summaries with p50/p95/p99 quantiles
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, summary in snapshot["histograms"].items():
+            metric = _metric_name(prefix, name)
+            lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                lines.append(f'{metric}{{quantile="{q}"}} {summary[f"p{round(q * 100)}"]}')
+            lines.append(f"{metric}_sum {summary['sum']}")
+            lines.append(f"{metric}_count {summary['count']}")
+        for name, value in snapshot["counters"].items():
+            metric = _metric_name(prefix, name) + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _metric_name(prefix, name):
+    return f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+
+class RequestTrace:
+    """
+    The spans and counters recorded while serving one request
+    """
+
+    def __init__(self, name, request_id=None):
+        self.name = name
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = None
+        self.spans = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "request_id": self.request_id,
+                "name": self.name,
+                "started_at": self.started_at,
+                "duration": self.duration,
+                "error": self.error,
+                "spans": sorted(self.spans, key=lambda record: record["start"]),
+                "counters": dict(self.counters)
+            }
+
+
+class JSONLExporter:
+    """
+    Append each finished request trace to a file, one JSON object per line
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+metrics = Metrics()
+
+_exporter = JSONLExporter(TELEMETRY_EXPORT_PATH) if TELEMETRY_EXPORT_PATH else None
+_trace = contextvars.ContextVar("trace", default=None)
+_span = contextvars.ContextVar("span", default=None)
+
+
+def set_exporter(exporter):
+    """
+    Replace the exporter finished traces are sent to (None to disable), returning the previous one
+    """
+    global _exporter
+
+    previous, _exporter = _exporter, exporter
+    return previous
+
+def current_trace():
+    """
+    The trace of the request being served, or None outside ``trace_request``
+    """
+    return _trace.get()
+
+@contextmanager
+def trace_request(name, request_id=None):
+    """
+    Record every span and counter inside the block as one request, then
+    export it. Yields the RequestTrace, or None when telemetry is disabled.
+    Log records inside the block carry the request ID either way.
+    """
+    if not TELEMETRY_ENABLED:
+        with logger.contextualize(request_id=request_id or uuid.uuid4().hex):
+            yield None
+        return
+
+    trace = RequestTrace(name, request_id)
+    token = _trace.set(trace)
+    try:
+        with logger.contextualize(request_id=trace.request_id):
+            yield trace
+    except BaseException as err:
+        trace.error = err.__class__.__name__
+        raise
+    finally:
+        _trace.reset(token)
+        trace.duration = time.perf_counter() - trace.start
+        metrics.observe(f"{name}.seconds", trace.duration)
+        if _exporter is not None:
+            try:
+                _exporter.export(trace)
+            except Exception as err:
+                logger.error(f"{err.__class__} Exception occured while exporting a trace. {err}")
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the block as a span of the current request. The yielded dict may be
+    filled with attributes (e.g. sizes) to record with it.
+    """
+    if not TELEMETRY_ENABLED:
+        yield attributes
+        return
+
+    trace = _trace.get()
+    token = _span.set(name)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attributes
+    except Exception as err:
+        status = err.__class__.__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _span.reset(token)
+        metrics.observe(f"{name}.seconds", duration)
+        if trace is not None:
+            trace.add_span({
+                "name": name,
+                "parent": _span.get(),
+                "start": start - trace.start,
+                "duration": duration,
+                "status": status,
+                **attributes
+            })
+
+def traced(name, func):
+    """
+    Wrap a sync or async single-argument callable, e.g. a graph node, so each
+    call is recorded as a span
+    """
+    if inspect.iscoroutinefunction(func):
+        async def async_wrapper(state):
+            with span(name):
+                return await func(state)
+        return async_wrapper
+
+    def wrapper(state):
+        with span(name):
+            return func(state)
+    return wrapper
+
+def increment(name, value=1):
+    """
+    Add to a counter, both process-wide and on the current request
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    metrics.increment(name, value)
+    trace = _trace.get()
+    if trace is not None:
+        trace.increment(name, value)
+
+def observe(name, value):
+    """
+    Record a value such as a retrieval size in its histogram, and add it to
+    the current request's counters
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    metrics.observe(name, value)
+    trace = _trace.get()
+    if trace is not None:
+        trace.increment(name, value)
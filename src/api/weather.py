@@ -1,42 +1,358 @@
+import asyncio
+import contextvars
+import httpx
+import math
 import requests
+import threading
 
-from config import OPENWEATHER_API_KEY, logger
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from config import (
+    OPENWEATHER_API_KEY,
+    WEATHER_CACHE_TTL,
+    WEATHER_CACHE_MAX_ENTRIES,
+    WEATHER_HTTP_POOL_SIZE,
+    WEATHER_TIMEOUT,
+    WEATHER_STALE_TTL,
+    logger
+)
+
+from src.api.cache import SingleFlight, TTLCache
+from src.api.resilience import acall_upstream, call_upstream, get_breaker
+from src.api.telemetry import increment
+
+
+# OpenWeatherMap accepts at most this many city IDs per group request
+GROUP_SIZE = 20
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
 
 
 class WeatherAPI:
 
-    def __init__(self):
+    def __init__(self, breaker=None, timeout=WEATHER_TIMEOUT):
         self.api_key = OPENWEATHER_API_KEY
         self.base_url = "https://api.openweathermap.org/data/2.5/weather"
-    
-    def get_weather(self, city):
+        self.group_url = "https://api.openweathermap.org/data/2.5/group"
+        self.timeout = timeout
+        self.breaker = breaker or get_breaker("openweathermap")
+        self.cache = TTLCache(max_entries=WEATHER_CACHE_MAX_ENTRIES, ttl=WEATHER_CACHE_TTL, stale_ttl=WEATHER_STALE_TTL)
+        self.city_ids = TTLCache(max_entries=WEATHER_CACHE_MAX_ENTRIES, ttl=math.inf)
+        self._flight = SingleFlight()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=WEATHER_HTTP_POOL_SIZE, pool_maxsize=WEATHER_HTTP_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # An httpx.AsyncClient can only be used and closed on the event loop
+        # it was first used on, so there is one per loop
+        self._async_clients = {}
+        self._async_clients_lock = threading.Lock()
+
+    @staticmethod
+    def normalize_city(city):
+        """
+        Normalize a city name into a cache key
+        """
+        return " ".join(str(city).split()).casefold()
+
+    def _build_params(self, city=None, ids=None):
         """
-        Fetch weather data for a given city
+        Build the query parameters for a city lookup, or a group lookup by city IDs
         """
         if not self.api_key:
             raise ValueError("OpenWeatherMap API key is not set")
-        
-        params = {
-            "q": city,
+
+        params = {"q": city} if ids is None else {"id": ",".join(str(city_id) for city_id in ids)}
+        params.update({
             "appid": self.api_key,
             "units": "metric"
-        }
-        
+        })
+        return params
+
+    def get_weather(self, city):
+        """
+        Fetch weather data for a given city, served from cache when fresh.
+        Concurrent misses for the same city share one upstream call.
+        """
+        params = self._build_params(city)
+        key = self.normalize_city(city)
+
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        return self._flight.do(key, lambda: self._fetch_weather(key, params))
+
+    def _cached(self, key):
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug("Weather cache hit for {}", key)
+        increment("weather_cache.miss" if cached is None else "weather_cache.hit")
+        return cached
+
+    def _fetch_weather(self, key, params):
+        def request(timeout):
+            response = self.session.get(self.base_url, params=params, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+        try:
+            data = call_upstream(request, self.breaker, timeout=self.timeout)
+        except Exception as err:
+            return self._fallback(key, err)
+
+        self._store(key, data)
+        return data
+
+    def _store(self, key, data):
+        self.cache.set(key, data)
+        if "id" in data:
+            self.city_ids.set(key, data["id"])
+
+    def _fallback(self, key, err):
+        """
+        Serve the last known weather for a city when the upstream fails or its
+        circuit is open, or an error if there is none
+        """
+        stale = self.cache.get_stale(key)
+        if stale is not None:
+            logger.warning("Serving stale weather for {}: {}", key, err)
+            return stale
+
+        logger.error("Exception occured while calling weather api: {}", err)
+        return {"error": str(err)}
+
+    def _get_async_client(self):
+        """
+        Return the pooled async HTTP client bound to the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_clients_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                # A client whose loop has ended can no longer be closed on it;
+                # drop it so its connections are finalized with it
+                for other in [other for other in self._async_clients if other.is_closed()]:
+                    logger.debug("Dropping async weather client of a closed event loop")
+                    del self._async_clients[other]
+                client = self._async_clients[loop] = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+                )
+        return client
+
+    @staticmethod
+    def _close_async_client(loop, client):
+        """
+        Close an async client from outside its event loop: on that loop while
+        it is still open, else best effort, as its connections may be bound
+        to the closed loop
+        """
+        try:
+            if loop.is_closed():
+                asyncio.run(client.aclose())
+            elif loop is _running_loop():
+                # Called from synchronous code on the loop itself, which cannot be blocked on
+                loop.create_task(client.aclose())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=WEATHER_TIMEOUT)
+            else:
+                loop.run_until_complete(client.aclose())
+        except Exception as err:
+            logger.warning(f"Could not close async weather client cleanly: {err}")
+
+    async def aget_weather(self, city):
+        """
+        Fetch weather data for a given city without blocking the event loop,
+        sharing the cache and request coalescing with get_weather
+        """
+        params = self._build_params(city)
+        key = self.normalize_city(city)
+
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        return await self._flight.ado(key, lambda: self._afetch_weather(key, params))
+
+    async def _afetch_weather(self, key, params):
+        async def request(timeout):
+            response = await self._get_async_client().get(self.base_url, params=params, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+        try:
+            data = await acall_upstream(request, self.breaker, timeout=self.timeout)
+        except Exception as err:
+            return self._fallback(key, err)
+
+        self._store(key, data)
+        return data
+
+    def _plan_many(self, cities):
+        """
+        Split the distinct cities into cache hits, groups of misses with known
+        city IDs, and misses that need a lookup by name
+        """
+        if not self.api_key:
+            raise ValueError("OpenWeatherMap API key is not set")
+
+        found, grouped, by_name = {}, {}, {}
+        for city in cities:
+            key = self.normalize_city(city)
+            if key in found or key in grouped or key in by_name:
+                continue
+            cached = self._cached(key)
+            if cached is not None:
+                found[key] = cached
+            elif (city_id := self.city_ids.get(key)) is not None:
+                grouped[key] = city_id
+            else:
+                by_name[key] = city
+
+        keys = list(grouped)
+        groups = [{key: grouped[key] for key in keys[start:start + GROUP_SIZE]} for start in range(0, len(keys), GROUP_SIZE)]
+        return found, groups, by_name
+
+    def _group_results(self, group, data):
+        """
+        Match a group response back to the cities asked for
+        """
+        by_id = {item["id"]: item for item in data.get("list", [])}
+        results = {}
+        for key, city_id in group.items():
+            if city_id in by_id:
+                self._store(key, by_id[city_id])
+                results[key] = by_id[city_id]
+            else:
+                results[key] = self._fallback(key, f"city {city_id} missing from group response")
+        return results
+
+    def _fetch_group(self, group):
+        def request(timeout):
+            response = self.session.get(self.group_url, params=self._build_params(ids=group.values()), timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
         try:
-            response = requests.get(self.base_url, params=params)
+            data = call_upstream(request, self.breaker, timeout=self.timeout)
+        except Exception as err:
+            return {key: self._fallback(key, err) for key in group}
+        return self._group_results(group, data)
+
+    async def _afetch_group(self, group):
+        async def request(timeout):
+            response = await self._get_async_client().get(
+                self.group_url, params=self._build_params(ids=group.values()), timeout=timeout
+            )
             response.raise_for_status()
             return response.json()
+
+        try:
+            data = await acall_upstream(request, self.breaker, timeout=self.timeout)
         except Exception as err:
-            logger.error(f"Exception occured while calling weatehr api: {err}")
-            return {"error": str(err)}
-    
+            return {key: self._fallback(key, err) for key in group}
+        return self._group_results(group, data)
+
+    def get_weather_many(self, cities):
+        """
+        Fetch weather data for several cities in one round trip, in order.
+        Fresh cities come from cache, cities whose IDs are known share group
+        requests, and the rest are looked up by name concurrently.
+        """
+        found, groups, by_name = self._plan_many(cities)
+
+        def fetch_named(key, city):
+            params = self._build_params(city)
+            return {key: self._flight.do(key, lambda: self._fetch_weather(key, params))}
+
+        calls = [(self._fetch_group, (group,)) for group in groups]
+        calls += [(fetch_named, item) for item in by_name.items()]
+        if len(calls) == 1:
+            fn, args = calls[0]
+            found.update(fn(*args))
+        elif calls:
+            logger.debug("Fetching weather for {} cities by name and {} groups concurrently", len(by_name), len(groups))
+            with ThreadPoolExecutor(max_workers=min(len(calls), WEATHER_HTTP_POOL_SIZE)) as executor:
+                # Each call runs in a copy of this context so the request deadline applies
+                futures = [executor.submit(contextvars.copy_context().run, fn, *args) for fn, args in calls]
+                for future in futures:
+                    found.update(future.result())
+
+        return [found[self.normalize_city(city)] for city in cities]
+
+    async def aget_weather_many(self, cities):
+        """
+        Async variant of ``get_weather_many``
+        """
+        found, groups, by_name = self._plan_many(cities)
+
+        async def fetch_named(key, city):
+            params = self._build_params(city)
+            return await self._flight.ado(key, lambda: self._afetch_weather(key, params))
+
+        results = await asyncio.gather(
+            *(self._afetch_group(group) for group in groups),
+            *(fetch_named(key, city) for key, city in by_name.items())
+        )
+        for group in results[:len(groups)]:
+            found.update(group)
+        found.update(zip(by_name, results[len(groups):]))
+
+        return [found[self.normalize_city(city)] for city in cities]
+
+    def cache_stats(self):
+        """
+        Return cache hit/miss/eviction counters and the number of coalesced calls
+        """
+        stats = self.cache.stats()
+        stats["coalesced"] = self._flight.coalesced
+        return stats
+
+    async def aclose(self):
+        """
+        Close the pooled async HTTP clients, the running loop's one in place
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_clients_lock:
+            clients, self._async_clients = self._async_clients, {}
+
+        current = clients.pop(loop, None)
+        if current is not None:
+            await current.aclose()
+        for other, client in clients.items():
+            await asyncio.to_thread(self._close_async_client, other, client)
+
+    def close(self):
+        """
+        Release pooled connections held by the clients
+        """
+        self.session.close()
+        with self._async_clients_lock:
+            clients, self._async_clients = self._async_clients, {}
+        for loop, client in clients.items():
+            self._close_async_client(loop, client)
+
+    def format_weather_reports(self, reports):
+        """
+        Format the weather data for one or more cities into one context
+        """
+        if not reports:
+            return "Error: no city was given"
+        return "\n".join(self.format_weather_data(data) for data in reports)
+
     def format_weather_data(self, data):
         """
         Format the weather data into a readable format
         """
         if "error" in data:
             return f"Error: {data['error']}"
-        
+
         city = data["name"]
         country = data["sys"]["country"]
         temp = data["main"]["temp"]
@@ -44,7 +360,7 @@ class WeatherAPI:
         humidity = data["main"]["humidity"]
         wind_speed = data["wind"]["speed"]
         description = data["weather"][0]["description"]
-        
+
         formatted_data = f"""
         Weather in {city}, {country}:
         - Temperature: {temp}°C
@@ -53,5 +369,5 @@ class WeatherAPI:
         - Wind speed: {wind_speed} m/s
         - Conditions: {description}
         """
-        
-        return formatted_data
\ No newline at end of file
+
+        return formatted_data
@@ -0,0 +1,266 @@
+import threading
+import time
+import uuid
+
+from sqlalchemy import Column, Integer, String, Float, Table, Text, select, update
+
+from src.document.manifest import hash_file
+from src.document.store import create_local_engine, metadata
+
+from config import QDRANT_COLLECTION_NAME, INGEST_JOB_WORKERS, INGEST_JOB_POLL_INTERVAL, INGEST_JOB_STALE_AFTER, logger
+
+
+ingestion_jobs = Table(
+    "ingestion_jobs",
+    metadata,
+    Column("id", String(32), primary_key=True),
+    Column("filename", String, nullable=False),
+    Column("filepath", String, nullable=False),
+    Column("collection_name", String, nullable=False),
+    Column("status", String(16), nullable=False, index=True),
+    Column("total_pages", Integer, nullable=False, default=0),
+    Column("pages_parsed", Integer, nullable=False, default=0),
+    Column("chunks_embedded", Integer, nullable=False, default=0),
+    Column("points_upserted", Integer, nullable=False, default=0),
+    Column("error", Text),
+    Column("created_at", Float, nullable=False, index=True),
+    Column("updated_at", Float, nullable=False)
+)
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("succeeded", "skipped", "failed")
+
+
+class IngestionJobQueue:
+    """
+    Persistent ingestion job queue backed by the local SQLite store.
+
+    Submitting a job only records it; a pool of worker threads claims queued
+    jobs, runs them through the IngestionPipeline and writes progress back to
+    the job row so any session (or process) can poll it. Jobs left running by
+    a crashed process (no progress for ``stale_after`` seconds) are requeued
+    on start and by periodic checks while the workers run.
+
+    With a manifest, jobs are incremental: files whose content is already
+    indexed are skipped, and only chunks that changed since the file was last
+    indexed are embedded.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        manifest=None,
+        engine=None,
+        workers=INGEST_JOB_WORKERS,
+        poll_interval=INGEST_JOB_POLL_INTERVAL,
+        stale_after=INGEST_JOB_STALE_AFTER
+    ):
+        self.pipeline = pipeline
+        self.manifest = manifest
+        self.engine = engine or create_local_engine()
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._completion_listeners = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._next_stale_check = 0.0
+        self._running = set()
+        metadata.create_all(self.engine, tables=[ingestion_jobs])
+
+    def add_completion_listener(self, listener):
+        """
+        Register a callback invoked with the job dict after a job succeeds
+        """
+        self._completion_listeners.append(listener)
+
+    def start(self):
+        """
+        Requeue interrupted jobs and start the worker threads
+        """
+        if self._threads:
+            return self
+
+        self._requeue_stale()
+
+        self._stopping.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingestion-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stop the workers after their current job finishes
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, filepath, filename, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Queue a file for ingestion and return the job ID immediately
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.engine.begin() as connection:
+            connection.execute(ingestion_jobs.insert().values(
+                id=job_id,
+                filename=filename,
+                filepath=filepath,
+                collection_name=collection_name,
+                status="queued",
+                created_at=now,
+                updated_at=now
+            ))
+        logger.debug("Queued ingestion job {} for {}", job_id, filename)
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Return the job as a dict, or None if unknown
+        """
+        with self.engine.connect() as connection:
+            row = connection.execute(select(ingestion_jobs).where(ingestion_jobs.c.id == job_id)).mappings().first()
+        return dict(row) if row else None
+
+    def list_jobs(self, statuses=None, limit=50):
+        """
+        Return the most recent jobs, optionally filtered by status
+        """
+        query = select(ingestion_jobs).order_by(ingestion_jobs.c.created_at.desc()).limit(limit)
+        if statuses:
+            query = query.where(ingestion_jobs.c.status.in_(statuses))
+        with self.engine.connect() as connection:
+            return [dict(row) for row in connection.execute(query).mappings()]
+
+    def _requeue_stale(self):
+        """
+        Requeue running jobs that made no progress for ``stale_after`` seconds,
+        i.e. were interrupted by a crash or restart, except this queue's own
+        """
+        self._next_stale_check = time.monotonic() + self.stale_after / 2
+        with self.engine.begin() as connection:
+            requeued = connection.execute(
+                update(ingestion_jobs)
+                .where(
+                    ingestion_jobs.c.status == "running",
+                    ingestion_jobs.c.updated_at < time.time() - self.stale_after,
+                    ingestion_jobs.c.id.notin_(list(self._running))
+                )
+                .values(status="queued", updated_at=time.time())
+            ).rowcount
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale ingestion jobs")
+            self._wakeup.set()
+
+    def _claim(self):
+        with self.engine.begin() as connection:
+            while True:
+                job_id = connection.execute(
+                    select(ingestion_jobs.c.id)
+                    .where(ingestion_jobs.c.status == "queued")
+                    .order_by(ingestion_jobs.c.created_at)
+                    .limit(1)
+                ).scalar()
+                if job_id is None:
+                    return None
+
+                claimed = connection.execute(
+                    update(ingestion_jobs)
+                    .where(ingestion_jobs.c.id == job_id, ingestion_jobs.c.status == "queued")
+                    .values(status="running", updated_at=time.time())
+                ).rowcount
+                if claimed:
+                    return job_id
+
+    def _update(self, job_id, **values):
+        values["updated_at"] = time.time()
+        with self.engine.begin() as connection:
+            connection.execute(update(ingestion_jobs).where(ingestion_jobs.c.id == job_id).values(**values))
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                # Jobs of an instance that stopped after this one started only
+                # become stale later, so keep checking while running
+                if time.monotonic() >= self._next_stale_check:
+                    self._requeue_stale()
+                job_id = self._claim()
+            except Exception as err:
+                logger.error(f"{err.__class__} Exception occured while claiming ingestion job. {err}")
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._running.add(job_id)
+            try:
+                self._run(job_id)
+            finally:
+                self._running.discard(job_id)
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        logger.debug("Running ingestion job {} for {}", job_id, job["filename"])
+
+        last_update = [0.0]
+
+        def progress(stats, force=False):
+            now = time.monotonic()
+            if not force and now - last_update[0] < 0.5:
+                return
+            last_update[0] = now
+            self._update(job_id, **{
+                key: stats[key]
+                for key in ("total_pages", "pages_parsed", "chunks_embedded", "points_upserted")
+                if key in stats
+            })
+
+        try:
+            file_hash = hash_file(job["filepath"])
+            existing_chunks, replace_source = {}, False
+            if self.manifest is not None:
+                duplicate = self.manifest.find_by_hash(file_hash, job["collection_name"])
+                if duplicate is not None:
+                    logger.debug("{} has the same content as {}, skipping", job["filename"], duplicate)
+                    self._update(job_id, status="skipped", error=f"Same content as {duplicate}")
+                    return
+
+                entry = self.manifest.get(job["filename"], job["collection_name"])
+                if entry is not None:
+                    existing_chunks = entry["chunks"]
+                    # Entries imported from the legacy JSON have no chunk map,
+                    # so their points can only be found by source
+                    replace_source = not existing_chunks
+
+            stats = self.pipeline.ingest(
+                job["filepath"],
+                collection_name=job["collection_name"],
+                progress_callback=progress,
+                existing_chunks=existing_chunks,
+                replace_source=replace_source
+            )
+            progress(stats, force=True)
+
+            if self.manifest is not None:
+                self.manifest.record(job["filename"], file_hash, stats["chunks"], job["collection_name"])
+            self._update(job_id, status="succeeded")
+        except Exception as err:
+            logger.error(f"{err.__class__} Exception occured in ingestion job {job_id}. {err}")
+            self._update(job_id, status="failed", error=str(err))
+            return
+
+        job = self.get(job_id)
+        for listener in self._completion_listeners:
+            try:
+                listener(job)
+            except Exception as err:
+                logger.error(f"{err.__class__} Exception occured in ingestion completion listener. {err}")
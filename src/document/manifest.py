@@ -0,0 +1,284 @@
+import os
+import json
+import hashlib
+import threading
+
+from sqlalchemy import Column, Integer, String, Table, delete, func, inspect, insert, select, text, update
+
+from config import logger, PROCESSED_FILE_PATH, PDF_DIRECTORY, QDRANT_COLLECTION_NAME
+
+from src.document.store import create_local_engine, metadata
+
+
+manifest_files = Table(
+    "manifest_files",
+    metadata,
+    Column("filename", String, primary_key=True),
+    Column("collection_name", String, primary_key=True),
+    Column("file_hash", String(64), index=True)
+)
+
+manifest_chunks = Table(
+    "manifest_chunks",
+    metadata,
+    Column("filename", String, primary_key=True),
+    Column("collection_name", String, primary_key=True),
+    Column("chunk_hash", String(64), primary_key=True),
+    Column("point_id", String(36), nullable=False)
+)
+
+manifest_state = Table(
+    "manifest_state",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False),
+    Column("legacy_imported", Integer, nullable=False)
+)
+
+
+def hash_bytes(data):
+    """
+    Content hash of an in-memory file
+    """
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(filepath, block_size=1 << 20):
+    """
+    Content hash of a file on disk, read in blocks
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_chunk(chunk):
+    """
+    Identity of a chunk: its page plus its text
+    """
+    page = chunk.metadata.get("page", "")
+    return hashlib.sha256(f"{page}\0{chunk.page_content}".encode("utf-8")).hexdigest()
+
+
+class FileManifest:
+    """
+    Record of indexed files in the local SQLite store, per file and
+    collection: the content hash of the file and, per chunk hash, the vector
+    store point ID it was stored under. Lets re-ingestion embed only changed chunks, delete vanished ones
+    and skip files whose content is already indexed under another name.
+
+    Every write bumps a version counter in the same transaction, so
+    ``list_files`` can serve a cached listing after one cheap version query
+    and one stat of the data directory.
+    """
+
+    def __init__(self, engine=None, data_directory=PDF_DIRECTORY or "data", legacy_path=PROCESSED_FILE_PATH):
+        self.engine = engine or create_local_engine()
+        self.data_directory = data_directory
+        self._lock = threading.Lock()
+        # (cache key, filenames) per collection
+        self._cached_files = {}
+        self._migrate()
+        metadata.create_all(self.engine, tables=[manifest_files, manifest_chunks, manifest_state])
+        self._import_legacy(legacy_path)
+
+    def _migrate(self):
+        """
+        Re-key tables created when entries were keyed on the filename alone,
+        filing entries without a collection under the default one
+        """
+        if not inspect(self.engine).has_table("manifest_files"):
+            return
+        primary_key = inspect(self.engine).get_pk_constraint("manifest_files")["constrained_columns"]
+        if "collection_name" in primary_key:
+            return
+
+        logger.info("Migrating the file manifest to per-collection entries")
+        with self.engine.begin() as connection:
+            connection.execute(text("DROP INDEX IF EXISTS ix_manifest_files_file_hash"))
+            connection.execute(text("ALTER TABLE manifest_files RENAME TO manifest_files_v1"))
+            connection.execute(text("ALTER TABLE manifest_chunks RENAME TO manifest_chunks_v1"))
+            metadata.create_all(connection, tables=[manifest_files, manifest_chunks])
+            connection.execute(text(
+                "INSERT INTO manifest_files (filename, collection_name, file_hash) "
+                "SELECT filename, COALESCE(collection_name, :default), file_hash FROM manifest_files_v1"
+            ), {"default": QDRANT_COLLECTION_NAME})
+            connection.execute(text(
+                "INSERT INTO manifest_chunks (filename, collection_name, chunk_hash, point_id) "
+                "SELECT c.filename, COALESCE(f.collection_name, :default), c.chunk_hash, c.point_id "
+                "FROM manifest_chunks_v1 c JOIN manifest_files_v1 f ON f.filename = c.filename"
+            ), {"default": QDRANT_COLLECTION_NAME})
+            connection.execute(text("DROP TABLE manifest_chunks_v1"))
+            connection.execute(text("DROP TABLE manifest_files_v1"))
+
+    def _import_legacy(self, legacy_path):
+        with self.engine.begin() as connection:
+            state = connection.execute(select(manifest_state).where(manifest_state.c.id == 1)).mappings().first()
+            if state is None:
+                connection.execute(insert(manifest_state).values(id=1, version=0, legacy_imported=0))
+            elif state["legacy_imported"]:
+                return
+
+            files = self._read_legacy(legacy_path)
+            if files:
+                logger.debug("Importing {} entries from {}", len(files), legacy_path)
+            for filename, entry in files.items():
+                self._write_entry(
+                    connection,
+                    filename,
+                    entry.get("file_hash"),
+                    entry.get("chunks") or {},
+                    entry.get("collection_name") or QDRANT_COLLECTION_NAME
+                )
+            connection.execute(
+                update(manifest_state).where(manifest_state.c.id == 1)
+                .values(legacy_imported=1, version=manifest_state.c.version + 1)
+            )
+
+    @staticmethod
+    def _read_legacy(legacy_path):
+        if not legacy_path or not os.path.exists(legacy_path):
+            return {}
+
+        with open(legacy_path, "r") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning("Processed file tracking JSON was empty or malformed. Skipping import.")
+                return {}
+
+        if isinstance(data, list):
+            return {filename: {} for filename in data}
+        return data.get("files", {})
+
+    @staticmethod
+    def _entry_key(table, filename, collection_name):
+        return (table.c.filename == filename, table.c.collection_name == collection_name)
+
+    @classmethod
+    def _delete_entry(cls, connection, filename, collection_name):
+        connection.execute(delete(manifest_chunks).where(*cls._entry_key(manifest_chunks, filename, collection_name)))
+        connection.execute(delete(manifest_files).where(*cls._entry_key(manifest_files, filename, collection_name)))
+
+    @classmethod
+    def _write_entry(cls, connection, filename, file_hash, chunks, collection_name):
+        cls._delete_entry(connection, filename, collection_name)
+        connection.execute(insert(manifest_files).values(
+            filename=filename, file_hash=file_hash, collection_name=collection_name
+        ))
+        if chunks:
+            connection.execute(insert(manifest_chunks), [
+                {"filename": filename, "collection_name": collection_name, "chunk_hash": chunk_hash, "point_id": point_id}
+                for chunk_hash, point_id in chunks.items()
+            ])
+
+    @staticmethod
+    def _bump_version(connection):
+        connection.execute(
+            update(manifest_state).where(manifest_state.c.id == 1).values(version=manifest_state.c.version + 1)
+        )
+
+    def version(self):
+        """
+        Return the manifest version; it changes whenever the manifest is written
+        """
+        with self.engine.connect() as connection:
+            return connection.execute(select(manifest_state.c.version).where(manifest_state.c.id == 1)).scalar()
+
+    def _directory_stamp(self):
+        try:
+            return os.stat(self.data_directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def list_files(self, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Return files indexed in the collection that still exist in the data
+        directory, dropping entries for missing files. Served from cache
+        unless the manifest or the data directory changed since the last call.
+        """
+        cache_key = (self.version(), self._directory_stamp())
+        with self._lock:
+            cached = self._cached_files.get(collection_name)
+            if cached is not None and cached[0] == cache_key:
+                return list(cached[1])
+
+        with self.engine.connect() as connection:
+            filenames = connection.execute(
+                select(manifest_files.c.filename)
+                .where(manifest_files.c.collection_name == collection_name)
+                .order_by(manifest_files.c.filename)
+            ).scalars().all()
+
+        missing = [
+            filename for filename in filenames
+            if not os.path.exists(os.path.join(self.data_directory, filename))
+        ]
+        if missing:
+            logger.debug("Dropping {} manifest entries for missing files", len(missing))
+            with self.engine.begin() as connection:
+                for filename in missing:
+                    self._delete_entry(connection, filename, collection_name)
+                self._bump_version(connection)
+            cache_key = (self.version(), self._directory_stamp())
+
+        files = [filename for filename in filenames if filename not in missing]
+        with self._lock:
+            self._cached_files[collection_name] = (cache_key, files)
+        return list(files)
+
+    def get(self, filename, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Return the manifest entry for a file in the collection, or None
+        """
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                select(manifest_files).where(*self._entry_key(manifest_files, filename, collection_name))
+            ).mappings().first()
+            if row is None:
+                return None
+            chunks = connection.execute(
+                select(manifest_chunks.c.chunk_hash, manifest_chunks.c.point_id)
+                .where(*self._entry_key(manifest_chunks, filename, collection_name))
+            ).all()
+        return {
+            "file_hash": row["file_hash"],
+            "collection_name": row["collection_name"],
+            "chunks": {chunk_hash: point_id for chunk_hash, point_id in chunks}
+        }
+
+    def find_by_hash(self, file_hash, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Return the name of a file with this content hash indexed in the
+        collection, or None
+        """
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(manifest_files.c.filename)
+                .where(manifest_files.c.file_hash == file_hash, manifest_files.c.collection_name == collection_name)
+                .limit(1)
+            ).scalar()
+
+    def record(self, filename, file_hash, chunks, collection_name):
+        """
+        Atomically replace the file hash and chunk-hash -> point ID map for a
+        file in the collection
+        """
+        with self.engine.begin() as connection:
+            self._write_entry(connection, filename, file_hash, chunks, collection_name)
+            self._bump_version(connection)
+
+    def remove(self, filename, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Forget a file in the collection
+        """
+        with self.engine.begin() as connection:
+            self._delete_entry(connection, filename, collection_name)
+            self._bump_version(connection)
+
+    def count_chunks(self):
+        """
+        Return the number of chunks tracked across all files
+        """
+        with self.engine.connect() as connection:
+            return connection.execute(select(func.count()).select_from(manifest_chunks)).scalar()
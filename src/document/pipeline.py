@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langchain_core.documents import Document
+from pypdf import PdfReader
+
+from config import (
+    QDRANT_COLLECTION_NAME,
+    INGEST_PARSE_WORKERS,
+    INGEST_PAGES_PER_TASK,
+    INGEST_EMBED_WORKERS,
+    INGEST_BATCH_SIZE,
+    INGEST_MAX_PENDING_BATCHES,
+    logger
+)
+
+from src.document.manifest import hash_chunk
+from src.document.processor import DocumentProcessor
+
+
+def parse_pages(filepath, start, stop):
+    """
+    Extract the text of pages [start, stop) of a PDF; runs in a worker process
+    """
+    reader = PdfReader(filepath)
+    return [(number, reader.pages[number].extract_text()) for number in range(start, stop)]
+
+
+class IngestionPipeline:
+    """
+    Streaming PDF ingestion: pages are parsed in a process pool, chunked as
+    they arrive, embedded in concurrent fixed-size batches and bulk upserted,
+    with a bound on in-flight batches so memory stays flat for large files.
+    """
+
+    def __init__(
+        self,
+        vector_db,
+        processor=None,
+        parse_workers=INGEST_PARSE_WORKERS,
+        pages_per_task=INGEST_PAGES_PER_TASK,
+        embed_workers=INGEST_EMBED_WORKERS,
+        batch_size=INGEST_BATCH_SIZE,
+        max_pending_batches=INGEST_MAX_PENDING_BATCHES
+    ):
+        self.vector_db = vector_db
+        self.processor = processor or DocumentProcessor()
+        self.parse_workers = parse_workers
+        self.pages_per_task = pages_per_task
+        self.embed_workers = embed_workers
+        self.batch_size = batch_size
+        self.max_pending_batches = max_pending_batches
+
+    def count_pages(self, filepath):
+        """
+        Return the number of pages in a PDF without extracting any text
+        """
+        return len(PdfReader(filepath).pages)
+
+    def iter_pages(self, filepath, total_pages=None):
+        """
+        Yield (page_number, text) for every page, parsing ranges in parallel
+        """
+        if total_pages is None:
+            total_pages = self.count_pages(filepath)
+        ranges = [
+            (start, min(start + self.pages_per_task, total_pages))
+            for start in range(0, total_pages, self.pages_per_task)
+        ]
+
+        if self.parse_workers <= 1 or len(ranges) <= 1:
+            for start, stop in ranges:
+                yield from parse_pages(filepath, start, stop)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+            pending = set()
+            ranges = iter(ranges)
+            for start, stop in ranges:
+                pending.add(executor.submit(parse_pages, filepath, start, stop))
+                if len(pending) >= self.parse_workers * 2:
+                    break
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+                    next_range = next(ranges, None)
+                    if next_range is not None:
+                        pending.add(executor.submit(parse_pages, filepath, *next_range))
+
+    @staticmethod
+    def point_id(source, chunk_hash):
+        """
+        Deterministic point ID for a chunk of a given source file
+        """
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}#{chunk_hash}"))
+
+    def ingest(self, filepath, collection_name=QDRANT_COLLECTION_NAME, progress_callback=None, existing_chunks=None, replace_source=False):
+        """
+        Ingest a PDF into the collection and return the ingestion statistics.
+
+        ``existing_chunks`` maps chunk hashes already indexed for this file to
+        their point IDs: those chunks are neither re-embedded nor re-upserted,
+        and any of them missing from the new version are deleted. The returned
+        ``chunks`` map is the file's new chunk hash -> point ID index.
+
+        With ``replace_source``, every point already stored for the file is
+        deleted first, for files indexed before their chunks were tracked.
+        """
+        started = time.perf_counter()
+        existing_chunks = existing_chunks or {}
+        source = os.path.basename(filepath)
+        stats = {
+            "total_pages": self.count_pages(filepath),
+            "pages_parsed": 0,
+            "chunks_embedded": 0,
+            "chunks_skipped": 0,
+            "points_upserted": 0,
+            "points_deleted": 0,
+            "chunks": {}
+        }
+        stats_lock = threading.Lock()
+        slots = threading.BoundedSemaphore(self.max_pending_batches)
+
+        def report():
+            if progress_callback is not None:
+                progress_callback({key: value for key, value in stats.items() if key != "chunks"})
+
+        def embed_and_upsert(batch):
+            try:
+                chunks = [chunk for chunk, _ in batch]
+                vectors = self.vector_db.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+                with stats_lock:
+                    stats["chunks_embedded"] += len(batch)
+
+                ids = self.vector_db.upsert_embeddings(
+                    [chunk.page_content for chunk in chunks],
+                    [chunk.metadata for chunk in chunks],
+                    vectors,
+                    collection_name=collection_name,
+                    ids=[point_id for _, point_id in batch]
+                )
+                with stats_lock:
+                    stats["points_upserted"] += len(ids)
+                    report()
+            finally:
+                slots.release()
+
+        logger.debug("Create collection if does not exist")
+        self.vector_db.create_collection_if_not_exists(collection_name)
+
+        if replace_source:
+            stats["points_deleted"] = self.vector_db.delete_source(filepath, collection_name=collection_name)
+            logger.debug("Deleted {} untracked points of {}", stats["points_deleted"], source)
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.embed_workers) as executor:
+            batch = []
+            for page_number, text in self.iter_pages(filepath, stats["total_pages"]):
+                page = Document(page_content=text or "", metadata={"source": filepath, "page": page_number})
+                with stats_lock:
+                    stats["pages_parsed"] += 1
+                    report()
+
+                for chunk in self.processor.split_documents([page]):
+                    chunk_hash = hash_chunk(chunk)
+                    if chunk_hash in stats["chunks"]:
+                        continue
+                    if chunk_hash in existing_chunks:
+                        stats["chunks"][chunk_hash] = existing_chunks[chunk_hash]
+                        stats["chunks_skipped"] += 1
+                        continue
+
+                    stats["chunks"][chunk_hash] = self.point_id(source, chunk_hash)
+                    batch.append((chunk, stats["chunks"][chunk_hash]))
+                    if len(batch) >= self.batch_size:
+                        slots.acquire()
+                        futures.append(executor.submit(embed_and_upsert, batch))
+                        batch = []
+
+            if batch:
+                slots.acquire()
+                futures.append(executor.submit(embed_and_upsert, batch))
+
+        for future in futures:
+            future.result()
+
+        vanished = [point_id for chunk_hash, point_id in existing_chunks.items() if chunk_hash not in stats["chunks"]]
+        if vanished:
+            logger.debug("Deleting {} vanished chunks", len(vanished))
+            self.vector_db.delete_points(vanished, collection_name=collection_name)
+            stats["points_deleted"] += len(vanished)
+
+        if stats["points_upserted"] or stats["points_deleted"]:
+            self.vector_db.notify_ingest(collection_name)
+
+        stats["seconds"] = time.perf_counter() - started
+        logger.debug("Ingested {} chunks from {} pages", stats["points_upserted"], stats["pages_parsed"])
+        return stats
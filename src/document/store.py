@@ -0,0 +1,22 @@
+from sqlalchemy import MetaData, create_engine, event
+
+from config import LOCAL_DB_URL
+
+
+metadata = MetaData()
+
+
+def create_local_engine(url=LOCAL_DB_URL):
+    """
+    Create a SQLAlchemy engine for the local SQLite store, shareable across threads
+    """
+    engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(connection, _):
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    return engine
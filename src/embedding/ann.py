@@ -0,0 +1,228 @@
+import os
+
+import numpy as np
+
+from config import (
+    LOCAL_VECTOR_QUANTIZATION,
+    LOCAL_VECTOR_BLOCK_ROWS,
+    IVF_NLIST,
+    IVF_NPROBE,
+    IVF_MIN_TRAIN_SIZE,
+    IVF_RETRAIN_GROWTH,
+    IVF_COMPACT_RATIO,
+    logger
+)
+
+from src.embedding.local_index import FlatIndex, normalize_rows, top_k
+
+
+def spherical_kmeans(vectors, nlist, iterations=10, seed=0):
+    """
+    Cluster unit vectors into nlist unit centroids by cosine similarity
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~np.bincount(assignments, minlength=nlist).astype(bool)
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex(FlatIndex):
+    """
+    Inverted-file ANN index on top of the flat memory-mapped matrix.
+
+    Vectors are assigned to the nearest of ``nlist`` k-means centroids and a
+    query only scores the rows of its ``nprobe`` closest lists, trading a
+    little recall for latency that grows with ``nprobe`` instead of the
+    collection size. Small collections are searched exactly until they reach
+    ``min_train_size``; the centroids are retrained whenever the collection
+    has grown by ``retrain_growth`` since the last training.
+
+    Deletes leave tombstones so row numbers stay stable; the matrix is
+    compacted once tombstones exceed ``compact_ratio`` of the rows.
+    """
+
+    def __init__(
+        self,
+        directory,
+        quantization=LOCAL_VECTOR_QUANTIZATION,
+        block_rows=LOCAL_VECTOR_BLOCK_ROWS,
+        nlist=IVF_NLIST,
+        nprobe=IVF_NPROBE,
+        min_train_size=IVF_MIN_TRAIN_SIZE,
+        retrain_growth=IVF_RETRAIN_GROWTH,
+        compact_ratio=IVF_COMPACT_RATIO
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_growth = retrain_growth
+        self.compact_ratio = compact_ratio
+        self._centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists = None
+        self._trained_size = 0
+        super().__init__(directory, quantization, block_rows)
+        self._load_lists()
+
+    @property
+    def _ivf_path(self):
+        return os.path.join(self.directory, "ivf.npz")
+
+    @property
+    def trained(self):
+        return self._centroids is not None
+
+    def _load_lists(self):
+        self._assignments = np.full(len(self._ids), -1, dtype=np.int32)
+        if os.path.exists(self._ivf_path):
+            try:
+                with np.load(self._ivf_path) as stored:
+                    if len(stored["assignments"]) == len(self._ids) and stored["centroids"].shape[1:] == (self.dim,):
+                        self._centroids = stored["centroids"] if len(stored["centroids"]) else None
+                        self._assignments = stored["assignments"].astype(np.int32)
+                        self._trained_size = int(stored["trained_size"])
+                    else:
+                        logger.warning(f"IVF lists at {self.directory} are out of date. Retraining.")
+            except Exception as err:
+                logger.warning(f"IVF lists at {self.directory} are unreadable. Retraining. {err}")
+        self._maybe_train()
+
+    def _assign(self, rows):
+        assignments = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            scores = np.asarray(self._vectors[block], dtype=np.float32) @ self._centroids.T
+            assignments[start:start + len(block)] = np.argmax(scores, axis=1)
+        self._assignments[rows] = assignments
+        self._lists = None
+
+    def _live_rows(self):
+        return np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+
+    def _maybe_train(self):
+        live = len(self._rows)
+        if live < self.min_train_size or (self.trained and live < self.retrain_growth * self._trained_size):
+            return
+
+        nlist = min(self.nlist or int(4 * np.sqrt(live)), live)
+        rows = self._live_rows()
+        sample = np.sort(np.random.default_rng(0).choice(rows, min(len(rows), nlist * 64), replace=False))
+        vectors = self._dequantize(sample)
+
+        logger.debug("Training {} IVF lists on {} of {} vectors", nlist, len(sample), live)
+        self._centroids = spherical_kmeans(vectors, nlist)
+        self._trained_size = live
+        self._assign(rows)
+
+    def _dequantize(self, rows):
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors = normalize_rows(vectors * self._scales[rows][:, None])
+        return vectors
+
+    def upsert(self, ids, vectors, payloads):
+        with self._lock:
+            rows = super().upsert(ids, vectors, payloads)
+            if len(self._assignments) < len(self._ids):
+                grown = np.full(len(self._ids), -1, dtype=np.int32)
+                grown[:len(self._assignments)] = self._assignments
+                self._assignments = grown
+            if self.trained:
+                self._assign(rows)
+            self._maybe_train()
+            return rows
+
+    def delete(self, ids):
+        """
+        Tombstone points; their rows are reclaimed by the next compaction
+        """
+        with self._lock:
+            for point_id in ids:
+                row = self._rows.pop(point_id, None)
+                if row is None:
+                    continue
+                self._ids[row] = None
+                self._payloads[row] = None
+                self._assignments[row] = -1
+            self._lists = None
+
+            if len(self._ids) - len(self._rows) > self.compact_ratio * len(self._ids):
+                self._compact()
+
+    def _compact(self):
+        live = np.flatnonzero(np.array([point_id is not None for point_id in self._ids], dtype=bool))
+        logger.debug("Compacting vector index from {} to {} rows", len(self._ids), len(live))
+
+        # Destinations never pass their sources, so blocks can be moved in place
+        for start in range(0, len(live), self.block_rows):
+            block = live[start:start + self.block_rows]
+            self._vectors[start:start + len(block)] = self._vectors[block]
+            if self._scales is not None:
+                self._scales[start:start + len(block)] = self._scales[block]
+
+        self._ids = [self._ids[row] for row in live]
+        self._payloads = [self._payloads[row] for row in live]
+        self._rows = {point_id: row for row, point_id in enumerate(self._ids)}
+        self._assignments = self._assignments[live]
+        self._lists = None
+
+    def _block_scores(self, queries, start, stop):
+        # Exact search before training: mask tombstoned rows
+        scores = super()._block_scores(queries, start, stop)
+        scores[:, [point_id is None for point_id in self._ids[start:stop]]] = -np.inf
+        return scores
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind="stable")
+            bounds = np.searchsorted(self._assignments[order], np.arange(-1, len(self._centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(1, len(bounds) - 1)]
+        return self._lists
+
+    def search_batch(self, vectors, k):
+        """
+        Return approximately the k best (id, score, payload) hits for each query vector
+        """
+        with self._lock:
+            if not self.trained:
+                return super().search_batch(vectors, k)
+
+            queries = normalize_rows(vectors)
+            lists = self._inverted_lists()
+            probes = top_k(queries @ self._centroids.T, self.nprobe)
+
+            results = []
+            for query, probe in zip(queries, probes):
+                rows = np.concatenate([lists[i] for i in probe])
+                if not len(rows) or k <= 0:
+                    results.append([])
+                    continue
+                scores = self._row_scores(query[None, :], rows)
+                keep = top_k(scores, k)[0]
+                results.append(self._hits(rows[keep], scores[0, keep]))
+            return results
+
+    def flush(self):
+        """
+        Write vectors, payloads, metadata and the inverted lists to disk
+        """
+        with self._lock:
+            super().flush()
+            if self._vectors is None:
+                return
+            tmp_path = f"{self._ivf_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    centroids=self._centroids if self.trained else np.empty((0, self.dim), dtype=np.float32),
+                    assignments=self._assignments[:len(self._ids)],
+                    trained_size=self._trained_size
+                )
+            os.replace(tmp_path, self._ivf_path)
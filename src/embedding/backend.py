@@ -0,0 +1,200 @@
+import asyncio
+import math
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, NamedTuple
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import FieldCondition, Filter, MatchValue, PointIdsList, PointStruct, QueryRequest
+
+from config import QDRANT_URL, QDRANT_TIMEOUT
+
+from src.api.resilience import acall_upstream, call_upstream, get_breaker
+
+
+class SearchHit(NamedTuple):
+
+    id: Any
+    score: float
+    payload: Dict[str, Any]
+
+
+class VectorBackend(ABC):
+    """
+    Storage engine behind VectorDatabase: named collections of vectors with
+    a JSON payload per point, searched by cosine similarity
+    """
+
+    @abstractmethod
+    def collection_exists(self, collection_name) -> bool:
+        ...
+
+    @abstractmethod
+    def create_collection(self, collection_name, dim):
+        ...
+
+    @abstractmethod
+    def upsert(self, collection_name, ids, vectors, payloads):
+        ...
+
+    @abstractmethod
+    def delete(self, collection_name, ids):
+        ...
+
+    @abstractmethod
+    def search(self, collection_name, vector, k) -> List[SearchHit]:
+        ...
+
+    @abstractmethod
+    def find_ids(self, collection_name, payload_key, value) -> List[Any]:
+        """
+        IDs of the points whose payload holds ``value`` at the dotted ``payload_key``
+        """
+
+    def search_batch(self, collection_name, vectors, k) -> List[List[SearchHit]]:
+        """
+        Search several query vectors at once
+        """
+        return [self.search(collection_name, vector, k) for vector in vectors]
+
+    async def asearch(self, collection_name, vector, k) -> List[SearchHit]:
+        """
+        Async variant of ``search``; runs it in a worker thread unless overridden
+        """
+        return await asyncio.to_thread(self.search, collection_name, vector, k)
+
+    def flush(self, collection_name=None):
+        """
+        Persist pending writes; a no-op for backends that write through
+        """
+
+    def close(self):
+        """
+        Release the backend's resources
+        """
+
+    async def aclose(self):
+        """
+        Release the backend's resources from a running event loop
+        """
+        self.close()
+
+
+class QdrantBackend(VectorBackend):
+    """
+    Backend talking to a Qdrant server, with a lazily created async client.
+    Every call goes through the "qdrant" circuit breaker so a failing server
+    is skipped quickly, and transient failures are retried with jittered
+    backoff within the request deadline.
+    """
+
+    def __init__(self, client=None, async_client=None, url=QDRANT_URL, breaker=None, timeout=QDRANT_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.client = client or QdrantClient(url=url, timeout=timeout)
+        self._async_client = async_client
+        self.breaker = breaker or get_breaker("qdrant")
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = AsyncQdrantClient(url=self.url, timeout=self.timeout)
+        return self._async_client
+
+    @staticmethod
+    def _server_timeout(timeout):
+        # Qdrant takes whole seconds for the server-side timeout
+        return max(1, math.ceil(timeout))
+
+    def _call(self, fn):
+        return call_upstream(fn, self.breaker, timeout=self.timeout)
+
+    def collection_exists(self, collection_name):
+        collections = self._call(lambda timeout: self.client.get_collections()).collections
+        return collection_name in [collection.name for collection in collections]
+
+    def create_collection(self, collection_name, dim):
+        self._call(lambda timeout: self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config={
+                "size": dim,
+                "distance": "Cosine"
+            },
+            timeout=self._server_timeout(timeout)
+        ))
+
+    def upsert(self, collection_name, ids, vectors, payloads):
+        points = [
+            PointStruct(id=point_id, vector=list(vector), payload=payload)
+            for point_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        # Upserts by ID and deletes are idempotent, so retrying them is safe
+        self._call(lambda timeout: self.client.upsert(collection_name=collection_name, points=points, wait=True))
+
+    def delete(self, collection_name, ids):
+        self._call(lambda timeout: self.client.delete(
+            collection_name=collection_name,
+            points_selector=PointIdsList(points=list(ids)),
+            wait=True
+        ))
+
+    def find_ids(self, collection_name, payload_key, value):
+        selector = Filter(must=[FieldCondition(key=payload_key, match=MatchValue(value=value))])
+        ids, offset = [], None
+        while True:
+            points, offset = self._call(lambda timeout: self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=selector,
+                limit=256,
+                offset=offset,
+                with_payload=False,
+                timeout=self._server_timeout(timeout)
+            ))
+            ids.extend(point.id for point in points)
+            if offset is None:
+                return ids
+
+    @staticmethod
+    def _hits(points):
+        return [SearchHit(point.id, point.score, point.payload or {}) for point in points]
+
+    def search(self, collection_name, vector, k):
+        response = self._call(lambda timeout: self.client.query_points(
+            collection_name=collection_name,
+            query=list(vector),
+            limit=k,
+            with_payload=True,
+            timeout=self._server_timeout(timeout)
+        ))
+        return self._hits(response.points)
+
+    def search_batch(self, collection_name, vectors, k):
+        requests = [QueryRequest(query=list(vector), limit=k, with_payload=True) for vector in vectors]
+        responses = self._call(lambda timeout: self.client.query_batch_points(
+            collection_name=collection_name,
+            requests=requests,
+            timeout=self._server_timeout(timeout)
+        ))
+        return [self._hits(response.points) for response in responses]
+
+    async def asearch(self, collection_name, vector, k):
+        response = await acall_upstream(
+            lambda timeout: self.async_client.query_points(
+                collection_name=collection_name,
+                query=list(vector),
+                limit=k,
+                with_payload=True,
+                timeout=self._server_timeout(timeout)
+            ),
+            self.breaker,
+            timeout=self.timeout
+        )
+        return self._hits(response.points)
+
+    def close(self):
+        self.client.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
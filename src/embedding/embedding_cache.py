@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+
+import numpy as np
+
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, logger
+
+from src.api.telemetry import increment
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks on Windows; keep one process per cache directory there
+    fcntl = None
+
+
+INDEX_DTYPE = np.dtype([("key", "S64"), ("last_used", "<f8")])
+
+
+class EmbeddingStore:
+    """
+    Persistent, content-addressed store of embedding vectors.
+
+    Vectors live in a memory-mapped float32 matrix (``vectors.f32``) and
+    slot ownership in a memory-mapped index (``index.bin``) holding the
+    hex SHA-256 key and last-access time of each slot, so both survive restarts
+    without a separate save step. When full, the least recently used slot is
+    reused.
+
+    Several processes may share a directory: writes are serialised with a
+    file lock and claim only slots that are free on disk, and reads check the
+    slot still holds the key, so a slot taken over by another process is a
+    miss rather than a foreign vector.
+    """
+
+    def __init__(self, directory, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._index = None
+        self._slots = {}
+        self._free = []
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+
+        try:
+            with open(self._meta_path, "r") as f:
+                meta = json.load(f)
+            if meta["capacity"] != self.max_entries:
+                logger.warning("Embedding cache capacity changed. Resetting.")
+                return
+            self._open(meta["dim"], mode="r+")
+        except Exception as err:
+            logger.warning(f"Embedding cache at {self.directory} is unreadable. Resetting. {err}")
+            self._vectors, self._index, self.dim = None, None, None
+            return
+
+        for slot, key in enumerate(self._index["key"]):
+            if key:
+                self._slots[bytes(key)] = slot
+            else:
+                self._free.append(slot)
+        self._free.reverse()
+        logger.debug("Loaded {} cached embeddings from {}", len(self._slots), self.directory)
+
+    def _open(self, dim, mode):
+        os.makedirs(self.directory, exist_ok=True)
+        self._vectors = np.memmap(
+            os.path.join(self.directory, "vectors.f32"), dtype=np.float32, mode=mode,
+            shape=(self.max_entries, dim)
+        )
+        self._index = np.memmap(
+            os.path.join(self.directory, "index.bin"), dtype=INDEX_DTYPE, mode=mode,
+            shape=(self.max_entries,)
+        )
+        self.dim = dim
+        if mode == "w+":
+            self._free = list(reversed(range(self.max_entries)))
+            with open(self._meta_path, "w") as f:
+                json.dump({"dim": dim, "capacity": self.max_entries}, f)
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get(self, key):
+        """
+        Return a copy of the vector stored under key, or None
+        """
+        with self._lock:
+            slot = self._slots.get(key)
+            vector = None
+            if slot is not None:
+                vector = self._vectors[slot].tolist()
+                # Checked after the copy: a writer clears the key before touching the vector
+                if bytes(self._index["key"][slot]) != key:
+                    del self._slots[key]
+                    vector = None
+
+            if vector is None:
+                self.misses += 1
+                increment("embedding_cache.miss")
+                return None
+            self.hits += 1
+            increment("embedding_cache.hit")
+            self._index["last_used"][slot] = time.time()
+            return vector
+
+    def put(self, key, vector):
+        """
+        Store a vector under key, evicting the least recently used entry if full
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock, self._file_lock():
+            if self._vectors is None or self.dim != vector.shape[0]:
+                # Another process may have created the store meanwhile
+                self._slots.clear()
+                self._free = []
+                self._load()
+                if self.dim != vector.shape[0]:
+                    self._slots.clear()
+                    self._open(vector.shape[0], mode="w+")
+
+            slot = self._slots.get(key)
+            if slot is None or bytes(self._index["key"][slot]) != key:
+                slot = self._claim_slot()
+
+            # Clear the key first so a crash mid-write never pairs a key with a foreign vector
+            self._index["key"][slot] = b""
+            self._vectors[slot] = vector
+            self._index[slot] = (key, time.time())
+            self._slots[key] = slot
+
+    def _claim_slot(self):
+        # Slots free in this process may have been claimed by another since
+        while self._free:
+            slot = self._free.pop()
+            if not self._index["key"][slot]:
+                return slot
+
+        slot = int(np.argmin(self._index["last_used"]))
+        self._slots.pop(bytes(self._index["key"][slot]), None)
+        self.evictions += 1
+        return slot
+
+    def flush(self):
+        """
+        Flush memory-mapped pages to disk
+        """
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._index.flush()
+
+    def stats(self):
+        """
+        Return hit/miss/eviction counters and the current size
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._slots)
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeat texts from an EmbeddingStore and
+    only sends unseen texts to the underlying model, in one batch
+    """
+
+    def __init__(self, embeddings, model_name, store=None, cache_dir=EMBEDDING_CACHE_DIR):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.store = store or EmbeddingStore(
+            os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_name or "default"))
+        )
+
+    def key(self, text):
+        """
+        Content address of a text for this model
+        """
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.model_name}\0{normalized}".encode("utf-8")).hexdigest().encode("ascii")
+
+    def _split(self, texts):
+        keys = [self.key(text) for text in texts]
+        vectors = [self.store.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        return keys, vectors, missing
+
+    def _fill(self, keys, vectors, missing, computed):
+        for i, vector in zip(missing, computed):
+            self.store.put(keys[i], vector)
+            vectors[i] = list(vector)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._split(texts)
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            self._fill(keys, vectors, missing, computed)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.key(text)
+        vector = self.store.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.store.put(key, vector)
+        return list(vector)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._split(texts)
+        if missing:
+            computed = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            self._fill(keys, vectors, missing, computed)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self.key(text)
+        vector = self.store.get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.store.put(key, vector)
+        return list(vector)
+
+    def close(self):
+        """
+        Flush the underlying store to disk
+        """
+        self.store.flush()
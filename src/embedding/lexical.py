@@ -0,0 +1,223 @@
+import json
+import math
+import os
+import re
+import threading
+
+from collections import Counter
+
+from langchain_core.documents import Document
+
+from config import LEXICAL_INDEX_DIR, LEXICAL_CONFIDENCE_RATIO, LEXICAL_MIN_COVERAGE, logger
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a about an and are as at be by can de did do does for from has have how i in is it its me my of on or
+say says tell that the their there these this to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    """
+    Lowercase terms of a text, minus stopwords. Compound tokens such as part
+    numbers ("xk-200/b") are kept whole and also split into their parts.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        parts = re.split(r"[-_./]", token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part and part not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """
+    Incremental in-memory BM25 inverted index for one collection, persisted
+    as a JSON snapshot that is replaced atomically on ``save``.
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._postings = {}
+        self._total_length = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r") as f:
+                docs = json.load(f)["docs"]
+        except Exception as err:
+            logger.warning(f"Lexical index at {self.path} is unreadable. Resetting. {err}")
+            return
+
+        for doc_id, doc in docs.items():
+            self._index(doc_id, doc)
+        logger.debug("Loaded {} documents into the lexical index from {}", len(self._docs), self.path)
+
+    def _index(self, doc_id, doc):
+        self._docs[doc_id] = doc
+        self._total_length += doc["length"]
+        for term, frequency in doc["terms"].items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+
+    def _unindex(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc["length"]
+        for term in doc["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, ids, texts, metadatas):
+        """
+        Index (or re-index) documents under the given IDs
+        """
+        with self._lock:
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                doc_id = str(doc_id)
+                terms = tokenize(text)
+                self._unindex(doc_id)
+                self._index(doc_id, {
+                    "text": text,
+                    "metadata": metadata or {},
+                    "length": len(terms),
+                    "terms": dict(Counter(terms))
+                })
+            self._dirty = True
+
+    def delete(self, ids):
+        """
+        Remove documents from the index
+        """
+        with self._lock:
+            for doc_id in ids:
+                self._unindex(str(doc_id))
+            self._dirty = True
+
+    def search(self, query, k):
+        """
+        Return up to k hits as dicts with ``id``, ``score`` and ``coverage``
+        (the fraction of distinct query terms the document contains)
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self._docs:
+                return []
+
+            count = len(self._docs)
+            average_length = self._total_length / count or 1.0
+            scores = Counter()
+            matched = Counter()
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self._docs[doc_id]["length"]
+                    norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / norm
+                    matched[doc_id] += 1
+
+            return [
+                {"id": doc_id, "score": score, "coverage": matched[doc_id] / len(terms)}
+                for doc_id, score in scores.most_common(k)
+            ]
+
+    def document(self, doc_id, collection_name):
+        """
+        Return the stored chunk as a Document shaped like a dense search result
+        """
+        with self._lock:
+            doc = self._docs[doc_id]
+        metadata = dict(doc["metadata"])
+        metadata["_id"] = doc_id
+        metadata["_collection_name"] = collection_name
+        return Document(page_content=doc["text"], metadata=metadata)
+
+    def save(self):
+        """
+        Write a snapshot of the index if it changed since the last save
+        """
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"docs": self._docs}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+class LexicalIndex:
+    """
+    BM25 indexes for every collection, loaded lazily and stored next to each
+    other in one directory
+    """
+
+    def __init__(
+        self,
+        directory=LEXICAL_INDEX_DIR,
+        confidence_ratio=LEXICAL_CONFIDENCE_RATIO,
+        min_coverage=LEXICAL_MIN_COVERAGE
+    ):
+        self.directory = directory
+        self.confidence_ratio = confidence_ratio
+        self.min_coverage = min_coverage
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def collection(self, collection_name):
+        """
+        Return the BM25 index for a collection, loading it on first use
+        """
+        with self._lock:
+            index = self._indexes.get(collection_name)
+            if index is None:
+                path = None
+                if self.directory:
+                    filename = re.sub(r"[^\w.-]", "_", collection_name)
+                    path = os.path.join(self.directory, f"{filename}.json")
+                index = self._indexes[collection_name] = BM25Index(path)
+            return index
+
+    def is_confident(self, hits):
+        """
+        Whether lexical hits are decisive enough to skip dense retrieval: the
+        best hit contains the query terms and clearly outscores the runner-up
+        """
+        if not hits or hits[0]["coverage"] < self.min_coverage:
+            return False
+        return len(hits) == 1 or hits[0]["score"] >= self.confidence_ratio * hits[1]["score"]
+
+    def save(self, collection_name=None):
+        """
+        Persist one collection's index, or every loaded index
+        """
+        with self._lock:
+            indexes = [self._indexes[collection_name]] if collection_name in self._indexes else (
+                [] if collection_name else list(self._indexes.values())
+            )
+        for index in indexes:
+            index.save()
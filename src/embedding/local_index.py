@@ -0,0 +1,344 @@
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from config import LOCAL_VECTOR_DIR, LOCAL_VECTOR_QUANTIZATION, LOCAL_VECTOR_BLOCK_ROWS, LOCAL_VECTOR_INDEX, logger
+
+from src.embedding.backend import SearchHit, VectorBackend
+
+
+def normalize_rows(vectors):
+    """
+    Return float32 copies of the vectors scaled to unit length
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def top_k(scores, k):
+    """
+    Indices of the k highest scores per row of a (queries, rows) matrix, best first
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class FlatIndex:
+    """
+    Exact cosine index over a contiguous, memory-mapped matrix of unit vectors.
+
+    Rows ``[0, count)`` are live; deletes move the last row into the hole so
+    the matrix stays dense. Queries are scored with blocked matrix products
+    and a running top-k, so memory stays bounded for large collections. With
+    ``quantization="int8"`` vectors are stored as int8 codes plus a per-row
+    scale, a quarter of the float32 footprint.
+
+    Payloads and IDs are kept in memory and written with the metadata by
+    ``flush``; rows written after the last flush are ignored on reload.
+    """
+
+    def __init__(self, directory, quantization=LOCAL_VECTOR_QUANTIZATION, block_rows=LOCAL_VECTOR_BLOCK_ROWS):
+        self.directory = directory
+        self.quantization = quantization
+        self.block_rows = block_rows
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._scales = None
+        self._ids = []
+        self._payloads = []
+        self._rows = {}
+        self.dim = None
+        self.capacity = 0
+        self._load()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    @property
+    def _payloads_path(self):
+        return os.path.join(self.directory, "payloads.json")
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+
+        try:
+            with open(self._meta_path, "r") as f:
+                meta = json.load(f)
+            with open(self._payloads_path, "r") as f:
+                stored = json.load(f)
+            if meta["quantization"] != self.quantization:
+                logger.warning(f"Vector index at {self.directory} uses {meta['quantization']} storage. Keeping it.")
+                self.quantization = meta["quantization"]
+            self._open(meta["dim"], meta["capacity"], mode="r+")
+        except Exception as err:
+            logger.warning(f"Vector index at {self.directory} is unreadable. Resetting. {err}")
+            self._vectors, self._scales, self.dim, self.capacity = None, None, None, 0
+            return
+
+        self._ids = stored["ids"]
+        self._payloads = stored["payloads"]
+        self._rows = {point_id: row for row, point_id in enumerate(self._ids) if point_id is not None}
+        logger.debug("Loaded {} vectors from {}", len(self._rows), self.directory)
+
+    def _open(self, dim, capacity, mode):
+        os.makedirs(self.directory, exist_ok=True)
+        dtype = np.int8 if self.quantization == "int8" else np.float32
+        self._vectors = np.memmap(
+            os.path.join(self.directory, f"vectors.{np.dtype(dtype).name}"), dtype=dtype, mode=mode,
+            shape=(capacity, dim)
+        )
+        if self.quantization == "int8":
+            self._scales = np.memmap(
+                os.path.join(self.directory, "scales.float32"), dtype=np.float32, mode=mode,
+                shape=(capacity,)
+            )
+        self.dim = dim
+        self.capacity = capacity
+
+    def _grow(self, needed):
+        if self._vectors is not None and needed <= self.capacity:
+            return
+
+        capacity = max(1024, self.capacity)
+        while capacity < needed:
+            capacity *= 2
+
+        if self._vectors is None:
+            self._open(self.dim, capacity, mode="w+")
+            return
+
+        # Rows are contiguous, so growing is just extending the files
+        self._flush_vectors()
+        files = [self._vectors.filename] + ([self._scales.filename] if self._scales is not None else [])
+        itemsizes = [self._vectors.dtype.itemsize * self.dim] + ([4] if self._scales is not None else [])
+        self._vectors, self._scales = None, None
+        for filename, itemsize in zip(files, itemsizes):
+            with open(filename, "r+b") as f:
+                f.truncate(capacity * itemsize)
+        self._open(self.dim, capacity, mode="r+")
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _write_rows(self, rows, vectors):
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[rows] = scales
+        else:
+            self._vectors[rows] = vectors
+
+    def upsert(self, ids, vectors, payloads):
+        """
+        Insert or replace points and return the rows they were written to
+        """
+        vectors = normalize_rows(vectors)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+
+            rows = []
+            for point_id, payload in zip(ids, payloads):
+                row = self._rows.get(point_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[point_id] = row
+                    self._ids.append(point_id)
+                    self._payloads.append(payload)
+                else:
+                    self._payloads[row] = payload
+                rows.append(row)
+
+            rows = np.asarray(rows, dtype=np.int64)
+            self._grow(len(self._ids))
+            self._write_rows(rows, vectors)
+            return rows
+
+    def delete(self, ids):
+        """
+        Remove points, filling each hole with the last row
+        """
+        with self._lock:
+            for point_id in ids:
+                row = self._rows.pop(point_id, None)
+                if row is None:
+                    continue
+                last = len(self._ids) - 1
+                if row != last:
+                    self._vectors[row] = self._vectors[last]
+                    if self._scales is not None:
+                        self._scales[row] = self._scales[last]
+                    self._ids[row] = self._ids[last]
+                    self._payloads[row] = self._payloads[last]
+                    self._rows[self._ids[row]] = row
+                self._ids.pop()
+                self._payloads.pop()
+
+    def find_ids(self, payload_key, value):
+        """
+        IDs of the points whose payload holds ``value`` at the dotted ``payload_key``
+        """
+        keys = payload_key.split(".")
+        matches = []
+        with self._lock:
+            for point_id, payload in zip(self._ids, self._payloads):
+                for key in keys:
+                    payload = payload.get(key) if isinstance(payload, dict) else None
+                if point_id is not None and payload == value:
+                    matches.append(point_id)
+        return matches
+
+    def _block_scores(self, queries, start, stop):
+        scores = queries @ np.asarray(self._vectors[start:stop], dtype=np.float32).T
+        if self._scales is not None:
+            scores *= self._scales[start:stop]
+        return scores
+
+    def _row_scores(self, queries, rows):
+        scores = queries @ np.asarray(self._vectors[rows], dtype=np.float32).T
+        if self._scales is not None:
+            scores *= self._scales[rows]
+        return scores
+
+    def _hits(self, rows, scores):
+        return [
+            SearchHit(self._ids[row], float(score), self._payloads[row])
+            for row, score in zip(rows, scores)
+            if score > -np.inf
+        ]
+
+    def search_batch(self, vectors, k):
+        """
+        Return the k best (id, score, payload) hits for each query vector
+        """
+        queries = normalize_rows(vectors)
+        with self._lock:
+            count = len(self._ids)
+            if not self._rows or k <= 0:
+                return [[] for _ in range(len(queries))]
+
+            best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+            best_rows = np.empty((len(queries), 0), dtype=np.int64)
+            for start in range(0, count, self.block_rows):
+                stop = min(start + self.block_rows, count)
+                scores = np.concatenate([best_scores, self._block_scores(queries, start, stop)], axis=1)
+                rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, stop), (len(queries), stop - start))], axis=1)
+                keep = top_k(scores, k)
+                best_scores = np.take_along_axis(scores, keep, axis=1)
+                best_rows = np.take_along_axis(rows, keep, axis=1)
+
+            return [self._hits(rows, scores) for rows, scores in zip(best_rows, best_scores)]
+
+    def search(self, vector, k):
+        """
+        Return the k best (id, score, payload) hits for one query vector
+        """
+        return self.search_batch([vector], k)[0]
+
+    def _flush_vectors(self):
+        if self._vectors is not None:
+            self._vectors.flush()
+            if self._scales is not None:
+                self._scales.flush()
+
+    def flush(self):
+        """
+        Write vectors, payloads and metadata to disk
+        """
+        with self._lock:
+            if self._vectors is None:
+                return
+            self._flush_vectors()
+            for path, data in (
+                (self._payloads_path, {"ids": self._ids, "payloads": self._payloads}),
+                (self._meta_path, {"dim": self.dim, "capacity": self.capacity, "quantization": self.quantization})
+            ):
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, path)
+
+
+class LocalVectorBackend(VectorBackend):
+    """
+    In-process vector backend: one index per collection under a directory,
+    so retrieval needs no server and no network hop. ``index_type`` is
+    "flat" for exact search or "ivf" for the approximate IVFIndex.
+    """
+
+    def __init__(self, directory=LOCAL_VECTOR_DIR, quantization=LOCAL_VECTOR_QUANTIZATION, index_type=LOCAL_VECTOR_INDEX):
+        self.directory = directory
+        self.quantization = quantization
+        self.index_type = index_type
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def _path(self, collection_name):
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", collection_name))
+
+    def index(self, collection_name, create=True):
+        """
+        Return the index for a collection, loading it on first use
+        """
+        with self._lock:
+            index = self._indexes.get(collection_name)
+            if index is None and (create or os.path.exists(self._path(collection_name))):
+                index = self._indexes[collection_name] = self._create_index(self._path(collection_name))
+            return index
+
+    def _create_index(self, path):
+        if self.index_type == "ivf":
+            from src.embedding.ann import IVFIndex
+            return IVFIndex(path, self.quantization)
+        return FlatIndex(path, self.quantization)
+
+    def collection_exists(self, collection_name):
+        return self.index(collection_name, create=False) is not None
+
+    def create_collection(self, collection_name, dim):
+        self.index(collection_name)
+
+    def upsert(self, collection_name, ids, vectors, payloads):
+        self.index(collection_name).upsert([str(point_id) for point_id in ids], vectors, payloads)
+
+    def delete(self, collection_name, ids):
+        self.index(collection_name).delete([str(point_id) for point_id in ids])
+
+    def search(self, collection_name, vector, k):
+        index = self.index(collection_name, create=False)
+        return index.search(vector, k) if index is not None else []
+
+    def find_ids(self, collection_name, payload_key, value):
+        index = self.index(collection_name, create=False)
+        return index.find_ids(payload_key, value) if index is not None else []
+
+    def search_batch(self, collection_name, vectors, k):
+        index = self.index(collection_name, create=False)
+        return index.search_batch(vectors, k) if index is not None else [[] for _ in vectors]
+
+    async def asearch(self, collection_name, vector, k):
+        # Sub-millisecond for in-process indexes; a thread hop would cost more
+        return self.search(collection_name, vector, k)
+
+    def flush(self, collection_name=None):
+        with self._lock:
+            indexes = list(self._indexes.values()) if collection_name is None else [self._indexes.get(collection_name)]
+        for index in indexes:
+            if index is not None:
+                index.flush()
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,149 @@
+import threading
+import time
+
+import numpy as np
+
+from config import (
+    QDRANT_COLLECTION_NAME,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL,
+    logger
+)
+
+from src.api.telemetry import increment
+
+
+class SemanticCache:
+    """
+    Answer cache for document Q&A keyed on question embeddings.
+
+    Questions are embedded and compared by cosine similarity against a small
+    in-memory matrix of previously answered questions; a match above the
+    threshold returns the stored answer and sources. Entries are scoped per
+    collection and dropped whenever that collection ingests new chunks.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl=SEMANTIC_CACHE_TTL,
+        clock=time.monotonic
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._entries = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Return (entry, vector): the cached entry on a hit (else None) and the
+        question embedding, to be passed back to ``store`` on a miss
+        """
+        vector = self._normalize(self.embeddings.embed_query(question))
+        return self._match(vector, collection_name), vector
+
+    async def alookup(self, question, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Async variant of ``lookup``
+        """
+        vector = self._normalize(await self.embeddings.aembed_query(question))
+        return self._match(vector, collection_name), vector
+
+    def match(self, vector, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Return the cached entry for an already computed question embedding, or None
+        """
+        return self._match(self._normalize(vector), collection_name)
+
+    def _match(self, vector, collection_name):
+        with self._lock:
+            if self._vectors is None:
+                self.misses += 1
+                increment("semantic_cache.miss")
+                return None
+
+            now = self._clock()
+            similarities = self._vectors @ vector
+            for slot, entry in enumerate(self._entries):
+                if entry is None or entry["collection_name"] != collection_name or entry["expires_at"] <= now:
+                    similarities[slot] = -np.inf
+
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                self.misses += 1
+                increment("semantic_cache.miss")
+                return None
+
+            self.hits += 1
+            increment("semantic_cache.hit")
+            self._last_used[slot] = now
+            logger.debug("Semantic cache hit with similarity {:.3f}", similarities[slot])
+            return self._entries[slot]
+
+    def store(self, question, vector, answer, sources, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Remember the answer and sources for a question embedding
+        """
+        vector = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+
+            now = self._clock()
+            slot = self._free_slot(now)
+            self._vectors[slot] = vector
+            self._last_used[slot] = now
+            self._entries[slot] = {
+                "question": question,
+                "answer": answer,
+                "sources": sources,
+                "collection_name": collection_name,
+                "expires_at": now + self.ttl
+            }
+
+    def _free_slot(self, now):
+        for slot, entry in enumerate(self._entries):
+            if entry is None or entry["expires_at"] <= now:
+                return slot
+        return int(np.argmin(self._last_used))
+
+    def invalidate(self, collection_name=None):
+        """
+        Drop cached answers for a collection, or for every collection
+        """
+        with self._lock:
+            for slot, entry in enumerate(self._entries):
+                if entry is not None and collection_name in (None, entry["collection_name"]):
+                    self._entries[slot] = None
+                    self._vectors[slot] = 0
+            self.invalidations += 1
+        logger.debug("Invalidated semantic cache for {}", collection_name or "all collections")
+
+    def stats(self):
+        """
+        Return hit/miss/invalidation counters and the current size
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": sum(entry is not None for entry in self._entries)
+            }
@@ -1,34 +1,81 @@
-from langchain_openai import OpenAIEmbeddings
+import uuid
+
+from typing import Any, List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
 
-from config import QDRANT_URL, QDRANT_COLLECTION_NAME, OPENAI_API_KEY, EMBEDDING_MODEL, logger
+from config import (
+    QDRANT_COLLECTION_NAME,
+    RETRIEVAL_K,
+    RETRIEVAL_FETCH_K,
+    RRF_K,
+    logger
+)
+
+from src.embedding.backend import QdrantBackend
+from src.llm.client import create_embeddings
 
 
 class VectorDatabase:
 
-    def __init__(self):
-        self.client = QdrantClient(url=QDRANT_URL)
-        self.embeddings = OpenAIEmbeddings(
-            model=EMBEDDING_MODEL,
-            openai_api_key=OPENAI_API_KEY
-        )
-        
+    def __init__(self, client=None, embeddings=None, async_client=None, lexical_index=None, backend=None):
+        self.backend = backend or QdrantBackend(client=client, async_client=async_client)
+        self.embeddings = embeddings or create_embeddings()
+        self.lexical_index = lexical_index
+        self._ingest_listeners = []
+
+    def add_ingest_listener(self, listener):
+        """
+        Register a callback invoked with the collection name after new
+        chunks are stored, e.g. to invalidate caches derived from it
+        """
+        self._ingest_listeners.append(listener)
+
+    def notify_ingest(self, collection_name):
+        """
+        Persist the collection's vectors and lexical index and tell ingest
+        listeners that the collection received new chunks
+        """
+        self.backend.flush(collection_name)
+        if self.lexical_index is not None:
+            self.lexical_index.save(collection_name)
+
+        for listener in self._ingest_listeners:
+            try:
+                listener(collection_name)
+            except Exception as err:
+                logger.error(f"{err.__class__} Exception occured in ingest listener. {err}")
+
+    @property
+    def client(self):
+        """
+        Qdrant client of the Qdrant backend, or None for other backends
+        """
+        return getattr(self.backend, "client", None)
+
+    @client.setter
+    def client(self, client):
+        self.backend.client = client
+
+    @property
+    def async_client(self):
+        """
+        Lazily created async Qdrant client used by the async retrieval path
+        """
+        return self.backend.async_client
+
     def create_collection_if_not_exists(self, collection_name=QDRANT_COLLECTION_NAME):
         """
         Create collection if it doesn't exist
         """
 
-        collections = self.client.get_collections().collections
-        collection_names = [collection.name for collection in collections]
-        
-        if collection_name not in collection_names:
-            self.client.create_collection(
-                collection_name=collection_name,
-                vectors_config={
-                    "size": 1536,  # Dimension of OpenAI embeddings
-                    "distance": "Cosine"
-                }
+        if not self.backend.collection_exists(collection_name):
+            self.backend.create_collection(
+                collection_name,
+                1536  # Dimension of OpenAI embeddings
             )
     
     def store_documents(self, documents, collection_name=QDRANT_COLLECTION_NAME):
@@ -40,34 +87,268 @@ class VectorDatabase:
         self.create_collection_if_not_exists(collection_name)
         logger.debug("Created collection")
         
-        logger.debug("Initializing vector store")
-        vectorstore = QdrantVectorStore(
-            client=self.client,
-            collection_name=collection_name,
-            embedding=self.embeddings
-        )
-        logger.debug("Initialized vector store")
-        
+        logger.debug("Embedding documents")
+        texts = [document.page_content for document in documents]
+        vectors = self.embeddings.embed_documents(texts)
+
         logger.debug("Adding documents to the collection")
-        vectorstore.add_documents(documents)
+        self.upsert_embeddings(texts, [document.metadata for document in documents], vectors, collection_name)
         logger.debug("Added documents to the collection")
 
-        return vectorstore
-    
-    def get_retriever(self, collection_name=QDRANT_COLLECTION_NAME):
+        self.notify_ingest(collection_name)
+
+    def upsert_embeddings(self, texts, metadatas, vectors, collection_name=QDRANT_COLLECTION_NAME, ids=None):
+        """
+        Bulk upsert pre-computed embeddings in the same payload layout
+        QdrantVectorStore uses, and return the point IDs
+        """
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        payloads = [
+            {
+                QdrantVectorStore.CONTENT_KEY: text,
+                QdrantVectorStore.METADATA_KEY: metadata
+            }
+            for text, metadata in zip(texts, metadatas)
+        ]
+
+        self.backend.upsert(collection_name, ids, vectors, payloads)
+        if self.lexical_index is not None:
+            self.lexical_index.collection(collection_name).add(ids, texts, metadatas)
+        return ids
+
+    def delete_points(self, ids, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Delete points by ID
         """
-        Get a retriever for the vector database
+        self.backend.delete(collection_name, ids)
+        if self.lexical_index is not None:
+            self.lexical_index.collection(collection_name).delete(ids)
+
+    def delete_source(self, source, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Delete every point whose chunk came from ``source`` and return how
+        many there were
         """
+        ids = self.backend.find_ids(collection_name, f"{QdrantVectorStore.METADATA_KEY}.source", source)
+        if ids:
+            self.delete_points(ids, collection_name=collection_name)
+        return len(ids)
 
-        logger.debug("Initializing vector store")
-        vectorstore = QdrantVectorStore(
-            client=self.client,
+    def get_retriever(self, collection_name=QDRANT_COLLECTION_NAME, k=RETRIEVAL_K):
+        """
+        Get a retriever for the vector database; hybrid when a lexical index
+        is configured. Searches go through the backend, and so through its
+        circuit breaker and retries.
+        """
+        return self.get_async_retriever(collection_name, k=k)
+
+    def get_async_retriever(self, collection_name=QDRANT_COLLECTION_NAME, k=RETRIEVAL_K):
+        """
+        Get a retriever whose async path never blocks on Qdrant or embeddings
+        """
+        if self.lexical_index is not None:
+            return self.get_hybrid_retriever(collection_name, k=k)
+
+        return AsyncQdrantRetriever(
+            vector_db=self,
             collection_name=collection_name,
-            embedding=self.embeddings
+            k=k
         )
-        logger.debug("Initialized vector store")
-        
-        return vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5}
-        )
\ No newline at end of file
+
+    def get_hybrid_retriever(self, collection_name=QDRANT_COLLECTION_NAME, k=RETRIEVAL_K, mode="hybrid"):
+        """
+        Get a retriever fusing lexical (BM25) and dense results; mode is
+        "hybrid", "lexical" or "dense"
+        """
+        return HybridRetriever(
+            vector_db=self,
+            collection_name=collection_name,
+            k=k,
+            mode=mode
+        )
+
+    def lexical_search(self, query, k=RETRIEVAL_K, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Return (documents, confident) from the collection's lexical index
+        """
+        index = self.lexical_index.collection(collection_name)
+        hits = index.search(query, k)
+        documents = [index.document(hit["id"], collection_name) for hit in hits]
+        return documents, self.lexical_index.is_confident(hits)
+
+    async def asimilarity_search(self, query, k=RETRIEVAL_K, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Embed the query and search the collection asynchronously
+        """
+
+        logger.debug("Embedding query")
+        query_vector = await self.embeddings.aembed_query(query)
+
+        logger.debug("Searching collection")
+        hits = await self.backend.asearch(collection_name, query_vector, k)
+
+        return [
+            self._document_from_hit(hit, collection_name)
+            for hit in hits
+        ]
+
+    def similarity_search(self, query, k=RETRIEVAL_K, collection_name=QDRANT_COLLECTION_NAME):
+        """
+        Embed the query and search the collection
+        """
+
+        query_vector = self.embeddings.embed_query(query)
+        hits = self.backend.search(collection_name, query_vector, k)
+
+        return [
+            self._document_from_hit(hit, collection_name)
+            for hit in hits
+        ]
+
+    def similarity_search_batch(self, queries, k=RETRIEVAL_K, collection_name=QDRANT_COLLECTION_NAME, vectors=None):
+        """
+        Retrieve documents for many queries with one embedding request and
+        one multi-vector search. With a lexical index, results are fused as in
+        HybridRetriever and decisive lexical matches skip dense search.
+        Pass ``vectors`` when the query embeddings are already known.
+        """
+        results = [None] * len(queries)
+        lexical = [[] for _ in queries]
+        if self.lexical_index is not None:
+            for i, query in enumerate(queries):
+                documents, confident = self.lexical_search(query, k=RETRIEVAL_FETCH_K, collection_name=collection_name)
+                if confident:
+                    results[i] = documents[:k]
+                else:
+                    lexical[i] = documents
+
+        pending = [i for i, documents in enumerate(results) if documents is None]
+        if not pending:
+            return results
+
+        if vectors is None:
+            logger.debug("Embedding {} queries", len(pending))
+            pending_vectors = self.embeddings.embed_documents([queries[i] for i in pending])
+        else:
+            pending_vectors = [vectors[i] for i in pending]
+
+        logger.debug("Searching collection for {} queries", len(pending))
+        depth = RETRIEVAL_FETCH_K if self.lexical_index is not None else k
+        for i, hits in zip(pending, self.backend.search_batch(collection_name, pending_vectors, depth)):
+            dense = [self._document_from_hit(hit, collection_name) for hit in hits]
+            results[i] = reciprocal_rank_fusion([dense, lexical[i]], k) if self.lexical_index is not None else dense
+
+        return results
+
+    async def aclose(self):
+        """
+        Release the backend's async resources
+        """
+        await self.backend.aclose()
+
+    @staticmethod
+    def _document_from_hit(hit, collection_name):
+        payload = hit.payload or {}
+        metadata = dict(payload.get(QdrantVectorStore.METADATA_KEY) or {})
+        metadata["_id"] = hit.id
+        metadata["_collection_name"] = collection_name
+        return Document(
+            page_content=payload.get(QdrantVectorStore.CONTENT_KEY, ""),
+            metadata=metadata
+        )
+
+
+class AsyncQdrantRetriever(BaseRetriever):
+    """
+    Retriever backed by VectorDatabase with a native async search path, for
+    any backend
+    """
+
+    vector_db: Any
+    collection_name: str = QDRANT_COLLECTION_NAME
+    k: int = RETRIEVAL_K
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.vector_db.similarity_search(query, k=self.k, collection_name=self.collection_name)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return await self.vector_db.asimilarity_search(query, k=self.k, collection_name=self.collection_name)
+
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=RRF_K):
+    """
+    Merge ranked document lists by reciprocal rank, keyed on point ID
+    """
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = str(document.metadata.get("_id", document.page_content))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            documents.setdefault(key, document)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever fusing the lexical index with dense search by reciprocal rank.
+
+    When the lexical hits are decisive (e.g. an exact part number) they are
+    returned directly and the query is never embedded.
+    """
+
+    vector_db: Any
+    collection_name: str = QDRANT_COLLECTION_NAME
+    k: int = RETRIEVAL_K
+    fetch_k: int = RETRIEVAL_FETCH_K
+    mode: str = "hybrid"
+
+    def _lexical(self, query):
+        if self.mode == "dense":
+            return [], False
+        documents, confident = self.vector_db.lexical_search(query, k=self.fetch_k, collection_name=self.collection_name)
+        if self.mode == "lexical" or confident:
+            logger.debug("Answering from the lexical index only")
+            return documents[:self.k], True
+        return documents, False
+
+    def _degraded(self, lexical, err):
+        """
+        Answer from the lexical hits alone when dense search is unavailable
+        """
+        if not lexical:
+            raise err
+        logger.warning(f"Dense search failed, answering from the lexical index only. {err}")
+        return lexical[:self.k]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        lexical, done = self._lexical(query)
+        if done:
+            return lexical
+
+        try:
+            dense = self.vector_db.similarity_search(query, k=self.fetch_k, collection_name=self.collection_name)
+        except Exception as err:
+            return self._degraded(lexical, err)
+        return reciprocal_rank_fusion([dense, lexical], self.k)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        lexical, done = self._lexical(query)
+        if done:
+            return lexical
+
+        try:
+            dense = await self.vector_db.asimilarity_search(query, k=self.fetch_k, collection_name=self.collection_name)
+        except Exception as err:
+            return self._degraded(lexical, err)
+        return reciprocal_rank_fusion([dense, lexical], self.k)
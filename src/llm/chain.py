@@ -1,18 +1,13 @@
-from langchain_openai import ChatOpenAI
-from langchain.chains.retrieval_qa.base import RetrievalQA
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 
-from config import LLM_MODEL, OPENAI_API_KEY
+from src.llm.client import create_chat_model
+from src.llm.context import ContextPackingRetriever
 
 
 class LLMChain:
 
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model=LLM_MODEL,
-            openai_api_key=OPENAI_API_KEY,
-            temperature=0.2
-        )
+    def __init__(self, llm=None):
+        self.llm = llm or create_chat_model(temperature=0.2)
     
     def create_weather_chain(self):
         """
@@ -20,7 +15,7 @@ class LLMChain:
         """
         weather_template = """
         You are a helpful assistant that provides weather information.
-        Below is the weather data for a city:
+        Below is the weather data for one or more cities:
         
         {weather_data}
         
@@ -34,11 +29,31 @@ class LLMChain:
         )
         
         return weather_prompt
+
+    def create_weather_chat_chain(self):
+        """
+        Create a runnable chat chain answering questions from weather data
+        """
+        weather_prompt = self.create_weather_chain()
+
+        chat_prompt = ChatPromptTemplate.from_messages([
+            ("system", weather_prompt.template),
+            ("human", "{question}")
+        ])
+
+        return chat_prompt | self.llm
     
-    def create_document_chain(self, retriever):
+    def create_document_chain(self, retriever, context_packer=None):
         """
-        Create a chain for answering questions from documents
+        Create a chain for answering questions from documents, packing the
+        retrieved chunks into a token budget when a context packer is given
         """
+        # Importing the legacy chains package loads most of langchain, so it
+        # is only done once a document chain is actually needed
+        from langchain.chains.retrieval_qa.base import RetrievalQA
+
+        if context_packer is not None:
+            retriever = ContextPackingRetriever(retriever=retriever, packer=context_packer)
 
         qa_chain = RetrievalQA.from_chain_type(
             llm=self.llm,
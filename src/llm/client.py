@@ -0,0 +1,114 @@
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from config import LLM_MODEL, EMBEDDING_MODEL, OPENAI_API_KEY, LLM_TIMEOUT, UPSTREAM_RETRIES
+
+from src.api.resilience import acall_upstream, call_timeout, call_upstream, get_breaker, guarded
+from src.api.telemetry import increment
+
+
+class ResilientChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose calls go through the "openai" circuit breaker and whose
+    per-call timeout is shortened to the time left before the request
+    deadline. Retries with jittered backoff are left to the OpenAI client.
+    Token usage is counted under ``openai.input_tokens`` and
+    ``openai.output_tokens``.
+    """
+
+    upstream: str = "openai"
+
+    def _get_request_payload(self, input_, *, stop=None, **kwargs):
+        payload = super()._get_request_payload(input_, stop=stop, **kwargs)
+        payload["timeout"] = call_timeout(self.request_timeout)
+        return payload
+
+    def _record_usage(self, message):
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            increment(f"{self.upstream}.input_tokens", usage.get("input_tokens", 0))
+            increment(f"{self.upstream}.output_tokens", usage.get("output_tokens", 0))
+
+    def _generate(self, *args, **kwargs):
+        with guarded(get_breaker(self.upstream)):
+            result = super()._generate(*args, **kwargs)
+        for generation in result.generations:
+            self._record_usage(generation.message)
+        return result
+
+    async def _agenerate(self, *args, **kwargs):
+        with guarded(get_breaker(self.upstream)):
+            result = await super()._agenerate(*args, **kwargs)
+        for generation in result.generations:
+            self._record_usage(generation.message)
+        return result
+
+    def _stream(self, *args, **kwargs):
+        with guarded(get_breaker(self.upstream)):
+            for chunk in super()._stream(*args, **kwargs):
+                self._record_usage(chunk.message)
+                yield chunk
+
+    async def _astream(self, *args, **kwargs):
+        with guarded(get_breaker(self.upstream)):
+            async for chunk in super()._astream(*args, **kwargs):
+                self._record_usage(chunk.message)
+                yield chunk
+
+
+class ResilientOpenAIEmbeddings(OpenAIEmbeddings):
+    """
+    OpenAIEmbeddings whose requests go through the "openai_embeddings"
+    circuit breaker, retrying transient failures with jittered backoff, and
+    whose per-request timeout is shortened to the time left before the
+    request deadline. The number of texts embedded is counted under
+    ``openai_embeddings.texts``.
+    """
+
+    upstream: str = "openai_embeddings"
+
+    @property
+    def _invocation_params(self):
+        params = super()._invocation_params
+        params["timeout"] = call_timeout(self.request_timeout)
+        return params
+
+    def embed_documents(self, texts, chunk_size=None):
+        increment(f"{self.upstream}.texts", len(texts))
+        return call_upstream(
+            lambda timeout: OpenAIEmbeddings.embed_documents(self, texts, chunk_size=chunk_size),
+            get_breaker(self.upstream)
+        )
+
+    async def aembed_documents(self, texts, chunk_size=None):
+        increment(f"{self.upstream}.texts", len(texts))
+        return await acall_upstream(
+            lambda timeout: OpenAIEmbeddings.aembed_documents(self, texts, chunk_size=chunk_size),
+            get_breaker(self.upstream)
+        )
+
+
+def create_chat_model(temperature):
+    """
+    Create the chat model used by the chains and the classifier
+    """
+    return ResilientChatOpenAI(
+        model=LLM_MODEL,
+        openai_api_key=OPENAI_API_KEY,
+        temperature=temperature,
+        timeout=LLM_TIMEOUT,
+        max_retries=UPSTREAM_RETRIES,
+        stream_usage=True
+    )
+
+
+def create_embeddings():
+    """
+    Create the embedding model used for documents, questions and the semantic cache
+    """
+    return ResilientOpenAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        openai_api_key=OPENAI_API_KEY,
+        request_timeout=LLM_TIMEOUT,
+        # Retried by call_upstream so that every attempt counts against the breaker
+        max_retries=0
+    )
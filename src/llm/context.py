@@ -0,0 +1,180 @@
+import math
+
+from collections import Counter
+from typing import Any, List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from config import LLM_MODEL, CHUNK_OVERLAP, CONTEXT_TOKEN_BUDGET, CONTEXT_RANK_WEIGHT, logger
+
+from src.api.telemetry import observe
+from src.embedding.lexical import tokenize
+
+
+def create_token_counter(model=LLM_MODEL):
+    """
+    Return a function counting tokens with the model's tiktoken encoding, or
+    estimating four characters per token when the encoding is unavailable
+    """
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text))
+    except Exception as err:
+        logger.warning(f"tiktoken encoding unavailable, estimating token counts. {err}")
+        return lambda text: math.ceil(len(text) / 4)
+
+def overlap_length(first, second, max_overlap):
+    """
+    Length of the longest suffix of first that is also a prefix of second
+    """
+    for length in range(min(len(first), len(second), max_overlap), 0, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+class ContextPacker:
+    """
+    Assembles retrieved chunks into the context for the "stuff" chain.
+
+    Duplicate chunks are dropped, chunks from the same page that continue
+    each other (the splitter's overlap) are merged into one passage, the
+    passages are re-ranked by query-term overlap blended with their
+    retrieval rank, and the best are packed into a token budget.
+    """
+
+    def __init__(
+        self,
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        rank_weight=CONTEXT_RANK_WEIGHT,
+        max_overlap=2 * CHUNK_OVERLAP,
+        count_tokens=None
+    ):
+        self.token_budget = token_budget
+        self.rank_weight = rank_weight
+        self.max_overlap = max_overlap
+        self._count_tokens = count_tokens
+
+    def count_tokens(self, text):
+        if self._count_tokens is None:
+            self._count_tokens = create_token_counter()
+        return self._count_tokens(text)
+
+    def deduplicate(self, documents):
+        """
+        Drop chunks whose text is already contained in a better-ranked chunk
+        """
+        kept = []
+        for document in documents:
+            text = document.page_content.strip()
+            if text and not any(text in other.page_content for other in kept):
+                kept.append(document)
+        return kept
+
+    def merge_adjacent(self, documents):
+        """
+        Merge chunks from the same page whose text continues another chunk,
+        keeping the position of the better-ranked one
+        """
+        passages = []
+        for document in documents:
+            key = (document.metadata.get("source"), document.metadata.get("page"))
+            for i, passage in enumerate(passages):
+                if (passage.metadata.get("source"), passage.metadata.get("page")) != key:
+                    continue
+                if overlap := overlap_length(passage.page_content, document.page_content, self.max_overlap):
+                    text = passage.page_content + document.page_content[overlap:]
+                elif overlap := overlap_length(document.page_content, passage.page_content, self.max_overlap):
+                    text = document.page_content + passage.page_content[overlap:]
+                else:
+                    continue
+                passages[i] = Document(page_content=text, metadata=passage.metadata)
+                break
+            else:
+                passages.append(document)
+        return passages
+
+    def rerank(self, question, documents):
+        """
+        Order passages by idf-weighted query-term overlap plus a retrieval rank prior
+        """
+        terms = set(tokenize(question))
+        tokenized = [Counter(tokenize(document.page_content)) for document in documents]
+        frequencies = Counter(term for counts in tokenized for term in terms if term in counts)
+
+        def score(rank):
+            counts = tokenized[rank]
+            lexical = sum(
+                math.log(1 + len(documents) / frequencies[term]) * counts[term] / (counts[term] + 1)
+                for term in terms if term in counts
+            )
+            return lexical / max(len(terms), 1) + self.rank_weight / (rank + 1)
+
+        order = sorted(range(len(documents)), key=score, reverse=True)
+        return [documents[rank] for rank in order]
+
+    def truncate(self, text):
+        """
+        Longest prefix of the text, cut at a word boundary, that fits the token budget
+        """
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(text[:middle]) <= self.token_budget:
+                low = middle
+            else:
+                high = middle - 1
+        if low < len(text) and (boundary := text.rfind(" ", 0, low + 1)) > 0:
+            low = boundary
+        return text[:low].rstrip()
+
+    def pack(self, question, documents):
+        """
+        Return the passages to stuff into the prompt, best first, within the token budget
+        """
+        passages = self.rerank(question, self.merge_adjacent(self.deduplicate(documents)))
+
+        packed, used = [], 0
+        for passage in passages:
+            tokens = self.count_tokens(passage.page_content)
+            if used + tokens > self.token_budget:
+                if packed:
+                    continue
+                # Never leave the context empty because the best passage alone is too long
+                passage = Document(page_content=self.truncate(passage.page_content), metadata=passage.metadata)
+                tokens = self.count_tokens(passage.page_content)
+            packed.append(passage)
+            used += tokens
+
+        logger.debug("Packed {} of {} chunks into {} tokens", len(packed), len(documents), used)
+        observe("retrieval.candidates", len(documents))
+        observe("retrieval.packed_chunks", len(packed))
+        observe("retrieval.context_tokens", used)
+        return packed
+
+
+class ContextPackingRetriever(BaseRetriever):
+    """
+    Retriever that packs another retriever's results with a ContextPacker
+    """
+
+    retriever: BaseRetriever
+    packer: Any
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self.packer.pack(query, documents)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self.packer.pack(query, documents)
@@ -0,0 +1,438 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from unittest.mock import AsyncMock, MagicMock
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.base import empty_checkpoint
+from src.agent.checkpoint import SQLiteCheckpointSaver
+from src.agent.classifier import RuleBasedClassifier
+from src.agent.graph import load_thread_messages
+from src.agent.memory import ConversationMemory, is_summary
+from src.agent.resources import ResourceRegistry
+from src.api.telemetry import set_exporter
+from src.document.store import create_local_engine
+
+
+class TestResourceRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.resources = ResourceRegistry()
+        self.resources.set("local_db", create_local_engine(f"sqlite:///{os.path.join(self.tmp_dir.name, 'agent.db')}"))
+
+    def tearDown(self):
+        self.resources.shutdown()
+        self.tmp_dir.cleanup()
+
+    def test_resource_created_once(self):
+        # Register a factory that counts its invocations
+        factory = MagicMock(side_effect=lambda: object())
+        self.resources.register("thing", factory)
+
+        # Access the resource repeatedly
+        first = self.resources.thing
+        second = self.resources.get("thing")
+
+        # Verify the factory ran exactly once and the instance is shared
+        self.assertIs(first, second)
+        factory.assert_called_once()
+
+    def test_shutdown_closes_resources(self):
+        # Register a resource with a close hook
+        close = MagicMock()
+        self.resources.register("thing", lambda: "instance", close=close)
+        self.resources.get("thing")
+
+        # Shut down the registry
+        self.resources.shutdown()
+
+        # Verify the close hook ran and the instance was dropped
+        close.assert_called_once_with("instance")
+        self.assertEqual(self.resources.get("thing"), "instance")
+
+    def test_graph_import_defers_client_libraries(self):
+        # Import the graph in a fresh interpreter
+        code = (
+            "import sys, src.agent.graph; "
+            "print(','.join(m for m in ('qdrant_client', 'openai', 'langchain_openai', 'langchain.chains', 'sqlalchemy') if m in sys.modules))"
+        )
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+        # Verify none of the client libraries were loaded
+        self.assertEqual(completed.stdout.strip(), "")
+
+    def test_agent_executor_uses_injected_resources(self):
+        # Inject mocked upstream clients
+        classifier_llm = MagicMock()
+        classifier_llm.invoke.return_value = AIMessage(content='{"type": "weather", "city": "Paris"}')
+        weather_api = MagicMock()
+        weather_api.get_weather_many.return_value = [{"name": "Paris"}]
+        weather_api.format_weather_reports.return_value = "Weather in Paris"
+        weather_chain = MagicMock()
+        weather_chain.invoke.return_value = AIMessage(content="It is sunny in Paris.")
+
+        self.resources.set("classifier_llm", classifier_llm)
+        self.resources.set("weather_api", weather_api)
+        self.resources.set("weather_chain", weather_chain)
+
+        # Run the agent twice through the shared executor
+        agent_executor = self.resources.agent_executor
+        for _ in range(2):
+            result = agent_executor([HumanMessage(content="Should I pack a jacket for my trip to Paris?")])
+
+        # Verify the shared clients were reused and the graph compiled once
+        self.assertEqual(result["messages"][-1].content, "It is sunny in Paris.")
+        self.assertIs(agent_executor, self.resources.agent_executor)
+        self.assertEqual(classifier_llm.invoke.call_count, 2)
+        weather_api.get_weather_many.assert_called_with(["Paris"])
+
+    def test_agent_executor_traces_each_node(self):
+        # Capture exported traces and answer a query the agent cannot classify
+        exporter = MagicMock()
+        previous = set_exporter(exporter)
+        self.addCleanup(set_exporter, previous)
+        classifier_llm = MagicMock()
+        classifier_llm.invoke.return_value = AIMessage(content='{"type": "unknown"}')
+        self.resources.set("classifier_llm", classifier_llm)
+
+        # Run the agent
+        self.resources.agent_executor([HumanMessage(content="Tell me something interesting")])
+
+        # Verify one trace with a span per node that ran
+        exporter.export.assert_called_once()
+        trace = exporter.export.call_args.args[0].to_dict()
+        self.assertEqual(trace["name"], "agent")
+        self.assertEqual(
+            [record["name"] for record in trace["spans"] if record["name"].startswith("node.")],
+            ["node.classify_query", "node.generate_response"]
+        )
+
+    def test_async_agent_executor_uses_async_nodes(self):
+        # Inject mocked upstream clients with async methods
+        classifier_llm = MagicMock()
+        classifier_llm.ainvoke = AsyncMock(return_value=AIMessage(content='{"type": "document"}'))
+        document_chain = MagicMock()
+        document_chain.ainvoke = AsyncMock(return_value={"result": "The answer is 42."})
+
+        semantic_cache = MagicMock()
+        semantic_cache.alookup = AsyncMock(return_value=(None, [1.0, 0.0]))
+
+        self.resources.set("classifier_llm", classifier_llm)
+        self.resources.set("semantic_cache", semantic_cache)
+        self.resources.set("async_document_chain", document_chain)
+
+        # Run the agent through the async executor
+        async_agent_executor = self.resources.async_agent_executor
+        result = asyncio.run(async_agent_executor([HumanMessage(content="What does the manual say?")]))
+
+        # Verify only the async paths were used
+        self.assertEqual(result["messages"][-1].content, "The answer is 42.")
+        classifier_llm.invoke.assert_not_called()
+        document_chain.ainvoke.assert_awaited_once_with({"query": "What does the manual say?"})
+        semantic_cache.store.assert_called_once()
+
+    def test_streaming_agent_executor_yields_tokens(self):
+        # Inject a weather chain backed by a fake chat model that streams word by word
+        weather_api = MagicMock()
+        weather_api.get_weather_many.return_value = [{"name": "London"}]
+        weather_api.format_weather_reports.return_value = "Weather in London"
+        llm = GenericFakeChatModel(messages=iter([AIMessage(content="It is raining in London.")]))
+
+        self.resources.set("weather_api", weather_api)
+        self.resources.set("weather_chain", RunnableLambda(lambda inputs: inputs["question"]) | llm)
+
+        # Stream the agent
+        events = list(self.resources.streaming_agent_executor(
+            [HumanMessage(content="What's the weather like in London today?")]
+        ))
+
+        # Verify node transitions, incremental tokens and the final state
+        nodes = [event["node"] for event in events if event["type"] == "node"]
+        tokens = [event["content"] for event in events if event["type"] == "token"]
+        self.assertEqual(nodes, ["classify_query", "get_weather", "generate_response"])
+        self.assertGreater(len(tokens), 1)
+        self.assertEqual("".join(tokens), "It is raining in London.")
+        self.assertEqual(events[-1]["type"], "final")
+        self.assertEqual(events[-1]["state"]["messages"][-1].content, "It is raining in London.")
+
+    def test_streaming_agent_executor_without_tokens(self):
+        # Stream a query the agent cannot classify
+        classifier_llm = MagicMock()
+        classifier_llm.ainvoke = AsyncMock(return_value=AIMessage(content='{"type": "unknown"}'))
+        self.resources.set("classifier_llm", classifier_llm)
+
+        async def collect():
+            return [event async for event in self.resources.async_streaming_agent_executor(
+                [HumanMessage(content="Tell me something interesting")]
+            )]
+
+        events = asyncio.run(collect())
+
+        # Verify the canned reply is sent as a single token
+        tokens = [event["content"] for event in events if event["type"] == "token"]
+        self.assertEqual(len(tokens), 1)
+        self.assertEqual(tokens[0], events[-1]["state"]["response"])
+
+    def test_batch_agent_executor_batches_each_stage(self):
+        # Inject mocked upstream clients with batch methods
+        classifier_llm = MagicMock()
+        classifier_llm.invoke.return_value = AIMessage(
+            content='[{"type": "document"}, {"type": "weather", "cities": ["Paris"]}]'
+        )
+        weather_api = MagicMock()
+        weather_api.get_weather_many.side_effect = lambda cities: [{"name": city} for city in cities]
+        weather_api.format_weather_reports.side_effect = lambda reports: ", ".join(
+            f"Weather in {data['name']}" for data in reports
+        )
+        weather_chain = MagicMock()
+        weather_chain.batch.side_effect = lambda inputs, config: [
+            AIMessage(content=item["weather_data"]) for item in inputs
+        ]
+        embeddings = MagicMock()
+        embeddings.embed_documents.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+        semantic_cache = MagicMock()
+        semantic_cache.match.return_value = None
+        vector_db = MagicMock()
+        vector_db.similarity_search_batch.side_effect = lambda queries, vectors: [[] for _ in queries]
+        combine_documents_chain = MagicMock()
+        combine_documents_chain.batch.side_effect = lambda inputs, config: [
+            {"output_text": f"Answer to {item['question']}"} for item in inputs
+        ]
+
+        for name, instance in (
+            ("classifier_llm", classifier_llm), ("weather_api", weather_api), ("weather_chain", weather_chain),
+            ("embeddings", embeddings), ("semantic_cache", semantic_cache), ("vector_db", vector_db),
+            ("combine_documents_chain", combine_documents_chain)
+        ):
+            self.resources.set(name, instance)
+
+        # Run a batch mixing fast-path and LLM-classified conversations
+        questions = [
+            "What's the weather like in New York today?",
+            "Summarize the key findings in the report",
+            "What does the report say about rain in London?",
+            "Should I pack a jacket for my trip to Paris?",
+            "Is it raining in New York?"
+        ]
+        results = self.resources.batch_agent_executor([[HumanMessage(content=question)] for question in questions])
+
+        # Verify each stage ran once for the whole batch, with answers in order
+        self.assertEqual([result["messages"][-1].content for result in results], [
+            "Weather in New York",
+            "Answer to Summarize the key findings in the report",
+            "Answer to What does the report say about rain in London?",
+            "Weather in Paris",
+            "Weather in New York"
+        ])
+        classifier_llm.invoke.assert_called_once()
+        weather_api.get_weather_many.assert_called_once_with(["New York", "Paris"])
+        weather_chain.batch.assert_called_once()
+        embeddings.embed_documents.assert_called_once()
+        vector_db.similarity_search_batch.assert_called_once()
+        combine_documents_chain.batch.assert_called_once()
+
+
+    def test_agent_executor_resumes_interrupted_run(self):
+        # Inject a weather chain that fails once, as if the worker died mid-run
+        classifier_llm = MagicMock()
+        classifier_llm.invoke.return_value = AIMessage(content='{"type": "weather", "city": "Paris"}')
+        weather_api = MagicMock()
+        weather_api.get_weather_many.return_value = [{"name": "Paris"}]
+        weather_api.format_weather_reports.return_value = "Weather in Paris"
+        weather_chain = MagicMock()
+        weather_chain.invoke.side_effect = [RuntimeError("upstream timeout"), AIMessage(content="Pack a jacket.")]
+
+        self.resources.set("classifier_llm", classifier_llm)
+        self.resources.set("weather_api", weather_api)
+        self.resources.set("weather_chain", weather_chain)
+
+        messages = [HumanMessage(content="Should I pack a jacket for my trip to Paris?")]
+        with self.assertRaises(RuntimeError):
+            self.resources.agent_executor(messages, thread_id="conversation-1")
+
+        # Retry on the same thread
+        result = self.resources.agent_executor(messages, thread_id="conversation-1")
+
+        # Verify the classification was not repeated and the history was checkpointed
+        self.assertEqual(result["response"], "Pack a jacket.")
+        classifier_llm.invoke.assert_called_once()
+        self.assertEqual(
+            [message.content for message in load_thread_messages("conversation-1", resources=self.resources)],
+            ["Should I pack a jacket for my trip to Paris?", "Pack a jacket."]
+        )
+
+
+class TestSQLiteCheckpointSaver(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_local_engine(f"sqlite:///{os.path.join(self.tmp_dir.name, 'checkpoints.db')}")
+        self.checkpointer = SQLiteCheckpointSaver(engine=self.engine, keep_per_thread=3)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def put(self, thread_id, number):
+        checkpoint = {**empty_checkpoint(), "id": f"{number:04}", "channel_values": {"response": f"answer {number}"}}
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        return self.checkpointer.put(config, checkpoint, {"step": number}, {})
+
+    def test_latest_checkpoint_and_writes(self):
+        # Store two checkpoints and a node's writes against the latest
+        self.put("thread", 1)
+        config = self.put("thread", 2)
+        self.checkpointer.put_writes(config, [("response", "partial")], task_id="task")
+
+        # Verify the latest checkpoint comes back with its pending writes
+        latest = self.checkpointer.get_tuple({"configurable": {"thread_id": "thread"}})
+        self.assertEqual(latest.checkpoint["channel_values"], {"response": "answer 2"})
+        self.assertEqual(latest.metadata["step"], 2)
+        self.assertEqual(latest.pending_writes, [("task", "response", "partial")])
+
+    def test_prunes_old_checkpoints(self):
+        # Store more checkpoints than a thread keeps
+        for number in range(5):
+            self.put("busy", number)
+        self.put("idle", 0)
+
+        # Verify only the newest are kept
+        steps = [checkpoint.metadata["step"] for checkpoint in self.checkpointer.list({"configurable": {"thread_id": "busy"}})]
+        self.assertEqual(steps, [4, 3, 2])
+
+        # Verify idle threads are dropped entirely
+        self.assertEqual(self.checkpointer.prune(max_age=-1), 2)
+        self.assertIsNone(self.checkpointer.get_tuple({"configurable": {"thread_id": "idle"}}))
+
+
+class TestConversationMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.llm = MagicMock()
+        self.llm.invoke.return_value = AIMessage(content="The user asked about the weather in several cities.")
+        self.memory = ConversationMemory(
+            llm=self.llm, window_turns=2, summarize_after=2, max_tokens=1000, count_tokens=lambda text: len(text.split())
+        )
+        self.addCleanup(self.memory.close)
+
+    @staticmethod
+    def conversation(turns):
+        messages = [AIMessage(content="Hello!")]
+        for turn in range(turns):
+            messages += [HumanMessage(content=f"Question {turn}"), AIMessage(content=f"Answer {turn}")]
+        return messages
+
+    def test_short_history_is_unchanged(self):
+        # Compact a conversation shorter than the window plus the summary trigger
+        messages = self.conversation(2)
+        compacted = self.memory.compact(messages)
+
+        # Verify nothing was summarized and the caller's list was copied
+        self.assertEqual(compacted, messages)
+        self.assertIsNot(compacted, messages)
+        self.llm.invoke.assert_not_called()
+
+    def wait_for_summaries(self):
+        # The summarizer runs one job at a time, in order
+        self.memory._executor.submit(lambda: None).result(timeout=5)
+
+    def test_older_turns_are_summarized_in_the_background(self):
+        # Compact a conversation with enough turns behind the window while the LLM is slow
+        release = threading.Event()
+        summary = self.llm.invoke.return_value
+
+        def slow_summary(prompt):
+            release.wait(5)
+            return summary
+
+        self.llm.invoke.side_effect = slow_summary
+        messages = self.conversation(3)
+        compacted = self.memory.compact(messages)
+
+        # Verify the request did not wait for the summary and kept every turn meanwhile
+        self.assertEqual(compacted, messages)
+        release.set()
+        self.wait_for_summaries()
+
+        # Verify the next request folds the older turns into the summary, followed by the window
+        compacted = self.memory.compact(messages + [HumanMessage(content="Question 3")])
+        self.assertTrue(is_summary(compacted[0]))
+        self.assertIn("several cities", compacted[0].content)
+        self.assertEqual([message.content for message in compacted[1:]], ["Question 1", "Answer 1", "Question 2", "Answer 2", "Question 3"])
+        self.llm.invoke.assert_called_once()
+
+        # Verify the previous summary is folded into the next one
+        compacted = self.memory.compact(compacted + [AIMessage(content="Answer 3"), HumanMessage(content="Question 4")])
+        self.wait_for_summaries()
+        self.assertEqual(self.llm.invoke.call_count, 2)
+        self.assertIn("several cities", self.llm.invoke.call_args.args[0])
+        compacted = self.memory.compact(compacted)
+        self.assertEqual(sum(is_summary(message) for message in compacted), 1)
+        self.assertEqual([message.content for message in compacted[1:]], ["Question 3", "Answer 3", "Question 4"])
+
+    def test_failed_summary_keeps_older_turns(self):
+        # Fail the summarization
+        self.llm.invoke.side_effect = RuntimeError("upstream unavailable")
+        messages = self.conversation(3)
+        self.memory.compact(messages)
+        self.wait_for_summaries()
+
+        # Verify no turn was lost and the summary is attempted again
+        self.assertEqual(self.memory.compact(messages), messages)
+        self.wait_for_summaries()
+        self.assertEqual(self.llm.invoke.call_count, 2)
+
+    def test_token_cap_keeps_latest_turn(self):
+        # Compact a conversation whose turns exceed the token cap
+        memory = ConversationMemory(window_turns=10, max_tokens=5, count_tokens=lambda text: len(text.split()))
+        compacted = memory.compact(self.conversation(4))
+
+        # Verify only the latest turn survives
+        self.assertEqual([message.content for message in compacted], ["Question 3", "Answer 3"])
+
+
+class TestRuleBasedClassifier(unittest.TestCase):
+
+    def setUp(self):
+        self.classifier = RuleBasedClassifier()
+
+    def test_weather_query_with_known_city(self):
+        # Classify an obvious weather query
+        classification = self.classifier.classify("What's the weather like in New York today?")
+
+        # Verify it was resolved locally
+        self.assertEqual(classification["type"], "weather")
+        self.assertEqual(classification["city"], "New York")
+
+    def test_weather_query_with_several_cities(self):
+        # Classify a query comparing cities, one of them mentioned twice
+        classification = self.classifier.classify("Is it warmer in New Delhi or London, and is it rainy in Paris or London?")
+
+        # Verify every city is extracted once, in order of mention, without a bare "Delhi"
+        self.assertEqual(classification["type"], "weather")
+        self.assertEqual(classification["cities"], ["New Delhi", "London", "Paris"])
+
+    def test_document_query(self):
+        # Classify an obvious document query
+        classification = self.classifier.classify("Summarize the key findings in the report")
+
+        # Verify it was resolved locally
+        self.assertEqual(classification["type"], "document")
+
+    def test_ambiguous_query_falls_back(self):
+        # Classify queries the rules cannot decide confidently
+        self.assertIsNone(self.classifier.classify("What does the report say about rain in London?"))
+        self.assertIsNone(self.classifier.classify("Is it snowing in Gotham?"))
+        self.assertIsNone(self.classifier.classify("Tell me something interesting"))
+
+        # Verify the counters reflect the fallbacks
+        stats = self.classifier.stats()
+        self.assertEqual(stats["hits"], 0)
+        self.assertEqual(stats["fallbacks"], 3)
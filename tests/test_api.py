@@ -1,16 +1,25 @@
+import asyncio
+import json
+import threading
+import time
 import unittest
 
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
 from unittest.mock import patch, MagicMock
+from src.api.cache import TTLCache
+from src.api.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, call_timeout, deadline_scope, guarded
 from src.api.weather import WeatherAPI
 
 
 class TestWeatherAPI(unittest.TestCase):
 
     def setUp(self):
-        self.weather_api = WeatherAPI()
+        self.weather_api = WeatherAPI(breaker=CircuitBreaker("test", failure_threshold=2))
         self.weather_api.api_key = "test_key"
     
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_weather_success(self, mock_get):
         # Mock the API response
         mock_response = MagicMock()
@@ -32,7 +41,7 @@ class TestWeatherAPI(unittest.TestCase):
         self.assertEqual(result["sys"]["country"], "GB")
         self.assertEqual(result["main"]["temp"], 15.5)
     
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_weather_error(self, mock_get):
         # Mock the API response with an error
         mock_get.side_effect = Exception("API error")
@@ -62,4 +71,289 @@ class TestWeatherAPI(unittest.TestCase):
         self.assertIn("14.0°C", formatted_data)
         self.assertIn("75%", formatted_data)
         self.assertIn("5.0 m/s", formatted_data)
-        self.assertIn("cloudy", formatted_data)
\ No newline at end of file
+        self.assertIn("cloudy", formatted_data)
+    @patch('httpx.AsyncClient.get')
+    def test_aget_weather_success(self, mock_get):
+        # Mock the async API response
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"name": "London"}
+        mock_response.raise_for_status.return_value = None
+        mock_get.return_value = mock_response
+
+        # Call the API from an event loop
+        result = asyncio.run(self.weather_api.aget_weather("London"))
+
+        # Verify the result
+        self.assertEqual(result["name"], "London")
+        self.assertEqual(mock_get.call_args.kwargs["params"]["q"], "London")
+
+    def test_async_clients_are_per_loop_and_all_closed(self):
+        async def client():
+            return self.weather_api._get_async_client()
+
+        # Use the client from a loop that stays open, then from a second loop that closes them
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        first = loop.run_until_complete(client())
+
+        async def use_and_close():
+            second = await client()
+            self.assertIs(await client(), second)
+            await self.weather_api.aclose()
+            return second
+
+        second = asyncio.run(use_and_close())
+
+        # Verify each loop got its own client and neither was left open
+        self.assertIsNot(first, second)
+        self.assertTrue(first.is_closed)
+        self.assertTrue(second.is_closed)
+
+    def test_clients_of_ended_loops_are_not_kept(self):
+        async def client():
+            return self.weather_api._get_async_client()
+
+        # Use the client from two loops in turn, as repeated asyncio.run calls do
+        first = asyncio.run(client())
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        second = loop.run_until_complete(client())
+
+        # Verify the first loop's client was released and close() closes the second
+        self.assertIsNot(first, second)
+        self.assertEqual(list(self.weather_api._async_clients.values()), [second])
+        self.weather_api.close()
+        self.assertTrue(second.is_closed)
+
+    @patch('requests.Session.get')
+    def test_get_weather_cached(self, mock_get):
+        # Mock the API response
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"name": "London"}
+        mock_response.raise_for_status.return_value = None
+        mock_get.return_value = mock_response
+
+        # Ask for the same city with different spelling
+        self.weather_api.get_weather("London")
+        result = self.weather_api.get_weather("  london ")
+
+        # Verify only one upstream call was made
+        self.assertEqual(result["name"], "London")
+        mock_get.assert_called_once()
+        self.assertEqual(self.weather_api.cache_stats()["hits"], 1)
+
+    @patch('requests.Session.get')
+    def test_get_weather_error_not_cached(self, mock_get):
+        # Mock a failing API
+        mock_get.side_effect = Exception("API error")
+
+        # Call the API twice
+        self.weather_api.get_weather("London")
+        self.weather_api.get_weather("London")
+
+        # Verify errors are retried upstream rather than cached
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('requests.Session.get')
+    def test_get_weather_coalesces_concurrent_misses(self, mock_get):
+        # Mock a slow API response
+        release = threading.Event()
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"name": "London"}
+
+        def slow_get(*args, **kwargs):
+            release.wait(timeout=5)
+            return mock_response
+
+        mock_get.side_effect = slow_get
+
+        # Fire concurrent requests for the same city
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(self.weather_api.get_weather, "London") for _ in range(8)]
+            while self.weather_api.cache_stats()["coalesced"] < 7:
+                time.sleep(0.01)
+            release.set()
+            results = [future.result() for future in futures]
+
+        # Verify they shared a single upstream call
+        self.assertTrue(all(result["name"] == "London" for result in results))
+        mock_get.assert_called_once()
+
+    @patch('src.api.resilience.time.sleep')
+    @patch('requests.Session.get')
+    def test_get_weather_retries_transient_errors(self, mock_get, mock_sleep):
+        # Mock a timeout followed by a good response
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"name": "London"}
+        mock_get.side_effect = [requests.Timeout("read timed out"), mock_response]
+
+        # Call the API
+        result = self.weather_api.get_weather("London")
+
+        # Verify the call was retried after a backoff, with a timeout on each attempt
+        self.assertEqual(result["name"], "London")
+        self.assertEqual(mock_get.call_count, 2)
+        mock_sleep.assert_called_once()
+        self.assertEqual(mock_get.call_args.kwargs["timeout"], self.weather_api.timeout)
+
+    @patch('src.api.resilience.time.sleep')
+    @patch('requests.Session.get')
+    def test_open_circuit_serves_stale_weather(self, mock_get, mock_sleep):
+        # Cache a reading, then let it expire and take the upstream down
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"name": "London"}
+        mock_get.return_value = mock_response
+        self.weather_api.cache.ttl = 0
+        self.weather_api.get_weather("London")
+        mock_get.reset_mock()
+        mock_get.side_effect = requests.ConnectionError("connection refused")
+
+        # Call the API until the circuit opens
+        first = self.weather_api.get_weather("London")
+        second = self.weather_api.get_weather("London")
+
+        # Verify the stale reading was served and the open circuit skipped the upstream
+        self.assertEqual(first["name"], "London")
+        self.assertEqual(second["name"], "London")
+        self.assertEqual(self.weather_api.breaker.state, "open")
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('requests.Session.get')
+    def test_get_weather_many_fetches_unknown_cities_concurrently(self, mock_get):
+        # Mock slow responses that record how many requests overlap
+        in_flight = [0, 0]
+        lock = threading.Lock()
+
+        def slow_get(url, params, timeout):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+            mock_response = MagicMock()
+            mock_response.json.return_value = {"name": params["q"], "id": len(params["q"])}
+            return mock_response
+
+        mock_get.side_effect = slow_get
+
+        # Ask for three cities, one of them twice
+        results = self.weather_api.get_weather_many(["Paris", "Tokyo", "paris", "Lima"])
+
+        # Verify one request per distinct city, run concurrently, with results in order
+        self.assertEqual([result["name"] for result in results], ["Paris", "Tokyo", "Paris", "Lima"])
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertGreater(in_flight[1], 1)
+
+    @patch('requests.Session.get')
+    def test_get_weather_many_uses_group_endpoint_for_known_ids(self, mock_get):
+        # Learn the city IDs from single lookups, then let the readings expire
+        mock_response = MagicMock()
+        mock_response.json.side_effect = [{"name": "Paris", "id": 1}, {"name": "Tokyo", "id": 2}]
+        mock_get.return_value = mock_response
+        self.weather_api.get_weather("Paris")
+        self.weather_api.get_weather("Tokyo")
+        self.weather_api.cache.clear()
+        mock_get.reset_mock()
+        mock_response.json.side_effect = None
+        mock_response.json.return_value = {"list": [{"name": "Tokyo", "id": 2}, {"name": "Paris", "id": 1}]}
+
+        # Ask for both cities again
+        results = self.weather_api.get_weather_many(["Paris", "Tokyo"])
+
+        # Verify a single group request by ID served both
+        self.assertEqual([result["name"] for result in results], ["Paris", "Tokyo"])
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args.args[0], self.weather_api.group_url)
+        self.assertEqual(mock_get.call_args.kwargs["params"]["id"], "1,2")
+
+    def test_format_weather_reports(self):
+        # Verify reports are joined into one context, and an empty list is an error
+        reports = [{"error": "city not found"}, {"error": "timeout"}]
+        self.assertEqual(
+            self.weather_api.format_weather_reports(reports),
+            "Error: city not found\nError: timeout"
+        )
+        self.assertTrue(self.weather_api.format_weather_reports([]).startswith("Error"))
+
+
+class TestResilience(unittest.TestCase):
+
+    def test_circuit_breaker_half_open(self):
+        # Open a breaker with a controllable clock
+        now = [0.0]
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.record_failure()
+
+        # Verify calls fail fast until the reset timeout passes
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        # Verify a single trial call is let through, and success closes the circuit
+        now[0] = 11
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_guarded_counts_deadlines_but_not_caller_errors(self):
+        # Fail calls through a breaker that opens after two failures
+        breaker = CircuitBreaker("guarded-test", failure_threshold=2, reset_timeout=10)
+        not_found = requests.HTTPError(response=MagicMock(status_code=404))
+
+        # Verify a rejected request leaves the circuit closed
+        for _ in range(3):
+            with self.assertRaises(requests.HTTPError):
+                with guarded(breaker):
+                    raise not_found
+        self.assertEqual(breaker.state, "closed")
+
+        # Verify running out of time against a slow upstream opens it
+        for _ in range(2):
+            with self.assertRaises(DeadlineExceeded):
+                with guarded(breaker):
+                    raise DeadlineExceeded("deadline exceeded")
+        self.assertEqual(breaker.state, "open")
+
+    def test_call_timeout_follows_deadline(self):
+        # Verify the cap applies outside a deadline, and is shortened inside one
+        self.assertEqual(call_timeout(5), 5)
+        with deadline_scope(1):
+            self.assertLessEqual(call_timeout(5), 1)
+            with deadline_scope(10):
+                self.assertLessEqual(call_timeout(5), 1)
+        with deadline_scope(-1):
+            with self.assertRaises(DeadlineExceeded):
+                call_timeout(5)
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.cache = TTLCache(max_entries=2, ttl=10, clock=lambda: self.now)
+
+    def test_lru_eviction(self):
+        # Fill the cache and touch the oldest entry
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+
+        # Insert a third entry
+        self.cache.set("c", 3)
+
+        # Verify the least recently used entry was evicted
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        # Store an entry and advance past its TTL
+        self.cache.set("a", 1)
+        self.now = 11
+
+        # Verify the entry is gone
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["expirations"], 1)
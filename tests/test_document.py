@@ -0,0 +1,363 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from unittest.mock import MagicMock, patch
+from config import QDRANT_COLLECTION_NAME
+from src.document.jobs import ACTIVE_STATUSES, IngestionJobQueue
+from src.document.store import create_local_engine
+from src.document.manifest import FileManifest, hash_file
+from src.document.pipeline import IngestionPipeline
+
+
+def write_pdf(path, page_texts):
+    """
+    Write a minimal PDF with one line of Helvetica text per page
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    page_ids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(body)
+    body += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    body += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    body += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as f:
+        f.write(body)
+
+
+class TestIngestionPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pdf_path = os.path.join(self.tmp_dir.name, "manual.pdf")
+        write_pdf(self.pdf_path, [f"Page {number} of the manual" for number in range(10)])
+
+        self.vector_db = MagicMock()
+        self.vector_db.embeddings.embed_documents.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+        self.vector_db.upsert_embeddings.side_effect = lambda texts, *args, **kwargs: [f"id-{text}" for text in texts]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_ingest_parses_embeds_and_upserts_in_batches(self):
+        # Ingest with parallel parsing and small batches
+        pipeline = IngestionPipeline(
+            self.vector_db, parse_workers=2, pages_per_task=3, embed_workers=2, batch_size=4, max_pending_batches=2
+        )
+        progress = MagicMock()
+        stats = pipeline.ingest(self.pdf_path, collection_name="test_collection", progress_callback=progress)
+
+        # Verify every page became a chunk and was upserted in batches
+        self.assertEqual(stats["pages_parsed"], 10)
+        self.assertEqual(stats["chunks_embedded"], 10)
+        self.assertEqual(stats["points_upserted"], 10)
+        self.assertEqual(self.vector_db.upsert_embeddings.call_count, 3)
+        self.assertTrue(all(len(call.args[0]) <= 4 for call in self.vector_db.upsert_embeddings.call_args_list))
+        self.assertEqual(len(stats["chunks"]), 10)
+
+        # Verify progress was reported and listeners notified once
+        self.assertEqual(progress.call_args.args[0]["points_upserted"], 10)
+        self.vector_db.notify_ingest.assert_called_once_with("test_collection")
+
+    def test_reingest_only_embeds_changed_chunks(self):
+        # Index the original file
+        pipeline = IngestionPipeline(self.vector_db, parse_workers=1, batch_size=4)
+        first = pipeline.ingest(self.pdf_path)
+
+        # Change one page, drop another and re-ingest incrementally
+        write_pdf(self.pdf_path, [f"Page {number} of the manual" for number in range(9)[:-1]] + ["Page 8 revised"])
+        self.vector_db.reset_mock()
+        second = pipeline.ingest(self.pdf_path, existing_chunks=first["chunks"])
+
+        # Verify only the revised chunk was embedded and the vanished ones deleted
+        self.assertEqual(second["chunks_skipped"], 8)
+        self.assertEqual(second["chunks_embedded"], 1)
+        self.assertEqual(second["points_deleted"], 2)
+        self.vector_db.embeddings.embed_documents.assert_called_once_with(["Page 8 revised"])
+        deleted = self.vector_db.delete_points.call_args.args[0]
+        self.assertEqual(sorted(deleted), sorted(set(first["chunks"].values()) - set(second["chunks"].values())))
+
+
+    def test_replace_source_deletes_untracked_points_first(self):
+        # Ingest a file whose earlier points are not tracked
+        self.vector_db.delete_source.return_value = 4
+        pipeline = IngestionPipeline(self.vector_db, parse_workers=1, batch_size=4)
+        stats = pipeline.ingest(self.pdf_path, replace_source=True)
+
+        # Verify they were deleted by source before the new points were stored
+        self.vector_db.delete_source.assert_called_once_with(self.pdf_path, collection_name=QDRANT_COLLECTION_NAME)
+        writes = [name for name, _, _ in self.vector_db.mock_calls if name in ("delete_source", "upsert_embeddings")]
+        self.assertEqual(writes[0], "delete_source")
+        self.assertEqual(stats["points_deleted"], 4)
+        self.assertEqual(stats["points_upserted"], 10)
+
+
+class TestIngestionJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_local_engine(f"sqlite:///{os.path.join(self.tmp_dir.name, 'jobs.db')}")
+        self.pipeline = MagicMock()
+        self.manifest = FileManifest(engine=self.engine, data_directory=self.tmp_dir.name, legacy_path=None)
+
+        for name, content in (("manual.pdf", b"manual"), ("copy.pdf", b"manual"), ("broken.pdf", b"broken")):
+            with open(self._path(name), "wb") as f:
+                f.write(content)
+
+        def ingest(filepath, collection_name, progress_callback, existing_chunks, replace_source):
+            if filepath.endswith("broken.pdf"):
+                raise ValueError("not a PDF")
+            stats = {"total_pages": 2, "pages_parsed": 2, "chunks_embedded": 3, "points_upserted": 3, "chunks": {"h1": "p1"}}
+            progress_callback(stats)
+            return stats
+
+        self.pipeline.ingest.side_effect = ingest
+        self.queue = IngestionJobQueue(
+            self.pipeline, manifest=self.manifest, engine=self.engine, workers=1, poll_interval=0.05
+        )
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def tearDown(self):
+        self.queue.stop(timeout=5)
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def _wait_for(self, job_id):
+        for _ in range(200):
+            job = self.queue.get(job_id)
+            if job["status"] not in ACTIVE_STATUSES:
+                return job
+            time.sleep(0.05)
+        self.fail(f"Job {job_id} did not finish")
+
+    def test_jobs_run_in_background_and_report_progress(self):
+        # Submit jobs before the workers start
+        completed = MagicMock()
+        self.queue.add_completion_listener(completed)
+        good_id = self.queue.submit(self._path("manual.pdf"), "manual.pdf")
+        copy_id = self.queue.submit(self._path("copy.pdf"), "copy.pdf")
+        bad_id = self.queue.submit(self._path("broken.pdf"), "broken.pdf")
+        self.assertEqual(self.queue.get(good_id)["status"], "queued")
+
+        # Start the workers and wait for the jobs
+        self.queue.start()
+        good_job = self._wait_for(good_id)
+        copy_job = self._wait_for(copy_id)
+        bad_job = self._wait_for(bad_id)
+
+        # Verify progress, duplicate skipping, failures and completion callbacks
+        self.assertEqual(good_job["status"], "succeeded")
+        self.assertEqual(good_job["points_upserted"], 3)
+        self.assertEqual(copy_job["status"], "skipped")
+        self.assertEqual(bad_job["status"], "failed")
+        self.assertIn("not a PDF", bad_job["error"])
+        completed.assert_called_once()
+        self.assertEqual(completed.call_args.args[0]["filename"], "manual.pdf")
+
+        # Verify the manifest recorded the file hash and chunk map
+        self.assertEqual(self.manifest.get("manual.pdf")["chunks"], {"h1": "p1"})
+        self.assertEqual(self.manifest.find_by_hash(hash_file(self._path("copy.pdf"))), "manual.pdf")
+        self.assertEqual(self.manifest.list_files(), ["manual.pdf"])
+
+    def test_changed_file_passes_existing_chunks(self):
+        # Record a previous version of the file
+        self.manifest.record("manual.pdf", "old-hash", {"h0": "p0"}, QDRANT_COLLECTION_NAME)
+
+        # Re-ingest the changed file
+        self.queue.start()
+        self._wait_for(self.queue.submit(self._path("manual.pdf"), "manual.pdf"))
+
+        # Verify the pipeline received the previously indexed chunks
+        self.assertEqual(self.pipeline.ingest.call_args.kwargs["existing_chunks"], {"h0": "p0"})
+
+    def test_same_content_in_another_collection_is_ingested(self):
+        # Index the content in another collection
+        self.manifest.record("manual.pdf", hash_file(self._path("manual.pdf")), {"h1": "p1"}, "manuals")
+
+        # Ingest a copy into the default collection
+        self.queue.start()
+        job = self._wait_for(self.queue.submit(self._path("copy.pdf"), "copy.pdf"))
+
+        # Verify it was not skipped as a duplicate
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(self.pipeline.ingest.call_args.kwargs["collection_name"], QDRANT_COLLECTION_NAME)
+
+    def test_same_filename_is_tracked_per_collection(self):
+        # Index the file in another collection
+        self.manifest.record("manual.pdf", "other-hash", {"h0": "p0"}, "manuals")
+
+        # Ingest the file into the default collection
+        self.queue.start()
+        self._wait_for(self.queue.submit(self._path("manual.pdf"), "manual.pdf"))
+
+        # Verify it started from scratch and left the other collection's entry alone
+        self.assertEqual(self.pipeline.ingest.call_args.kwargs["existing_chunks"], {})
+        self.assertFalse(self.pipeline.ingest.call_args.kwargs["replace_source"])
+        self.assertEqual(self.manifest.get("manual.pdf", "manuals")["chunks"], {"h0": "p0"})
+        self.assertEqual(self.manifest.get("manual.pdf")["chunks"], {"h1": "p1"})
+
+    def test_legacy_entry_replaces_untracked_points(self):
+        # Record a file imported from the legacy JSON, without a chunk map
+        self.manifest.record("manual.pdf", None, {}, QDRANT_COLLECTION_NAME)
+
+        # Re-ingest it
+        self.queue.start()
+        self._wait_for(self.queue.submit(self._path("manual.pdf"), "manual.pdf"))
+
+        # Verify its old points are replaced rather than duplicated
+        self.assertTrue(self.pipeline.ingest.call_args.kwargs["replace_source"])
+
+    def test_interrupted_jobs_are_requeued(self):
+        # Simulate a job left running by a crashed process
+        job_id = self.queue.submit(self._path("manual.pdf"), "manual.pdf")
+        self.queue._update(job_id, status="running")
+        self.queue.stale_after = 0
+
+        # Restart the workers
+        self.queue.start()
+
+        # Verify the job was picked up again
+        self.assertEqual(self._wait_for(job_id)["status"], "succeeded")
+
+    def test_jobs_interrupted_just_before_start_are_requeued_once_stale(self):
+        # Simulate a job claimed by a process that crashed shortly before the restart
+        self.queue.stale_after = 0.5
+        job_id = self.queue.submit(self._path("manual.pdf"), "manual.pdf")
+        self.assertEqual(self.queue._claim(), job_id)
+
+        # Restart the workers
+        self.queue.start()
+
+        # Verify the job is left alone while it could still be running, then picked up again
+        self.assertEqual(self.queue.get(job_id)["status"], "running")
+        self.assertEqual(self._wait_for(job_id)["status"], "succeeded")
+
+
+class TestFileManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_local_engine(f"sqlite:///{os.path.join(self.tmp_dir.name, 'manifest.db')}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def _touch(self, name):
+        with open(os.path.join(self.tmp_dir.name, name), "wb") as f:
+            f.write(name.encode("utf-8"))
+
+    def test_imports_legacy_json_once(self):
+        # Write a manifest in the old JSON format
+        legacy_path = os.path.join(self.tmp_dir.name, "processed_files.json")
+        with open(legacy_path, "w") as f:
+            json.dump({"files": {"manual.pdf": {"file_hash": "abc", "collection_name": "docs", "chunks": {"h1": "p1"}}}}, f)
+
+        # Open the manifest twice
+        FileManifest(engine=self.engine, data_directory=self.tmp_dir.name, legacy_path=legacy_path).remove("manual.pdf", "docs")
+        manifest = FileManifest(engine=self.engine, data_directory=self.tmp_dir.name, legacy_path=legacy_path)
+
+        # Verify the import ran only once, so the removal stuck
+        self.assertIsNone(manifest.get("manual.pdf", "docs"))
+
+        # Verify the imported entry on a fresh store
+        other = FileManifest(
+            engine=create_local_engine(f"sqlite:///{os.path.join(self.tmp_dir.name, 'other.db')}"),
+            data_directory=self.tmp_dir.name,
+            legacy_path=legacy_path
+        )
+        self.assertEqual(other.get("manual.pdf", "docs"), {"file_hash": "abc", "collection_name": "docs", "chunks": {"h1": "p1"}})
+        other.engine.dispose()
+
+    def test_entries_are_kept_per_collection(self):
+        manifest = FileManifest(engine=self.engine, data_directory=self.tmp_dir.name, legacy_path=None)
+        self._touch("manual.pdf")
+
+        # Record the same file in two collections
+        manifest.record("manual.pdf", "v1", {"h1": "p1"}, "docs")
+        manifest.record("manual.pdf", "v1", {"h1": "q1"}, "manuals")
+
+        # Verify neither overwrote the other
+        self.assertEqual(manifest.get("manual.pdf", "docs")["chunks"], {"h1": "p1"})
+        self.assertEqual(manifest.get("manual.pdf", "manuals")["chunks"], {"h1": "q1"})
+        self.assertEqual(manifest.list_files("manuals"), ["manual.pdf"])
+        self.assertEqual(manifest.list_files(), [])
+
+        # Verify removing one leaves the other
+        manifest.remove("manual.pdf", "docs")
+        self.assertIsNone(manifest.get("manual.pdf", "docs"))
+        self.assertEqual(manifest.count_chunks(), 1)
+
+    def test_migrates_filename_keyed_tables(self):
+        # Create the tables as they were when entries were keyed on the filename
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(
+                "CREATE TABLE manifest_files (filename VARCHAR PRIMARY KEY, file_hash VARCHAR(64), collection_name VARCHAR)"
+            )
+            connection.exec_driver_sql("CREATE INDEX ix_manifest_files_file_hash ON manifest_files (file_hash)")
+            connection.exec_driver_sql(
+                "CREATE TABLE manifest_chunks (filename VARCHAR, chunk_hash VARCHAR(64), point_id VARCHAR(36), PRIMARY KEY (filename, chunk_hash))"
+            )
+            connection.exec_driver_sql("INSERT INTO manifest_files VALUES ('manual.pdf', 'v1', 'docs'), ('old.pdf', NULL, NULL)")
+            connection.exec_driver_sql("INSERT INTO manifest_chunks VALUES ('manual.pdf', 'h1', 'p1')")
+
+        manifest = FileManifest(engine=self.engine, data_directory=self.tmp_dir.name, legacy_path=None)
+
+        # Verify the entries moved over, those without a collection into the default one
+        self.assertEqual(manifest.get("manual.pdf", "docs"), {"file_hash": "v1", "collection_name": "docs", "chunks": {"h1": "p1"}})
+        self.assertEqual(manifest.get("old.pdf"), {"file_hash": None, "collection_name": QDRANT_COLLECTION_NAME, "chunks": {}})
+        self.assertEqual(manifest.find_by_hash("v1", "docs"), "manual.pdf")
+
+    def test_record_replaces_chunks_and_list_files_is_cached(self):
+        manifest = FileManifest(engine=self.engine, data_directory=self.tmp_dir.name, legacy_path=None)
+        self._touch("manual.pdf")
+        self._touch("notes.pdf")
+
+        # Record two files, then a new version of one of them
+        manifest.record("manual.pdf", "v1", {"h1": "p1", "h2": "p2"}, "docs")
+        manifest.record("notes.pdf", "n1", {"h3": "p3"}, "docs")
+        manifest.record("manual.pdf", "v2", {"h2": "p2", "h4": "p4"}, "docs")
+
+        # Verify the chunk map was replaced, not merged
+        self.assertEqual(manifest.get("manual.pdf", "docs")["chunks"], {"h2": "p2", "h4": "p4"})
+        self.assertEqual(manifest.count_chunks(), 3)
+        self.assertEqual(manifest.find_by_hash("v2", "docs"), "manual.pdf")
+        self.assertIsNone(manifest.find_by_hash("v1", "docs"))
+
+        # Verify the same content indexed in another collection is not a duplicate
+        self.assertIsNone(manifest.find_by_hash("v2", "manuals"))
+
+        # Verify an unchanged manifest and directory skip the existence checks
+        self.assertEqual(manifest.list_files("docs"), ["manual.pdf", "notes.pdf"])
+        with patch("os.path.exists") as exists:
+            self.assertEqual(manifest.list_files("docs"), ["manual.pdf", "notes.pdf"])
+        exists.assert_not_called()
+
+        # Verify entries for deleted files are dropped
+        os.remove(os.path.join(self.tmp_dir.name, "notes.pdf"))
+        self.assertEqual(manifest.list_files("docs"), ["manual.pdf"])
+        self.assertIsNone(manifest.get("notes.pdf", "docs"))
@@ -1,7 +1,12 @@
 import unittest
 
 from unittest.mock import patch, MagicMock
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src.api.resilience import deadline_scope
 from src.llm.chain import LLMChain
+from src.llm.client import ResilientOpenAIEmbeddings
+from src.llm.context import ContextPacker, ContextPackingRetriever
 
 
 class TestLLMChain(unittest.TestCase):
@@ -27,4 +32,94 @@ class TestLLMChain(unittest.TestCase):
         document_chain = self.llm_chain.create_document_chain(mock_retriever)
         
         # Verify the chain is created
-        self.assertIsNotNone(document_chain)
\ No newline at end of file
+        self.assertIsNotNone(document_chain)
+
+class TestContextPacker(unittest.TestCase):
+
+    def setUp(self):
+        self.packer = ContextPacker(token_budget=12, max_overlap=20, count_tokens=lambda text: len(text.split()))
+
+    def _chunk(self, text, page):
+        return Document(page_content=text, metadata={"source": "manual.pdf", "page": page})
+
+    def test_pack_dedupes_merges_and_respects_budget(self):
+        # Retrieve overlapping, duplicated and unrelated chunks
+        documents = [
+            self._chunk("The XK-200 filter must be replaced", 3),
+            self._chunk("must be replaced every six months.", 3),
+            self._chunk("The XK-200 filter must be replaced", 3),
+            self._chunk("Warranty terms are described in the appendix of this very long manual section.", 9),
+            self._chunk("every six", 3)
+        ]
+
+        # Pack them for a question about the filter
+        packed = self.packer.pack("How often is the XK-200 filter replaced?", documents)
+
+        # Verify the continuation was merged, duplicates dropped and the budget respected
+        self.assertEqual(
+            [document.page_content for document in packed],
+            ["The XK-200 filter must be replaced every six months."]
+        )
+        self.assertLessEqual(sum(len(document.page_content.split()) for document in packed), 12)
+
+    def test_oversized_best_passage_is_truncated_to_budget(self):
+        # Retrieve a single passage longer than the whole budget
+        text = " ".join(f"word{i}" for i in range(30))
+        documents = [self._chunk(text, 1)]
+
+        # Verify its beginning is packed instead of an empty context
+        packed = self.packer.pack("word0", documents)
+        self.assertEqual(len(packed), 1)
+        self.assertEqual(packed[0].page_content, " ".join(f"word{i}" for i in range(12)))
+        self.assertEqual(packed[0].metadata, {"source": "manual.pdf", "page": 1})
+
+    def test_rerank_prefers_query_terms(self):
+        # Retrieve an off-topic chunk ahead of the relevant one
+        documents = [
+            self._chunk("Shipping and returns policy.", 1),
+            self._chunk("Clean the pump impeller monthly.", 2)
+        ]
+
+        # Verify the relevant chunk is ranked first
+        ranked = self.packer.rerank("how do I clean the pump impeller", documents)
+        self.assertEqual(ranked[0].metadata["page"], 2)
+
+    def test_document_chain_packs_retrieved_chunks(self):
+        # Wrap a retriever returning duplicates
+        retriever = MagicMock(spec=BaseRetriever)
+        retriever.invoke.return_value = [self._chunk("Same chunk", 1), self._chunk("Same chunk", 1)]
+        packing_retriever = ContextPackingRetriever(retriever=retriever, packer=self.packer)
+
+        # Verify the chain's retriever returns the packed context
+        self.assertEqual(len(packing_retriever.invoke("chunk")), 1)
+
+
+class TestResilientOpenAIEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+        self.embeddings = ResilientOpenAIEmbeddings(
+            model="text-embedding-3-small",
+            openai_api_key="test",
+            request_timeout=20,
+            max_retries=0,
+            check_embedding_ctx_length=False
+        )
+        self.embeddings.client = MagicMock()
+
+    @patch('src.api.resilience.time.sleep')
+    def test_transient_errors_are_retried_within_the_deadline(self, mock_sleep):
+        # Fail the first request with a connection error
+        self.embeddings.client.create.side_effect = [
+            ConnectionError("connection reset"),
+            {"data": [{"embedding": [0.1, 0.2]}]}
+        ]
+
+        with deadline_scope(5):
+            vector = self.embeddings.embed_query("Is it sunny in Paris?")
+
+        # Verify the request was retried with its timeout shortened to the deadline
+        self.assertEqual(vector, [0.1, 0.2])
+        self.assertEqual(self.embeddings.client.create.call_count, 2)
+        mock_sleep.assert_called_once()
+        self.assertLessEqual(self.embeddings.client.create.call_args.kwargs["timeout"], 5)
+
@@ -1,6 +1,15 @@
+import tempfile
 import unittest
 
+import numpy as np
+
+from langchain_core.documents import Document
 from unittest.mock import patch, MagicMock
+from src.api.resilience import CircuitBreaker
+from src.embedding.ann import IVFIndex
+from src.embedding.embedding_cache import CachedEmbeddings, EmbeddingStore
+from src.embedding.lexical import LexicalIndex
+from src.embedding.local_index import FlatIndex, LocalVectorBackend
 from src.embedding.vectordb import VectorDatabase
 
 
@@ -35,34 +44,375 @@ class TestVectorDatabase(unittest.TestCase):
         # Verify that create_collection was not called
         self.vector_db.client.create_collection.assert_not_called()
     
-    @patch('langchain_qdrant.Qdrant')
-    def test_store_documents(self, mock_qdrant):
-        # Mock documents
-        mock_documents = [MagicMock(), MagicMock()]
-        
-        # Mock Qdrant instance
-        mock_qdrant_instance = MagicMock()
-        mock_qdrant.return_value = mock_qdrant_instance
-        
+    def test_store_documents(self):
+        # Mock documents and their embeddings
+        documents = [Document(page_content="first", metadata={"page": 1}), Document(page_content="second", metadata={"page": 2})]
+        self.vector_db.embeddings.embed_documents.return_value = [[0.1, 0.2], [0.3, 0.4]]
+
         # Test storing documents
-        self.vector_db.store_documents(mock_documents)
-        
-        # Verify that add_documents was called
-        mock_qdrant_instance.add_documents.assert_called_once_with(mock_documents)
-    
-    @patch('langchain_qdrant.Qdrant')
-    def test_get_retriever(self, mock_qdrant):
-        # Mock Qdrant instance
-        mock_qdrant_instance = MagicMock()
-        mock_qdrant.return_value = mock_qdrant_instance
-        
-        # Test getting a retriever
-        self.vector_db.get_retriever()
-        
-        # Verify that as_retriever was called
-        mock_qdrant_instance.as_retriever.assert_called_once()
-        # Check if search_kwargs is set correctly
-        mock_qdrant_instance.as_retriever.assert_called_with(
-            search_type="similarity",
-            search_kwargs={"k": 5}
-        )
\ No newline at end of file
+        self.vector_db.store_documents(documents)
+
+        # Verify that they were embedded and upserted with their content
+        self.vector_db.embeddings.embed_documents.assert_called_once_with(["first", "second"])
+        points = self.vector_db.client.upsert.call_args.kwargs["points"]
+        self.assertEqual([point.payload["page_content"] for point in points], ["first", "second"])
+        self.assertEqual(points[1].vector, [0.3, 0.4])
+
+    def test_get_retriever(self):
+        # Mock the query embedding and the search response
+        self.vector_db.embeddings.embed_query.return_value = [0.1, 0.2]
+        hit = MagicMock(id="p1", score=0.9, payload={"page_content": "first", "metadata": {"page": 1}})
+        self.vector_db.client.query_points.return_value = MagicMock(points=[hit])
+
+        # Test getting a retriever and searching with it
+        documents = self.vector_db.get_retriever().invoke("first")
+
+        # Verify that the search went through the backend with k set correctly
+        self.assertEqual(self.vector_db.client.query_points.call_args.kwargs["limit"], 5)
+        self.assertEqual(documents[0].page_content, "first")
+        self.assertEqual(documents[0].metadata["page"], 1)
+
+    def test_delete_source(self):
+        # Page through the points stored for a file
+        self.vector_db.client.scroll.side_effect = [([MagicMock(id="p1"), MagicMock(id="p2")], "p3"), ([MagicMock(id="p3")], None)]
+
+        deleted = self.vector_db.delete_source("data/manual.pdf")
+
+        # Verify they were looked up by source and deleted
+        self.assertEqual(deleted, 3)
+        self.assertEqual(self.vector_db.client.scroll.call_args_list[1].kwargs["offset"], "p3")
+        condition = self.vector_db.client.scroll.call_args.kwargs["scroll_filter"].must[0]
+        self.assertEqual((condition.key, condition.match.value), ("metadata.source", "data/manual.pdf"))
+        self.assertEqual(self.vector_db.client.delete.call_args.kwargs["points_selector"].points, ["p1", "p2", "p3"])
+
+    @patch('src.api.resilience.time.sleep')
+    def test_transient_qdrant_errors_are_retried(self, mock_sleep):
+        # Fail the first search attempt with a connection error
+        self.vector_db.backend.breaker = CircuitBreaker("test")
+        self.vector_db.embeddings.embed_query.return_value = [0.1, 0.2]
+        self.vector_db.client.query_points.side_effect = [ConnectionError("connection refused"), MagicMock(points=[])]
+
+        documents = self.vector_db.similarity_search("first")
+
+        # Verify the search was retried after a backoff, with a server-side timeout
+        self.assertEqual(documents, [])
+        self.assertEqual(self.vector_db.client.query_points.call_count, 2)
+        mock_sleep.assert_called_once()
+        self.assertEqual(self.vector_db.client.query_points.call_args.kwargs["timeout"], 5)
+
+
+class TestHybridRetrieval(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.TemporaryDirectory()
+        self.client = MagicMock()
+        self.embeddings = MagicMock()
+        self.embeddings.embed_query.return_value = [0.1, 0.2]
+        self.vector_db = VectorDatabase(
+            client=self.client, embeddings=self.embeddings, lexical_index=LexicalIndex(self.index_dir.name)
+        )
+        self.vector_db.upsert_embeddings(
+            [
+                "Replace the XK-200 filter every six months.",
+                "The pump housing is made of cast iron.",
+                "Filters should be rinsed with warm water."
+            ],
+            [{"page": 1}, {"page": 2}, {"page": 3}],
+            [[0.0, 1.0]] * 3,
+            collection_name="manuals",
+            ids=["p1", "p2", "p3"]
+        )
+
+    def tearDown(self):
+        self.index_dir.cleanup()
+
+    def _dense_hits(self, *ids):
+        points = [MagicMock(id=point_id, payload={"page_content": point_id, "metadata": {}}) for point_id in ids]
+        self.client.query_points.return_value = MagicMock(points=points)
+
+    def test_confident_lexical_match_skips_embedding(self):
+        # Search for an exact part number
+        retriever = self.vector_db.get_retriever("manuals", k=2)
+        documents = retriever.invoke("XK-200 filter")
+
+        # Verify the lexical hit was returned without embedding the query
+        self.assertEqual(documents[0].metadata["_id"], "p1")
+        self.assertEqual(documents[0].metadata["page"], 1)
+        self.embeddings.embed_query.assert_not_called()
+        self.client.query_points.assert_not_called()
+
+    @patch('src.api.resilience.time.sleep')
+    def test_dense_failure_falls_back_to_lexical(self, mock_sleep):
+        # Take the vector store down
+        self.vector_db.backend.breaker = CircuitBreaker("test")
+        self.client.query_points.side_effect = ConnectionError("connection refused")
+
+        retriever = self.vector_db.get_retriever("manuals", k=3)
+        documents = retriever.invoke("how do I clean filters")
+
+        # Verify the lexical hits were served instead of an error
+        self.assertEqual([document.metadata["_id"] for document in documents], ["p3"])
+
+    def test_ambiguous_query_fuses_dense_and_lexical(self):
+        # Dense search ranks a chunk the lexical index does not match first
+        self._dense_hits("p2", "p3")
+
+        retriever = self.vector_db.get_retriever("manuals", k=3)
+        documents = retriever.invoke("how do I clean filters")
+
+        # Verify both result lists were fused, with the chunk found by both first
+        self.embeddings.embed_query.assert_called_once_with("how do I clean filters")
+        self.assertEqual([document.metadata["_id"] for document in documents], ["p3", "p2"])
+
+    def test_batch_search_embeds_once(self):
+        # Dense search returns the same hits for every query in the batch
+        response = MagicMock(points=[MagicMock(id="p2", payload={"page_content": "p2", "metadata": {}})])
+        self.client.query_batch_points.return_value = [response, response]
+        self.embeddings.embed_documents.side_effect = lambda texts: [[0.1, 0.2] for _ in texts]
+
+        # Search a decisive lexical query and two ambiguous ones together
+        results = self.vector_db.similarity_search_batch(
+            ["XK-200 filter", "how do I clean filters", "tell me about maintenance"],
+            k=2,
+            collection_name="manuals"
+        )
+
+        # Verify only the ambiguous queries were embedded, in one request and one search
+        self.embeddings.embed_documents.assert_called_once_with(["how do I clean filters", "tell me about maintenance"])
+        self.client.query_batch_points.assert_called_once()
+        self.assertEqual([document.metadata["_id"] for document in results[0]], ["p1"])
+        self.assertEqual([document.metadata["_id"] for document in results[1]], ["p2", "p3"])
+        self.assertEqual([document.metadata["_id"] for document in results[2]], ["p2"])
+
+    def test_index_is_persisted_and_follows_deletes(self):
+        # Delete a chunk and persist the index
+        self.vector_db.delete_points(["p1"], collection_name="manuals")
+        self.vector_db.notify_ingest("manuals")
+
+        # Reload the index from disk
+        reloaded = LexicalIndex(self.index_dir.name).collection("manuals")
+
+        # Verify the deleted chunk is gone and the rest survived
+        self.assertEqual(len(reloaded), 2)
+        self.assertEqual(reloaded.search("XK-200", 5), [])
+        self.assertEqual(reloaded.search("pump", 5)[0]["id"], "p2")
+
+
+class TestLocalVectorBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.TemporaryDirectory()
+        self.vectors = np.random.default_rng(7).normal(size=(3000, 16)).astype(np.float32)
+        self.ids = [f"p{i}" for i in range(len(self.vectors))]
+        self.payloads = [{"page_content": point_id, "metadata": {"row": i}} for i, point_id in enumerate(self.ids)]
+
+    def tearDown(self):
+        self.index_dir.cleanup()
+
+    def _expected(self, query, k):
+        unit = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        return [self.ids[row] for row in np.argsort(-(unit @ (query / np.linalg.norm(query))))[:k]]
+
+    def test_search_matches_brute_force(self):
+        # Insert in several batches so the matrix grows and spans many blocks
+        index = FlatIndex(self.index_dir.name, block_rows=500)
+        for start in range(0, len(self.vectors), 1000):
+            stop = start + 1000
+            index.upsert(self.ids[start:stop], self.vectors[start:stop], self.payloads[start:stop])
+
+        # Verify single and batched searches return the exact top-k
+        queries = self.vectors[:4] + 0.1
+        for query, hits in zip(queries, index.search_batch(queries, 5)):
+            self.assertEqual([hit.id for hit in hits], self._expected(query, 5))
+        self.assertEqual(index.search(queries[0], 1)[0].payload["metadata"]["row"], 0)
+
+    def test_int8_quantization_keeps_ranking(self):
+        # Store quantized vectors
+        index = FlatIndex(self.index_dir.name, quantization="int8")
+        index.upsert(self.ids, self.vectors, self.payloads)
+
+        # Verify the nearest neighbour of each stored vector is itself
+        for row in (0, 1234, 2999):
+            self.assertEqual(index.search(self.vectors[row], 1)[0].id, self.ids[row])
+
+    def test_persistence_and_deletes(self):
+        # Store vectors, delete some and flush
+        backend = LocalVectorBackend(self.index_dir.name)
+        backend.upsert("manuals", self.ids, self.vectors, self.payloads)
+        backend.delete("manuals", ["p0", "p10"])
+        backend.flush()
+
+        # Reopen the backend from disk
+        reopened = LocalVectorBackend(self.index_dir.name)
+
+        # Verify deleted points are gone and moved rows are still found
+        self.assertTrue(reopened.collection_exists("manuals"))
+        self.assertFalse(reopened.collection_exists("other"))
+        self.assertEqual(len(reopened.index("manuals")), 2998)
+        self.assertNotEqual(reopened.search("manuals", self.vectors[0], 1)[0].id, "p0")
+        self.assertEqual(reopened.search("manuals", self.vectors[2999], 1)[0].id, "p2999")
+
+    def test_vector_database_on_local_backend(self):
+        # Store documents through VectorDatabase without any server
+        embeddings = MagicMock()
+        embeddings.embed_documents.side_effect = lambda texts: [[float(len(text)), 1.0, 0.0] for text in texts]
+        embeddings.embed_query.side_effect = lambda text: [float(len(text)), 1.0, 0.0]
+        vector_db = VectorDatabase(embeddings=embeddings, backend=LocalVectorBackend(self.index_dir.name))
+        vector_db.store_documents(
+            [Document(page_content="short", metadata={"page": 1}), Document(page_content="a much longer chunk", metadata={"page": 2})],
+            collection_name="manuals"
+        )
+
+        # Verify retrieval runs against the real index
+        documents = vector_db.get_retriever("manuals", k=1).invoke("tiny")
+        self.assertEqual(documents[0].page_content, "short")
+        self.assertEqual(documents[0].metadata["page"], 1)
+
+
+    def test_delete_source(self):
+        # Store chunks of two files
+        embeddings = MagicMock()
+        embeddings.embed_documents.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+        vector_db = VectorDatabase(embeddings=embeddings, backend=LocalVectorBackend(self.index_dir.name))
+        vector_db.store_documents(
+            [
+                Document(page_content="first", metadata={"source": "data/manual.pdf"}),
+                Document(page_content="second", metadata={"source": "data/manual.pdf"}),
+                Document(page_content="other", metadata={"source": "data/notes.pdf"})
+            ],
+            collection_name="manuals"
+        )
+
+        # Verify only the points of the given file are deleted
+        self.assertEqual(vector_db.delete_source("data/manual.pdf", collection_name="manuals"), 2)
+        hits = vector_db.backend.search("manuals", [1.0, 0.0], 10)
+        self.assertEqual([hit.payload["page_content"] for hit in hits], ["other"])
+
+class TestIVFIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(3)
+        centres = rng.normal(size=(50, 16)).astype(np.float32)
+        self.vectors = centres[rng.integers(0, 50, size=5000)] + 0.3 * rng.normal(size=(5000, 16)).astype(np.float32)
+        self.ids = [f"p{i}" for i in range(len(self.vectors))]
+
+    def tearDown(self):
+        self.index_dir.cleanup()
+
+    def _build(self, **kwargs):
+        index = IVFIndex(self.index_dir.name, min_train_size=1000, nlist=40, nprobe=8, **kwargs)
+        for start in range(0, len(self.vectors), 1000):
+            stop = start + 1000
+            index.upsert(self.ids[start:stop], self.vectors[start:stop], [{}] * (stop - start))
+        return index
+
+    def test_recall_against_brute_force(self):
+        # Build the approximate index and an exact one over the same vectors
+        index = self._build()
+        exact = FlatIndex(tempfile.mkdtemp(dir=self.index_dir.name))
+        exact.upsert(self.ids, self.vectors, [{}] * len(self.ids))
+
+        # Verify the ANN results mostly agree with exact search
+        queries = self.vectors[:50] + 0.05
+        found = index.search_batch(queries, 10)
+        expected = exact.search_batch(queries, 10)
+        recall = np.mean([
+            len({hit.id for hit in hits} & {hit.id for hit in truth}) / 10
+            for hits, truth in zip(found, expected)
+        ])
+        self.assertTrue(index.trained)
+        self.assertGreater(recall, 0.9)
+
+    def test_tombstones_compaction_and_persistence(self):
+        index = self._build(compact_ratio=0.5)
+
+        # Delete a few points, leaving tombstones
+        index.delete(self.ids[:100])
+        self.assertEqual(len(index), 4900)
+        self.assertNotIn("p0", [hit.id for hit in index.search(self.vectors[0], 5)])
+
+        # Delete enough to trigger compaction
+        index.delete(self.ids[100:3000])
+        self.assertEqual(len(index._ids), 2000)
+        self.assertEqual(index.search(self.vectors[4000], 1)[0].id, "p4000")
+
+        # Reload from disk and verify the lists were reused, not retrained
+        index.flush()
+        reloaded = IVFIndex(self.index_dir.name, min_train_size=1000, nlist=40, nprobe=8)
+        np.testing.assert_array_equal(reloaded._centroids, index._centroids)
+        self.assertEqual(len(reloaded), 2000)
+        self.assertEqual(reloaded.search(self.vectors[4000], 1)[0].id, "p4000")
+
+
+class TestCachedEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.underlying = MagicMock()
+        self.underlying.embed_documents.side_effect = lambda texts: [[float(len(text)), 1.0] for text in texts]
+        self.underlying.embed_query.side_effect = lambda text: [float(len(text)), 2.0]
+        self.embeddings = self._create_embeddings()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def _create_embeddings(self, max_entries=8):
+        store = EmbeddingStore(self.cache_dir.name, max_entries=max_entries)
+        return CachedEmbeddings(self.underlying, "test-model", store=store)
+
+    def test_only_unseen_texts_are_embedded(self):
+        # Embed a batch, then a batch with one new text
+        self.embeddings.embed_documents(["alpha", "beta"])
+        vectors = self.embeddings.embed_documents(["alpha", "gamma  ray", "beta"])
+
+        # Verify only the new text reached the model
+        self.assertEqual(vectors[0], [5.0, 1.0])
+        self.underlying.embed_documents.assert_called_with(["gamma  ray"])
+        self.assertEqual(self.embeddings.store.stats()["hits"], 2)
+
+    def test_cache_persists_across_instances(self):
+        # Embed a query and flush the store
+        self.embeddings.embed_query("What is covered?")
+        self.embeddings.close()
+
+        # Reopen the store from disk and embed the same query
+        embeddings = self._create_embeddings()
+        vector = embeddings.embed_query("What  is covered?")
+
+        # Verify the vector came from disk
+        self.assertEqual(vector, [16.0, 2.0])
+        self.underlying.embed_query.assert_called_once()
+
+    def test_shared_directory_never_returns_foreign_vectors(self):
+        # Two stores over one directory, as in two processes
+        first = self._create_embeddings()
+        first.embed_query("alpha")
+        second = self._create_embeddings()
+        second.embed_query("beta")
+        first.embed_query("gammas")
+
+        # Verify each store returns each text's own vector, or embeds it again
+        for embeddings in (first, second):
+            for text in ("alpha", "beta", "gammas"):
+                self.assertEqual(embeddings.embed_query(text), [float(len(text)), 2.0])
+
+        # Overwrite a slot behind the first store's back and verify it is a miss
+        slot = first.store._slots[first.key("alpha")]
+        second.store.put(second.key("delta"), [9.0, 9.0])
+        second.store._index["key"][slot] = second.key("delta")
+        self.assertIsNone(first.store.get(first.key("alpha")))
+
+    def test_lru_eviction(self):
+        # Fill a tiny store past capacity
+        embeddings = self._create_embeddings(max_entries=2)
+        embeddings.embed_documents(["a"])
+        embeddings.embed_documents(["bb"])
+        embeddings.embed_query("a")
+        embeddings.embed_documents(["ccc"])
+
+        # Verify the least recently used text was evicted
+        self.assertEqual(embeddings.store.stats()["evictions"], 1)
+        embeddings.embed_documents(["a", "ccc", "bb"])
+        self.underlying.embed_documents.assert_called_with(["bb"])
+
@@ -0,0 +1,69 @@
+import unittest
+
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+from src.embedding.semantic_cache import SemanticCache
+from src.embedding.vectordb import VectorDatabase
+
+
+class FakeEmbeddings:
+
+    VECTORS = {
+        "What is the warranty period?": [1.0, 0.0, 0.0],
+        "What's the warranty period?": [0.99, 0.05, 0.0],
+        "How do I reset the device?": [0.0, 1.0, 0.0]
+    }
+
+    def embed_query(self, text):
+        return self.VECTORS[text]
+
+
+class TestSemanticCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SemanticCache(FakeEmbeddings(), threshold=0.95, max_entries=2)
+        self.sources = [Document(page_content="Two years.")]
+
+    def _answer(self, question, answer):
+        hit, vector = self.cache.lookup(question)
+        self.assertIsNone(hit)
+        self.cache.store(question, vector, answer, self.sources)
+
+    def test_near_duplicate_question_hits(self):
+        # Answer a question once
+        self._answer("What is the warranty period?", "Two years.")
+
+        # Ask a near-duplicate and an unrelated question
+        hit, _ = self.cache.lookup("What's the warranty period?")
+        miss, _ = self.cache.lookup("How do I reset the device?")
+
+        # Verify only the near-duplicate is served from cache
+        self.assertEqual(hit["answer"], "Two years.")
+        self.assertEqual(hit["sources"], self.sources)
+        self.assertIsNone(miss)
+
+    def test_lru_eviction(self):
+        # Fill the cache beyond capacity
+        self._answer("What is the warranty period?", "Two years.")
+        self._answer("How do I reset the device?", "Hold the button.")
+        self.cache.lookup("How do I reset the device?")
+        self.cache.store("What's the warranty period?", [0.0, 0.0, 1.0], "Other.", [])
+
+        # Verify the least recently used entry was replaced
+        hit, _ = self.cache.lookup("What is the warranty period?")
+        self.assertIsNone(hit)
+        self.assertEqual(self.cache.stats()["size"], 2)
+
+    def test_invalidated_when_documents_stored(self):
+        # Wire the cache to a vector database with a mocked client
+        vector_db = VectorDatabase(client=MagicMock(), embeddings=MagicMock())
+        vector_db.add_ingest_listener(self.cache.invalidate)
+        self._answer("What is the warranty period?", "Two years.")
+
+        # Simulate ingesting new chunks
+        vector_db.notify_ingest("document_embeddings")
+
+        # Verify the cached answer is gone
+        hit, _ = self.cache.lookup("What is the warranty period?")
+        self.assertIsNone(hit)
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from aiohttp import FormData
+from aiohttp.test_utils import TestClient, TestServer
+from unittest.mock import ANY, MagicMock, patch
+from langchain_core.messages import HumanMessage
+
+from server import AdmissionControl, create_app, main
+from src.agent.resources import ResourceRegistry
+
+
+def final_state(messages):
+    return {"messages": messages, "response": "It is sunny in Paris.", "query_type": "weather", "cities": ["Paris"], "documents": []}
+
+
+class TestAgentServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.resources = ResourceRegistry()
+        self.calls = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+        async def async_agent_executor(messages, thread_id=None):
+            self.calls.append((messages, thread_id))
+            await self.release.wait()
+            return final_state(messages)
+
+        async def async_streaming_agent_executor(messages, thread_id=None):
+            yield {"type": "node", "node": "classify_query"}
+            yield {"type": "token", "content": "It is sunny "}
+            yield {"type": "token", "content": "in Paris."}
+            yield {"type": "final", "state": final_state(messages)}
+
+        self.resources.set("async_agent_executor", async_agent_executor)
+        self.resources.set("async_streaming_agent_executor", async_streaming_agent_executor)
+
+        self.upload_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.upload_dir.cleanup)
+        patcher = patch("server.UPLOAD_DIRECTORY", self.upload_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ingestion_jobs = MagicMock()
+        self.ingestion_jobs.list_jobs.return_value = []
+        self.ingestion_jobs.submit.return_value = "job-1"
+        self.file_manifest = MagicMock()
+        self.file_manifest.find_by_hash.return_value = None
+        self.resources.set("ingestion_jobs", self.ingestion_jobs)
+        self.resources.set("file_manifest", self.file_manifest)
+
+        self.admission = AdmissionControl(max_concurrency=1, queue_size=0, queue_timeout=1)
+        self.client = TestClient(TestServer(create_app(self.resources, self.admission, warm_up=False)))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def test_chat(self):
+        # Send a message with earlier history
+        response = await self.client.post("/chat", json={
+            "message": "Is it sunny in Paris?",
+            "history": [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"}]
+        })
+
+        # Verify the answer and the conversation passed to the executor
+        self.assertEqual(response.status, 200)
+        body = await response.json()
+        self.assertEqual(body, {"response": "It is sunny in Paris.", "query_type": "weather", "cities": ["Paris"], "thread_id": None})
+        messages, _ = self.calls[0]
+        self.assertEqual([message.content for message in messages], ["Hi", "Hello!", "Is it sunny in Paris?"])
+        self.assertIsInstance(messages[-1], HumanMessage)
+
+    async def test_chat_rejects_invalid_body(self):
+        response = await self.client.post("/chat", json={"history": []})
+        self.assertEqual(response.status, 400)
+        self.assertIn("error", await response.json())
+
+    async def test_chat_stream(self):
+        # Stream an answer
+        response = await self.client.post("/chat/stream", json={"message": "Is it sunny in Paris?"})
+
+        # Verify the events arrive as JSON lines, ending with the answer
+        self.assertEqual(response.headers["Content-Type"], "application/x-ndjson")
+        events = [json.loads(line) for line in (await response.text()).splitlines()]
+        self.assertEqual([event["type"] for event in events], ["node", "token", "token", "final"])
+        self.assertEqual("".join(event["content"] for event in events if event["type"] == "token"), events[-1]["response"])
+
+    async def test_requests_beyond_capacity_are_rejected(self):
+        # Hold the only slot with a request that does not finish yet
+        self.release.clear()
+        first = asyncio.create_task(self.client.post("/chat", json={"message": "Is it sunny in Paris?"}))
+        while not self.calls:
+            await asyncio.sleep(0.01)
+
+        # Verify a second request is turned away, and the first still completes
+        response = await self.client.post("/chat", json={"message": "Is it raining in London?"})
+        self.assertEqual(response.status, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+        self.release.set()
+        self.assertEqual((await first).status, 200)
+
+    async def test_draining_server_refuses_new_requests(self):
+        # Start draining, as on shutdown
+        self.admission.draining = True
+
+        # Verify health and new requests report it
+        self.assertEqual((await self.client.get("/health")).status, 503)
+        self.assertEqual((await self.client.post("/chat", json={"message": "Is it sunny in Paris?"})).status, 503)
+
+    async def test_ingest_large_pdf(self):
+        # Upload a PDF larger than aiohttp's default 1 MiB body limit
+        content = b"%PDF-1.4\n" + os.urandom(3 * 1024 ** 2)
+        form = FormData()
+        form.add_field("file", content, filename="report.pdf", content_type="application/pdf")
+        response = await self.client.post("/ingest", data=form)
+
+        # Verify it was saved whole and queued
+        self.assertEqual(response.status, 202)
+        self.assertEqual(await response.json(), {"status": "queued", "job_id": "job-1"})
+        file_path, filename, collection_name = self.ingestion_jobs.submit.call_args.args
+        self.assertEqual(filename, "report.pdf")
+        self.file_manifest.find_by_hash.assert_called_once_with(ANY, collection_name)
+        with open(file_path, "rb") as f:
+            self.assertEqual(f.read(), content)
+
+    async def test_ingest_rejects_oversized_upload(self):
+        # Upload more than the configured limit
+        form = FormData()
+        form.add_field("file", b"x" * 2048, filename="report.pdf", content_type="application/pdf")
+        with patch("server.MAX_UPLOAD_BYTES", 1024):
+            response = await self.client.post("/ingest", data=form)
+
+        # Verify it was refused and nothing was left behind
+        self.assertEqual(response.status, 413)
+        self.ingestion_jobs.submit.assert_not_called()
+        self.assertEqual(os.listdir(self.upload_dir.name), [])
+
+
+class TestServerWorkers(unittest.TestCase):
+
+    @patch("server.init")
+    @patch("server.SERVER_WORKERS", 4)
+    def test_workers_refused_with_process_local_indexes(self, init):
+        # Ask for several workers with the in-process vector backend
+        with patch("server.VECTOR_BACKEND", "local"), patch("server.serve") as serve:
+            with self.assertRaises(SystemExit) as raised:
+                main()
+
+        # Verify nothing was started and the reason is given
+        serve.assert_not_called()
+        self.assertIn("VECTOR_BACKEND=local", str(raised.exception))
@@ -0,0 +1,70 @@
+import io
+import json
+import unittest
+
+from unittest.mock import patch, MagicMock
+from config import _json_log_format, _sample_debug, logger
+from src.api.resilience import CircuitBreaker, guarded
+from src.api.telemetry import Metrics, increment, set_exporter, span, trace_request
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_metrics_quantiles_and_prometheus_text(self):
+        # Observe 100 latencies and count a few cache hits
+        metrics = Metrics()
+        for value in range(1, 101):
+            metrics.observe("node.get_weather.seconds", value / 100)
+        metrics.increment("weather_cache.hit", 3)
+
+        # Verify the nearest-rank quantiles and the exposition format
+        summary = metrics.snapshot()["histograms"]["node.get_weather.seconds"]
+        self.assertEqual((summary["count"], summary["p50"], summary["p95"], summary["p99"]), (100, 0.5, 0.95, 0.99))
+        text = metrics.prometheus_text()
+        self.assertIn('weatheragent_node_get_weather_seconds{quantile="0.95"} 0.95', text)
+        self.assertIn("weatheragent_node_get_weather_seconds_count 100", text)
+        self.assertIn("weatheragent_weather_cache_hit_total 3", text)
+
+    def test_trace_records_nested_spans_and_counters(self):
+        # Capture exported traces
+        exporter = MagicMock()
+        previous = set_exporter(exporter)
+        self.addCleanup(set_exporter, previous)
+
+        # Serve a request with a node calling an upstream, one call failing
+        with trace_request("agent", request_id="abc"):
+            with span("node.get_weather", cities=2):
+                with guarded(CircuitBreaker("weather-test")):
+                    increment("weather_cache.miss")
+                with self.assertRaises(ValueError):
+                    with guarded(CircuitBreaker("weather-test")):
+                        raise ValueError("bad city")
+
+        # Verify the exported trace
+        trace = exporter.export.call_args.args[0].to_dict()
+        self.assertEqual(trace["request_id"], "abc")
+        self.assertEqual(
+            [(record["name"], record["parent"], record["status"]) for record in trace["spans"]],
+            [("node.get_weather", None, "ok"), ("upstream.weather-test", "node.get_weather", "ok"),
+             ("upstream.weather-test", "node.get_weather", "ValueError")]
+        )
+        self.assertEqual(trace["spans"][0]["cities"], 2)
+        self.assertEqual(trace["counters"], {"weather_cache.miss": 1})
+        self.assertGreaterEqual(trace["duration"], trace["spans"][0]["duration"])
+
+    def test_json_logs_carry_request_id_and_sample_debug(self):
+        # Log as JSON lines, keeping no debug records
+        stream = io.StringIO()
+        handler_id = logger.add(stream, format=_json_log_format, filter=_sample_debug, level="DEBUG")
+        self.addCleanup(logger.remove, handler_id)
+
+        with patch("config.LOG_DEBUG_SAMPLE_RATE", 0.0):
+            with trace_request("agent", request_id="abc"):
+                logger.debug("Weather cache hit for {}", "paris")
+                logger.info("Answered {} cities", 2)
+
+        # Verify only the info record was written, with its request ID
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([record["message"] for record in records], ["Answered 2 cities"])
+        self.assertEqual(records[0]["request_id"], "abc")
+        self.assertEqual(records[0]["level"], "INFO")